@@ -1,7 +1,9 @@
 import argparse
 
+from src.Utils.logger import LOG_LEVELS
 
-def getParams():
+
+def getParser():
     # Creating the parser
     argsParser = argparse.ArgumentParser(
         description='Reinforcement Learning by using a MDP/REINFORCE to solve CVRP')
@@ -18,6 +20,37 @@ def getParams():
                             help="Define number of episodes for the training process")
     argsParser.add_argument('--max_steps', default=10000, type=int,
                             help="Define the number of maximal steps that can be taking for the training process")
+    argsParser.add_argument('--episodes_per_update', default=1, type=int,
+                            help="Define the number of episodes that are rolled out on the same policy and learned "
+                                 "in one policy update. Values > 1 enable the batched training.")
+    argsParser.add_argument('--rollout_workers', default=1, type=int,
+                            help="Define the number of worker processes rolling out the episodes of a batched "
+                                 "policy update. Values > 1 enable the batched training.")
+    argsParser.add_argument('--vectorized_rollouts', default=False, action='store_true',
+                            help="Roll out the episodes of a batched policy update in lockstep in one vectorized "
+                                 "environment instead of the rollout workers. Enables the batched training.")
+    argsParser.add_argument('--decoding_samples', default=0, type=int,
+                            help="Define the number of episodes sampled from the final policy in lockstep, the "
+                                 "shortest one replaces the constructed solution if it is shorter. 0 disables it.")
+
+    argsParser.add_argument('--job_file', default=None,
+                            help="Define a job file (.json, .csv or .yaml) to run all of its jobs non-interactively "
+                                 "instead of asking for the configuration. Every job specifies data_input, "
+                                 "microhub_name, shipper_name, carrier_name, delivery_date, amount_vehicles, "
+                                 "vehicle_speed, capacity_weight and capacity_volume.")
+    argsParser.add_argument('--job_results', default=None,
+                            help="Define the file the result records of the jobs are written to (JSON lines), "
+                                 "data/statistics/batch_results_<job file>_<timestamp>.jsonl by default.")
+    argsParser.add_argument('--job_workers', default=1, type=int,
+                            help="Define the number of jobs of the job file that run at the same time, every job in "
+                                 "a worker process of its own.")
+    argsParser.add_argument('--job_timeout', default=None, type=float,
+                            help="Define the time in s after which a job of the job file is terminated and recorded "
+                                 "as timeout. Runs every job in a worker process of its own.")
+
+    argsParser.add_argument('--log_level', default='INFO', choices=LOG_LEVELS,
+                            help="Define the log level. DEBUG traces every step, candidate and ant, INFO only "
+                                 "summarizes every episode and ACO iteration.")
 
     # --------------------
     # TESTING
@@ -54,6 +87,28 @@ def getParams():
     argsParser.add_argument('--baseline_theta', default=0.00001, type=float,
                             help="Define small number to converged to in baseline calculation.")
 
+    argsParser.add_argument('--value_func_solver', default='sweep', choices=['sweep', 'solve'],
+                            help="Define how the baseline is evaluated. 'sweep' repeats vectorized sweeps until "
+                                 "converged, 'solve' solves the linear system directly (recommended for small "
+                                 "instances only).")
+
+    argsParser.add_argument('--prune_stale_days', default=None, type=int,
+                            help="Define after how many days without being part of the stop data a stop is removed "
+                                 "from the loaded model. By default stops are never removed.")
+
+    argsParser.add_argument('--candidate_list_size', default=None, type=int,
+                            help="Define how many nearest stops the ants and the agent consider as next stop, all "
+                                 "remaining stops are only considered if none of them fits into the tour. By "
+                                 "default all remaining stops are considered.")
+
+    argsParser.add_argument('--policy_top_k', default=None, type=int,
+                            help="Store the policy weights only for the k nearest stops of every stop (sparse "
+                                 "policy), recommended for large hubs. By default the full weight matrix is stored.")
+
+    argsParser.add_argument('--legacy_discounting', default=False, action='store_true',
+                            help="Discount every reward of the return only once by the discount factor, as older "
+                                 "models were trained. Keeps the training of those models comparable.")
+
     argsParser.add_argument('--distance_utilization_threshold', default=0.5, type=float,
                             help="Define the threshold to choose the best action based on distance. Lowering the "
                                  "value leads too a higher chance choosing the action with the highest capacity "
@@ -84,8 +139,15 @@ def getParams():
     argsParser.add_argument('--aco_increasing_factor', default=0.9, type=float,
                             help="Define the increasing factor for aco. This will be applied in the process of the "
                                  "aco boost.")
+    argsParser.add_argument('--aco_workers', default=1, type=int,
+                            help="Define the number of worker processes that construct the ant tours of an "
+                                 "iteration in parallel. 1 moves the ants one after another.")
+
+    return argsParser
 
-    args = argsParser.parse_args()
+
+def getParams():
+    args = getParser().parse_args()
     args = vars(args)
 
     # Output current args
@@ -0,0 +1,58 @@
+import argparse
+import json
+import sys
+
+
+def compare_results(baseline, candidate, statistic='min', tolerance=0.1):
+    """
+    Compares the phases that both result files measured on the same instance sizes.
+    :param baseline: results of runBenchmark (e.g. of the previous commit)
+    :param candidate: results of runBenchmark to be checked
+    :param statistic: compared statistic of the measurements ('min', 'median' or 'mean')
+    :param tolerance: allowed relative slowdown before a phase counts as regression
+    :return: rows of (stop count, phase, baseline time, candidate time, ratio, regression)
+    """
+    rows = []
+    for stop_count, candidate_instance in candidate['instances'].items():
+        baseline_instance = baseline['instances'].get(stop_count)
+        if baseline_instance is None:
+            continue
+        for phase, candidate_summary in candidate_instance['phases'].items():
+            baseline_summary = baseline_instance['phases'].get(phase)
+            if baseline_summary is None:
+                continue
+            baseline_time = baseline_summary[statistic]
+            candidate_time = candidate_summary[statistic]
+            ratio = candidate_time / baseline_time if baseline_time > 0 else float('inf')
+            rows.append((int(stop_count), phase, baseline_time, candidate_time, ratio, ratio > 1 + tolerance))
+    return sorted(rows)
+
+
+def main():
+    argsParser = argparse.ArgumentParser(description='Compares two benchmark result files')
+    argsParser.add_argument('baseline', help="Define the result file of the baseline")
+    argsParser.add_argument('candidate', help="Define the result file to be checked")
+    argsParser.add_argument('--statistic', default='min', choices=['min', 'median', 'mean'],
+                            help="Define the compared statistic of the measurements")
+    argsParser.add_argument('--tolerance', default=0.1, type=float,
+                            help="Define the allowed relative slowdown, e.g. 0.1 = 10%%")
+    args = argsParser.parse_args()
+
+    with open(args.baseline, 'r') as file:
+        baseline = json.load(file)
+    with open(args.candidate, 'r') as file:
+        candidate = json.load(file)
+
+    print('baseline {} vs. candidate {} ({})'.format(baseline['meta']['commit'], candidate['meta']['commit'],
+                                                     args.statistic))
+    rows = compare_results(baseline, candidate, args.statistic, args.tolerance)
+    for stop_count, phase, baseline_time, candidate_time, ratio, regression in rows:
+        print('{:>5} stops  {:<17} {:10.4f}s -> {:10.4f}s  x{:6.2f}{}'.format(
+            stop_count, phase, baseline_time, candidate_time, ratio, '  REGRESSION' if regression else ''))
+
+    # exit code 1 lets scripts fail on regressions
+    sys.exit(1 if any(row[5] for row in rows) else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,115 @@
+import argparse
+import csv
+import hashlib
+import os
+
+import numpy as np
+
+# --------------------
+# INSTANCE DEFAULTS
+# microhub of the example data, the stops of the example data lie within ~2.5km around it
+MICROHUB_LONGITUDE = 13.3069357
+MICROHUB_LATITUDE = 52.5013048
+BASE_STOP_COUNT = 65
+BASE_RADIUS_KM = 2.5
+KM_PER_DEGREE_LATITUDE = 111.32
+
+# one box takes 34.2 volume units, the weight per box is lognormal distributed (median ~4.5kg)
+BOX_VOLUME = 34.2
+MAX_BOX_AMOUNT = 5
+WEIGHT_PER_BOX_MEDIAN = 4.5
+WEIGHT_PER_BOX_SIGMA = 0.7
+MAX_DEMAND_WEIGHT = 120.0
+
+BENCHMARK_SIZES = [20, 50, 100, 200, 500, 1000]
+STOP_FILE_HEADER = ['stopIdentifier', 'stopNr', 'Longitude', 'Latitude', 'DemandWeight', 'DemandVolume',
+                    'BoxAmount', 'TourStopId']
+
+
+def get_instance_name(stop_count, seed):
+    """
+    :param stop_count: amount of stops without the microhub
+    :param seed: seed of the generator
+    :return: name of the stop file (without .csv), usable as data source of main.py
+    """
+    return 'benchmark_{}_s{}'.format(stop_count, seed)
+
+
+def generate_stops(stop_count, seed):
+    """
+    Generates a synthetic CVRP instance in the schema of data/stops. The stops are spread uniformly on a disc around
+    the microhub, whose radius grows with the square root of the stop count so the density of the example data is
+    kept. Box amounts, volumes and weights follow the distributions of the example data.
+    :param stop_count: amount of stops without the microhub
+    :param seed: seed of the generator, same seed and stop count produce the same instance
+    :return: rows of the stop file, the microhub first
+    """
+    rng = np.random.RandomState(seed)
+
+    # --------------------
+    # COORDINATES
+    radius_km = BASE_RADIUS_KM * np.sqrt(stop_count / BASE_STOP_COUNT)
+    distances_km = radius_km * np.sqrt(rng.uniform(0.0, 1.0, stop_count))
+    angles = rng.uniform(0.0, 2 * np.pi, stop_count)
+    latitudes = MICROHUB_LATITUDE + distances_km * np.sin(angles) / KM_PER_DEGREE_LATITUDE
+    longitudes = MICROHUB_LONGITUDE + distances_km * np.cos(angles) / (
+            KM_PER_DEGREE_LATITUDE * np.cos(np.radians(MICROHUB_LATITUDE)))
+
+    # --------------------
+    # DEMANDS
+    box_amounts = np.minimum(1 + rng.poisson(0.9, stop_count), MAX_BOX_AMOUNT)
+    demand_volumes = np.round(box_amounts * BOX_VOLUME, 1)
+    demand_weights = np.zeros(stop_count)
+    for stop_nr, box_amount in enumerate(box_amounts):
+        demand_weights[stop_nr] = rng.lognormal(np.log(WEIGHT_PER_BOX_MEDIAN), WEIGHT_PER_BOX_SIGMA, box_amount).sum()
+    demand_weights = np.round(np.minimum(demand_weights, MAX_DEMAND_WEIGHT), 5)
+
+    # --------------------
+    # ROWS
+    microhub_hash = hashlib.md5('microhub/{}/{}'.format(stop_count, seed).encode()).hexdigest()
+    rows = [[microhub_hash, 0, MICROHUB_LONGITUDE, MICROHUB_LATITUDE, 0, 0, 0, 0]]
+    for stop_nr in range(stop_count):
+        rows.append([hashlib.md5('{}/{}/{}'.format(stop_nr, stop_count, seed).encode()).hexdigest(),
+                     stop_nr + 1,
+                     round(float(longitudes[stop_nr]), 7),
+                     round(float(latitudes[stop_nr]), 7),
+                     float(demand_weights[stop_nr]),
+                     float(demand_volumes[stop_nr]),
+                     int(box_amounts[stop_nr]),
+                     40000 + stop_nr + 1])
+    return rows
+
+
+def write_stop_file(stop_count, seed, directory='data/stops'):
+    """
+    Generates an instance and writes it as stop file. An existing file is kept, since the instance only depends on
+    stop count and seed.
+    :param stop_count: amount of stops without the microhub
+    :param seed: seed of the generator
+    :param directory: directory of the stop files
+    :return: name of the stop file (without .csv)
+    """
+    instance_name = get_instance_name(stop_count, seed)
+    file_path = os.path.join(directory, instance_name + '.csv')
+    if not os.path.exists(file_path):
+        with open(file_path, 'w', newline='') as file:
+            csv_writer = csv.writer(file)
+            csv_writer.writerow(STOP_FILE_HEADER)
+            csv_writer.writerows(generate_stops(stop_count, seed))
+    return instance_name
+
+
+def main():
+    argsParser = argparse.ArgumentParser(description='Generates synthetic CVRP instances in the schema of data/stops')
+    argsParser.add_argument('--sizes', default=BENCHMARK_SIZES, type=int, nargs='+',
+                            help="Define the stop counts (without the microhub) of the instances")
+    argsParser.add_argument('--seed', default=0, type=int, help="Define the seed of the generator")
+    argsParser.add_argument('--directory', default='data/stops', help="Define the directory of the stop files")
+    args = argsParser.parse_args()
+
+    for stop_count in args.sizes:
+        print(write_stop_file(stop_count, args.seed, args.directory))
+
+
+if __name__ == "__main__":
+    main()
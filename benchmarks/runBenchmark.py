@@ -0,0 +1,350 @@
+import argparse
+import json
+import os
+import platform
+import random
+import subprocess
+from datetime import datetime
+from timeit import default_timer as timer
+
+import numpy as np
+import pandas as pd
+
+import src.Tour.TourManager as tManager
+from argsConfig import getParser
+from benchmarks.instanceGenerator import BENCHMARK_SIZES, write_stop_file
+from main import load_stop_data
+from src.Aco.AntManager import AntManager
+from src.Mdp.VRPEnvironment import VRPEnvironment
+from src.Mdp.VRPVecEnvironment import VRPVecEnvironment
+from src.RL.Policy.PolicyManager import PolicyManager
+from src.RL.VRPAgent import VRPAgent
+from src.Utils.logger import LOG_LEVELS, setup_logging
+
+PHASES = ['distance_matrix', 'aco', 'env_step', 'vec_env_step', 'policy_update', 'construct_policy']
+
+
+# --------------------
+# TIMING
+def summarize_durations(durations, count=None):
+    """
+    :param durations: measured durations in s
+    :param count: amount of work units (e.g. steps, iterations) of one measurement
+    :return: summary of the measurements
+    """
+    summary = {
+        'durations': durations,
+        'min': min(durations),
+        'median': float(np.median(durations)),
+        'mean': float(np.mean(durations)),
+    }
+    if count:
+        summary['count'] = count
+        summary['per_unit'] = summary['min'] / count
+    return summary
+
+
+def seed_all(seed):
+    random.seed(seed)
+    np.random.seed(seed)
+
+
+# --------------------
+# SETUP
+def setup_instance(stop_count, seed):
+    """
+    Generates the instance if needed and loads it into the tour manager.
+    :return: instance name
+    """
+    instance_name = write_stop_file(stop_count, seed)
+    tManager.clear()
+    load_stop_data(instance_name)
+    return instance_name
+
+
+def get_candidate_lists(params):
+    """
+    :return: nearest stops of every stop of the loaded instance, None without candidate list size
+    """
+    if not params['candidate_list_size']:
+        return None
+    return tManager.get_neighbor_index().get_neighbors(params['candidate_list_size'])
+
+
+def setup_ant_manager(params, settings):
+    return AntManager(
+        stops=tManager.get_list_of_stops(),
+        start_stop=tManager.get_stop(0),
+        distance_matrix=tManager.get_distances(),
+        stop_index=tManager.get_stop_index(),
+        vehicle_weight=settings['capacity_weight'],
+        vehicle_volume=settings['capacity_volume'],
+        vehicleCount=settings['vehicles'],
+        discount_alpha=params['aco_alpha_factor'],
+        discount_beta=params['aco_beta_factor'],
+        pheromone_evaporation_coefficient=params['pheromone_evaporation_coefficient'],
+        pheromone_constant=params['pheromone_constant'],
+        iterations=settings['aco_iterations'],
+        workers=params['aco_workers'],
+        candidate_lists=get_candidate_lists(params)
+    )
+
+
+def setup_environment(params, settings):
+    return VRPEnvironment(
+        states=tManager.get_list_of_stops(),
+        actions=[0, 1, 2],
+        distance_matrix=tManager.get_distances(),
+        stop_index=tManager.get_stop_index(),
+        microhub=tManager.get_microhub(),
+        capacity_demands=tManager.get_capacity_demands_as_dict(),
+        vehicles=settings['vehicles'],
+        vehicle_weight=settings['capacity_weight'],
+        vehicle_volume=settings['capacity_volume'],
+        candidate_lists=get_candidate_lists(params)
+    )
+
+
+def setup_policy_manager(params, environment, aco_probability_matrix):
+    """
+    :return: policy manager with a new policy, boosted by the given aco result like in the training mode
+    """
+    policy_manager = PolicyManager(environment.get_all_state_hashes(),
+                                   params['learning_rate'],
+                                   params['discount_factor'],
+                                   params['exploration_factor'],
+                                   params['increasing_factor'],
+                                   params['increasing_factor_good_episode'],
+                                   params['decreasing_factor'],
+                                   params['decreasing_factor_good_episode'],
+                                   params['baseline_theta'],
+                                   params['distance_utilization_threshold'],
+                                   params['capacity_utilization_threshold'],
+                                   params['local_search_threshold'],
+                                   params['policy_reset_threshold'],
+                                   value_func_solver=params['value_func_solver'],
+                                   legacy_discounting=params['legacy_discounting'],
+                                   policy_neighbors=tManager.get_neighbor_index().get_neighbors(
+                                       params['policy_top_k']) if params['policy_top_k'] else None)
+    state_hashes = environment.get_all_state_hashes()
+    policy_manager.policy_action_space = policy_manager.create_policy_action_space(
+        state_hashes[1:] + ['{}/{}'.format(environment.get_microhub_hash(), 0)], fill_value=1 / len(state_hashes))
+    policy_manager.apply_aco_on_policy(params['aco_increasing_factor'], aco_probability_matrix)
+    return policy_manager
+
+
+# --------------------
+# PHASES
+def benchmark_distance_matrix(repeats):
+    durations = []
+    for _ in range(repeats):
+        start = timer()
+        tManager.calculate_distance_matrix()
+        durations.append(timer() - start)
+    return summarize_durations(durations)
+
+
+def benchmark_aco(params, settings, repeats, seed):
+    """
+    :return: summary of the aco runs, probability matrix of the last run
+    """
+    durations = []
+    aco_probability_matrix = None
+    for repeat in range(repeats):
+        ant_manager = setup_ant_manager(params, settings)
+        seed_all(seed + repeat)
+        start = timer()
+        aco_probability_matrix = ant_manager.run_aco()[2]
+        durations.append(timer() - start)
+    return summarize_durations(durations, settings['aco_iterations']), aco_probability_matrix
+
+
+def benchmark_env_step(environment, repeats):
+    """
+    Steps through whole episodes, always choosing the first legal stop. Only the environment is timed.
+    """
+    durations = []
+    steps = 0
+    for _ in range(repeats):
+        environment.reset()
+        steps = 0
+        done = False
+        start = timer()
+        while not done:
+            legal_next_action, legal_next_states = environment.get_next_legal_action()[:2]
+            done = environment.step(legal_next_action, legal_next_states[0])[2]
+            steps += 1
+        durations.append(timer() - start)
+    environment.reset()
+    return summarize_durations(durations, steps)
+
+
+def benchmark_vec_env_step(environment, batch_size, repeats):
+    """
+    Steps through batch_size episodes in lockstep, always choosing the first legal stop. Only the environment is
+    timed, a unit is one step of one episode.
+    """
+    vec_environment = VRPVecEnvironment(environment, batch_size)
+    durations = []
+    steps = 0
+    for _ in range(repeats):
+        vec_environment.reset()
+        steps = 0
+        dones = vec_environment.dones
+        start = timer()
+        while not dones.all():
+            legal_next_actions, legal_masks = vec_environment.get_next_legal_actions()[:2]
+            steps += int(np.count_nonzero(legal_next_actions >= 0))
+            dones = vec_environment.step(legal_next_actions, legal_masks.argmax(axis=1))[2]
+        durations.append(timer() - start)
+    return summarize_durations(durations, steps)
+
+
+def benchmark_policy_update(agent, repeats, seed):
+    """
+    Rolls out an episode (not timed) and times the policy update learning from it.
+    """
+    durations = []
+    for epoch in range(repeats):
+        seed_all(seed + epoch)
+        agent.run_episode(epoch)
+        start = timer()
+        agent.policy_manager.policy_update_by_learning(agent.env,
+                                                       agent.episode,
+                                                       agent.episode_statistics.episode_rewards[epoch],
+                                                       agent.gamma,
+                                                       agent.max_steps,
+                                                       agent.num_episodes,
+                                                       epoch)
+        durations.append(timer() - start)
+        agent.env.reset()
+    return summarize_durations(durations, len(agent.episode))
+
+
+def benchmark_construct_policy(policy_manager, environment, max_steps, repeats):
+    durations = []
+    for _ in range(repeats):
+        start = timer()
+        policy_manager.construct_policy(policy_manager.get_current_policy(), environment, max_steps)
+        durations.append(timer() - start)
+    environment.reset()
+    return summarize_durations(durations)
+
+
+def run_instance(stop_count, params, settings, phases):
+    """
+    Times the given phases on one instance. The aco always runs, its probability matrix boosts the policy.
+    :return: results of the instance
+    """
+    repeats = settings['repeats']
+    seed = settings['seed']
+    instance_name = setup_instance(stop_count, seed)
+    results = {'instance': instance_name, 'stops': tManager.get_length_of_stops(), 'phases': dict()}
+
+    if 'distance_matrix' in phases:
+        results['phases']['distance_matrix'] = benchmark_distance_matrix(repeats)
+
+    aco_summary, aco_probability_matrix = benchmark_aco(params, settings, repeats if 'aco' in phases else 1, seed)
+    if 'aco' in phases:
+        results['phases']['aco'] = aco_summary
+
+    environment = setup_environment(params, settings)
+    if 'env_step' in phases:
+        results['phases']['env_step'] = benchmark_env_step(environment, repeats)
+    if 'vec_env_step' in phases:
+        results['phases']['vec_env_step'] = benchmark_vec_env_step(environment, settings['batch_size'], repeats)
+
+    policy_manager = setup_policy_manager(params, environment, aco_probability_matrix)
+    if 'construct_policy' in phases:
+        results['phases']['construct_policy'] = benchmark_construct_policy(policy_manager, environment,
+                                                                           params['max_steps'], repeats)
+
+    if 'policy_update' in phases:
+        agent = VRPAgent(env=environment,
+                         policy_manager=policy_manager,
+                         num_episodes=repeats,
+                         max_steps=params['max_steps'],
+                         discount_factor=params['discount_factor'])
+        results['phases']['policy_update'] = benchmark_policy_update(agent, repeats, seed)
+
+    return results
+
+
+# --------------------
+# META
+def get_commit():
+    try:
+        return subprocess.run(['git', 'describe', '--always', '--dirty'], stdout=subprocess.PIPE,
+                              stderr=subprocess.DEVNULL, universal_newlines=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def get_meta(settings):
+    meta = dict(settings)
+    meta.update({
+        'commit': get_commit(),
+        'created': datetime.now().isoformat(timespec='seconds'),
+        'python': platform.python_version(),
+        'numpy': np.__version__,
+        'pandas': pd.__version__,
+        'platform': platform.platform(),
+        'cpu_count': os.cpu_count(),
+    })
+    return meta
+
+
+def main():
+    argsParser = argparse.ArgumentParser(
+        description='Times the aco, the environment step, the policy update and the policy construction on '
+                    'synthetic instances')
+    argsParser.add_argument('--sizes', default=BENCHMARK_SIZES, type=int, nargs='+',
+                            help="Define the stop counts (without the microhub) of the instances")
+    argsParser.add_argument('--phases', default=PHASES, nargs='+', choices=PHASES,
+                            help="Define the phases to be timed")
+    argsParser.add_argument('--seed', default=0, type=int,
+                            help="Define the seed of the instances and of the random streams")
+    argsParser.add_argument('--repeats', default=3, type=int,
+                            help="Define how often every phase is measured")
+    argsParser.add_argument('--aco_iterations', default=5, type=int,
+                            help="Define the number of aco iterations of one measurement")
+    argsParser.add_argument('--vehicles', default=2, type=int, help="Define the number of vehicles (ants)")
+    argsParser.add_argument('--capacity_weight', default=180.0, type=float,
+                            help="Define the maximum weight that the vehicle can carry")
+    argsParser.add_argument('--capacity_volume', default=500.0, type=float,
+                            help="Define the maximum volume that the vehicle can hold")
+    argsParser.add_argument('--batch_size', default=8, type=int,
+                            help="Define the number of episodes stepped in lockstep by the vectorized environment")
+    argsParser.add_argument('--policy_top_k', default=None, type=int,
+                            help="Time a sparse policy storing the weights of the k nearest stops of every stop only")
+    argsParser.add_argument('--candidate_list_size', default=None, type=int,
+                            help="Time the ants and the environment restricted to the k nearest stops")
+    argsParser.add_argument('--output', default=None,
+                            help="Define the result file, data/statistics/benchmark_<commit>.json by default")
+    argsParser.add_argument('--log_level', default='WARNING', choices=LOG_LEVELS, help="Define the log level")
+    args = vars(argsParser.parse_args())
+
+    setup_logging(args['log_level'])
+    # the remaining parameters keep the defaults of the training mode
+    params = vars(getParser().parse_args([]))
+    params['policy_top_k'] = args['policy_top_k']
+    params['candidate_list_size'] = args['candidate_list_size']
+    settings = {key: args[key] for key in ['seed', 'repeats', 'aco_iterations', 'vehicles', 'capacity_weight',
+                                           'capacity_volume', 'batch_size', 'policy_top_k', 'candidate_list_size']}
+
+    results = {'meta': get_meta(settings), 'instances': dict()}
+    for stop_count in args['sizes']:
+        instance_results = run_instance(stop_count, params, settings, args['phases'])
+        results['instances'][str(stop_count)] = instance_results
+        for phase, summary in instance_results['phases'].items():
+            print('{:>5} stops  {:<17} min {:10.4f}s  median {:10.4f}s'.format(stop_count, phase, summary['min'],
+                                                                            summary['median']))
+
+    output = args['output'] or 'data/statistics/benchmark_{}.json'.format(results['meta']['commit'] or 'results')
+    with open(output, 'w') as file:
+        json.dump(results, file, indent=2)
+    print('Results written to', output)
+
+
+if __name__ == "__main__":
+    main()
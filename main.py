@@ -1,5 +1,6 @@
 import csv
 import src.Tour.TourManager as tManager
+import src.Utils.instrumentation as instrumentation
 
 from timeit import default_timer as timer
 
@@ -10,13 +11,20 @@ from src.RL.Policy.PolicyManager import PolicyManager
 from src.RL.VRPAgent import VRPAgent
 from src.Tour.Stop import Stop
 from src.Utils.helper import calculate_tour_meta
+from src.Utils.JobScheduler import JobScheduler
+from src.Utils.jobLoader import append_job_result, create_job, create_job_results_name, load_jobs
+from src.Utils.logger import get_logger, setup_logging
 from src.Utils.memoryLoader import create_model_name
 from src.Utils.plotter import plot_episode_stats,\
     plot_baseline_estimate,\
     plot_coordinates_with_coordinates_as_label, \
     plot_coordinates_with_stopnr__as_label,\
     plot_tour_with_stopnr_as_label,\
-    plot_tours_individual
+    plot_tours_individual, \
+    use_plot_backend, \
+    close_plots
+
+logger = get_logger('batch')
 
 
 def load_stop_data(data_input):
@@ -26,12 +34,151 @@ def load_stop_data(data_input):
         for row in csv_reader:
             tManager.add_stop(
                 Stop(str(row[0]), int(row[1]), float(row[2]), float(row[3]), float(row[4]), float(row[5]), int(row[6]), int(row[7])))
+    tManager.init_stop_index()
     tManager.calculate_distance_matrix()
+    tManager.init_neighbor_index()
     tManager.init_capacity_demands()
 
 
+def load_cached_stop_data(data_input, stop_data_cache):
+    """
+    Loads the stop data into the tour manager, stop data that was already parsed (incl. its distance matrix) is
+    taken from the cache.
+    :param data_input: data source of the stops
+    :param stop_data_cache: data source -> stop data of the tour manager
+    """
+    tManager.clear()
+    if data_input in stop_data_cache:
+        tManager.set_stop_data(stop_data_cache[data_input])
+        return
+    load_stop_data(data_input)
+    stop_data_cache[data_input] = tManager.get_stop_data()
+
+
+def construct_solution(policyManager, environment, max_steps, decoding_samples):
+    """
+    Constructs the solution of the current policy, with decoding samples the shortest of the episodes sampled from
+    the policy replaces it if it is shorter.
+    :return: policy reward, all constructed tours
+    """
+    policy_reward, tours = policyManager.construct_policy(policyManager.get_current_policy(), environment, max_steps)
+    if decoding_samples:
+        sampled_policy_reward, sampled_tours = policyManager.sample_policy(policyManager.get_current_policy(),
+                                                                           environment, max_steps, decoding_samples)
+        if sampled_policy_reward < policy_reward:
+            return sampled_policy_reward, sampled_tours
+    return policy_reward, tours
+
+
+def read_job():
+    """
+    Asks for the configuration of the run.
+    :return: job
+    """
+    print("---------System menu---------")
+    print("Below please specify the configuration options of the program")
+    data_input = input("Please specify the data source of the stops to be processed:") or 'short_train_data'
+    print('-Regarding the Microhub name, this should be unique and used only for this Microhub.-')
+    print('-The model of the agent is saved but also loaded based on the microhub names.-')
+    microhub_name = input("Please specify the microhub name:") or "TestHub"
+    shipper_name = input("Please specify the shipper name:") or "TestVersender"
+    carrier_name = input("Please specify the carrier name:") or "TestCarrier"
+    print('-Enter the delivery date. Possible Answers [Mon, Tue, Wed, Thurs, Fri, Sat]')
+    delivery_date = input("Please specify the delivery date:") or "Test"
+    amount_vehicles = int(input("How many vehicles will be used:") or 2)
+    vehicle_speed = int(input("How fast is the vehicle [km/h]: ") or 30)
+    capacity_weight = float(input("What is the maximum weight that the vehicle can carry:") or 180)
+    capacity_volume = float(input("What is the maximum volume that the vehicle can hold:") or 500)
+    return create_job(data_input, microhub_name, shipper_name, carrier_name, delivery_date, amount_vehicles,
+                      vehicle_speed, capacity_weight, capacity_volume)
+
+
 def main(args):
 
+    # --------------------
+    # LOGGING
+    setup_logging(args['log_level'])
+
+    run_job(args, read_job())
+
+
+def run_batch(args):
+    """
+    Runs every job of the job file. Without job workers and timeout the jobs run one after another in this process
+    and share parsed stop data and distance matrices of the same data source. Otherwise every job runs in a worker
+    process of its own, at most job_workers at the same time. One result record per job is appended to the result
+    file as JSON line, a failing job is recorded and the batch continues.
+    """
+
+    # --------------------
+    # LOGGING
+    setup_logging(args['log_level'])
+
+    # --------------------
+    # PLOTTING
+    # plots are only saved, not shown
+    use_plot_backend('Agg')
+
+    jobs = load_jobs(args['job_file'])
+    result_file = args['job_results'] or create_job_results_name(args['job_file'])
+    stop_data_cache = dict()
+    print("-Running {} jobs, results are written to {}-".format(len(jobs), result_file))
+
+    if args['job_workers'] > 1 or args['job_timeout']:
+        # jobs of the same model are never run at the same time
+        job_scheduler = JobScheduler(run_scheduled_job, args, args['job_workers'], args['job_timeout'],
+                                     job_key=lambda job: create_model_name(job['microhub_name'],
+                                                                           job['capacity_weight'],
+                                                                           job['capacity_volume'],
+                                                                           job['shipper_name'],
+                                                                           job['carrier_name'],
+                                                                           job['delivery_date'],
+                                                                           args['agent']))
+        job_scheduler.run(jobs, lambda record: append_job_result(result_file, record))
+        return
+
+    for job_number, job in enumerate(jobs):
+        print("-Job {}/{}: {}-".format(job_number + 1, len(jobs), job))
+        job_start = timer()
+        try:
+            record = run_job(args, job, stop_data_cache)
+            record['status'] = 'done'
+        except Exception as ex:
+            logger.exception('Job %d failed', job_number + 1)
+            record = dict(job)
+            record['status'] = 'failed'
+            record['error'] = repr(ex)
+        close_plots()
+        record['job_number'] = job_number + 1
+        record['duration'] = timer() - job_start
+        append_job_result(result_file, record)
+
+
+def run_scheduled_job(args, job):
+    """
+    Runs one job in a worker process of the job scheduler.
+    :return: result record of the job
+    """
+    use_plot_backend('Agg')
+    record = run_job(args, job)
+    close_plots()
+    return record
+
+
+def run_job(args, job, stop_data_cache=None):
+    """
+    Runs training and/or testing for one job.
+    :param args: parameters of argsConfig
+    :param job: data source, microhub, shipper, carrier, delivery date, vehicles and capacities of the run
+    :param stop_data_cache: data source -> parsed stop data, stop data is parsed again if None
+    :return: result record of the job
+    """
+
+    # --------------------
+    # INSTRUMENTATION
+    # timers and counters of this run, exported as run report at the end
+    instrumentation.clear()
+
     # --------------------
     # ARGSPARSE
     # define parameters (the wall of parameters)
@@ -43,12 +190,21 @@ def main(args):
     exploration_factor = args['exploration_factor']
     num_episodes = args['num_episodes']
     max_steps = args['max_steps']
+    episodes_per_update = args['episodes_per_update']
+    rollout_workers = args['rollout_workers']
+    vectorized_rollouts = args['vectorized_rollouts']
+    decoding_samples = args['decoding_samples']
     ml_agent = args['agent']
     increasing_factor = args['increasing_factor']
     increasing_factor_good_episode = args['increasing_factor_good_episode']
     decreasing_factor = args['decreasing_factor']
     decreasing_factor_good_episode = args['decreasing_factor_good_episode']
     baseline_theta = args['baseline_theta']
+    value_func_solver = args['value_func_solver']
+    legacy_discounting = args['legacy_discounting']
+    prune_stale_days = args['prune_stale_days']
+    policy_top_k = args['policy_top_k']
+    candidate_list_size = args['candidate_list_size']
 
     # THRESHOLD PARAMETERS
     # see argsConfig for help
@@ -64,39 +220,44 @@ def main(args):
     pheromone_constant = args['pheromone_constant']
     aco_iterations = args['aco_iterations']
     aco_increasing_factor = args['aco_increasing_factor']
+    aco_workers = args['aco_workers']
 
     # --------------------
     # INPUT
     # define meta data
-    print("---------System menu---------")
-    print("Below please specify the configuration options of the program")
-    data_input = input("Please specify the data source of the stops to be processed:") or 'short_train_data'
-    print('-Regarding the Microhub name, this should be unique and used only for this Microhub.-')
-    print('-The model of the agent is saved but also loaded based on the microhub names.-')
-    microhub_name = input("Please specify the microhub name:") or "TestHub"
-    shipper_name = input("Please specify the shipper name:") or "TestVersender"
-    carrier_name = input("Please specify the carrier name:") or "TestCarrier"
-    print('-Enter the delivery date. Possible Answers [Mon, Tue, Wed, Thurs, Fri, Sat]')
-    delivery_date = input("Please specify the delivery date:") or "Test"
-    amount_vehicles = int(input("How many vehicles will be used:") or 2)
-    vehicle_speed = int(input("How fast is the vehicle [km/h]: ") or 30)
-    capacity_weight = float(input("What is the maximum weight that the vehicle can carry:") or 180)
-    capacity_volume = float(input("What is the maximum volume that the vehicle can hold:") or 500)
+    data_input = job['data_input']
+    microhub_name = job['microhub_name']
+    shipper_name = job['shipper_name']
+    carrier_name = job['carrier_name']
+    delivery_date = job['delivery_date']
+    amount_vehicles = job['amount_vehicles']
+    vehicle_speed = job['vehicle_speed']
+    capacity_weight = job['capacity_weight']
+    capacity_volume = job['capacity_volume']
+    record = dict(job)
 
     # --------------------
     # SETTING UP TOUR MANAGER
     # Load Stop Data
-    tManager.clear()
-    load_stop_data(data_input)
+    if stop_data_cache is None:
+        tManager.clear()
+        load_stop_data(data_input)
+    else:
+        load_cached_stop_data(data_input, stop_data_cache)
 
     # Setup Distance Matrix for later use
     distance_matrix = tManager.get_distances()
+    # nearest stops of every stop, restricting the choice of the next stop of the ants and the agent
+    candidate_lists = tManager.get_neighbor_index().get_neighbors(candidate_list_size) if candidate_list_size else None
+    # nearest stops of every stop whose weights a sparse policy stores, ranked like the candidate lists
+    policy_neighbors = tManager.get_neighbor_index().get_neighbors(policy_top_k) if policy_top_k else None
 
     # --------------------
     # PLOT COORDINATES
     # overview of problem space (input)
-    plot_coordinates_with_coordinates_as_label()
-    plot_coordinates_with_stopnr__as_label()
+    with instrumentation.timed('plotting'):
+        plot_coordinates_with_coordinates_as_label()
+        plot_coordinates_with_stopnr__as_label()
 
     if args['train']:
         # --------------------TRAINING MODE--------------------
@@ -109,6 +270,8 @@ def main(args):
         antManager = AntManager(
             stops=tManager.get_list_of_stops(),
             start_stop=tManager.get_stop(0),
+            distance_matrix=distance_matrix,
+            stop_index=tManager.get_stop_index(),
             vehicle_weight=capacity_weight,
             vehicle_volume=capacity_volume,
             vehicleCount=amount_vehicles,
@@ -116,7 +279,9 @@ def main(args):
             discount_beta=aco_beta_factor,
             pheromone_evaporation_coefficient=pheromone_evaporation_coefficient,
             pheromone_constant=pheromone_constant,
-            iterations=aco_iterations
+            iterations=aco_iterations,
+            workers=aco_workers,
+            candidate_lists=candidate_lists
         )
 
         # --------------------
@@ -144,11 +309,13 @@ def main(args):
             # 2 = select microhub if tour full and possible Stops = null
             actions=[0, 1, 2],
             distance_matrix=distance_matrix,
+            stop_index=tManager.get_stop_index(),
             microhub=tManager.get_microhub(),
             capacity_demands=tManager.get_capacity_demands_as_dict(),
             vehicles=amount_vehicles,
             vehicle_weight=capacity_weight,
-            vehicle_volume=capacity_volume
+            vehicle_volume=capacity_volume,
+            candidate_lists=candidate_lists
         )
 
         # --------------------
@@ -165,7 +332,11 @@ def main(args):
                                       distance_utilization_threshold,
                                       capacity_utilization_threshold,
                                       local_search_threshold,
-                                      policy_reset_threshold
+                                      policy_reset_threshold,
+                                      value_func_solver=value_func_solver,
+                                      legacy_discounting=legacy_discounting,
+                                      stale_stop_days=prune_stale_days,
+                                      policy_neighbors=policy_neighbors
                                       )
 
         # --------------------
@@ -187,7 +358,10 @@ def main(args):
                          policy_manager=policyManager,
                          num_episodes=num_episodes,
                          max_steps=max_steps,
-                         discount_factor=discount_factor
+                         discount_factor=discount_factor,
+                         rollout_workers=rollout_workers,
+                         episodes_per_update=episodes_per_update,
+                         vectorized_rollouts=vectorized_rollouts
                          )
 
         # --------------------
@@ -196,8 +370,8 @@ def main(args):
         training_start = timer()
         episodeStatistics, policy_action_space, best_policy_reward, worst_policy_reward, last_policy_reward = agent.train_model()
         training_end = timer()
-        current_policy_reward, final_tours = policyManager.construct_policy(policyManager.get_current_policy(),
-                                                                            environment, max_steps)
+        current_policy_reward, final_tours = construct_solution(policyManager, environment, max_steps,
+                                                                decoding_samples)
 
         print("----------------------------------------")
         print("Best_policy_reward: ", best_policy_reward)
@@ -205,12 +379,21 @@ def main(args):
         print("Final_policy_reward: ", last_policy_reward)
         print("ACO RUN TIME in s: ", (aco_end - aco_start))
         print("TRAINING RUN TIME in s: ", (training_end - training_start))
+        record.update({
+            'aco_shortest_distance': float(ant_shortest_distance),
+            'best_policy_reward': float(best_policy_reward),
+            'worst_policy_reward': float(worst_policy_reward),
+            'final_policy_reward': float(last_policy_reward),
+            'aco_run_time': aco_end - aco_start,
+            'training_run_time': training_end - training_start,
+        })
         # --------------------
         # PLOTTING TRAINING RESULTS
-        plot_episode_stats(episodeStatistics, smoothing_window=25)
-        plot_tour_with_stopnr_as_label(final_tours)
-        current_baseline = policyManager.get_current_baseline_as_dict()
-        plot_baseline_estimate(current_baseline)
+        with instrumentation.timed('plotting'):
+            plot_episode_stats(episodeStatistics, smoothing_window=25)
+            plot_tour_with_stopnr_as_label(final_tours)
+            current_baseline = policyManager.get_current_baseline_as_dict()
+            plot_baseline_estimate(current_baseline)
 
         # --------------------
         # SAVING TRAINING RESULTS
@@ -240,11 +423,13 @@ def main(args):
             # 2 = select microhub if tour full and possible Stops = null
             actions=[0, 1, 2],
             distance_matrix=distance_matrix,
+            stop_index=tManager.get_stop_index(),
             microhub=tManager.get_microhub(),
             capacity_demands=tManager.get_capacity_demands_as_dict(),
             vehicles=amount_vehicles,
             vehicle_weight=capacity_weight,
-            vehicle_volume=capacity_volume
+            vehicle_volume=capacity_volume,
+            candidate_lists=candidate_lists
         )
 
         # --------------------
@@ -261,7 +446,11 @@ def main(args):
                                       distance_utilization_threshold,
                                       capacity_utilization_threshold,
                                       local_search_threshold,
-                                      policy_reset_threshold
+                                      policy_reset_threshold,
+                                      value_func_solver=value_func_solver,
+                                      legacy_discounting=legacy_discounting,
+                                      stale_stop_days=prune_stale_days,
+                                      policy_neighbors=policy_neighbors
                                       )
 
         # --------------------
@@ -272,8 +461,8 @@ def main(args):
 
         # --------------------
         # CONSTRUCTION SOLUTION
-        current_policy_reward, final_tours = policyManager.construct_policy(policyManager.get_current_policy(),
-                                                                            environment, max_steps)
+        current_policy_reward, final_tours = construct_solution(policyManager, environment, max_steps,
+                                                                decoding_samples)
         testing_end = timer()
 
         for tour in final_tours:
@@ -312,13 +501,47 @@ def main(args):
         print("Mean Distance per Tour: ", (total_distance/len(final_tours)))
         print("Overall Time needed: ", total_time)
         print("Average Time needed per Tour: ", average_time_per_tour)
+        record.update({
+            'policy_reward': float(current_policy_reward),
+            'tour_amount': len(final_tours),
+            'total_distance': float(total_distance),
+            'total_time': float(total_time),
+            'testing_run_time': testing_end - testing_start,
+        })
 
         # --------------------
         # PLOTTING TOUR (UNNECESSARY IN PRODUCTION)
-        plot_tour_with_stopnr_as_label(final_tours)
-        plot_tours_individual(final_tours, model_name)
+        with instrumentation.timed('plotting'):
+            plot_tour_with_stopnr_as_label(final_tours)
+            plot_tours_individual(final_tours, model_name)
+
+    # --------------------
+    # RUN REPORT
+    # timers and counters of all phases of this run
+    report_path = instrumentation.export_report(
+        'run_report_' + create_model_name(microhub_name, capacity_weight, capacity_volume, shipper_name, carrier_name,
+                                          delivery_date, ml_agent),
+        meta={
+            'data_input': data_input,
+            'microhub_name': microhub_name,
+            'shipper_name': shipper_name,
+            'carrier_name': carrier_name,
+            'delivery_date': delivery_date,
+            'vehicles': amount_vehicles,
+            'capacity_weight': capacity_weight,
+            'capacity_volume': capacity_volume,
+            'stops': tManager.get_length_of_stops(),
+            'train': args['train'],
+            'test': args['test'],
+        })
+    print("Run report: ", report_path)
+    record['run_report'] = report_path
+    return record
 
 
 if __name__ == "__main__":
     args = getParams()
-    main(args)
+    if args['job_file']:
+        run_batch(args)
+    else:
+        main(args)
@@ -1,7 +1,10 @@
-import pandas as pd
+import random
 
-import src.Tour.TourManager as tManager
-from src.Utils.helper import calculate_distance
+import numpy as np
+
+from src.Utils.logger import get_logger
+
+logger = get_logger('aco')
 
 
 class Ant:
@@ -11,17 +14,22 @@ class Ant:
                  ant_weight,
                  ant_volume,
                  possible_stops,
-                 df_pheromone_matrix,
+                 distance_matrix,
+                 pheromone_matrix,
                  discount_alpha,
                  discount_beta,
                  pheromone_evaporation_coefficient,
-                 first_run):
+                 first_run,
+                 rng=None,
+                 candidate_lists=None):
 
         # --------------------
         # STATES
+        # possible_stops are all stops in index order (stop.stop_id)
         self.start_stop = start_stop
         self.microhub_hash = self.start_stop.hash_id
-        self.possible_stops = possible_stops
+        self.stops = possible_stops
+        self.possible_stops = []
         self.memory_possible_stops = []
         self.current_stop = current_stop
 
@@ -45,7 +53,8 @@ class Ant:
         self.distance_travelled = 0.0  # kilometers
         self.discount_alpha = discount_alpha
         self.discount_beta = discount_beta
-        self.df_pheromone_matrix = df_pheromone_matrix
+        self.distance_matrix = distance_matrix
+        self.pheromone_matrix = pheromone_matrix
         # self.pheromoneMatrix = pheromoneMatrix
         self.pheromone_evaporation_coefficient = pheromone_evaporation_coefficient
         # self.tour.append(self.start_stop)
@@ -53,6 +62,14 @@ class Ant:
         # --------------------
         # OTHER
         self.first_run = first_run
+        # random stream of the ant, the shared module stream if None
+        self.rng = random if rng is None else rng
+        # (stops x k)-array of the nearest stop indices of every stop, the next stop is chosen among the nearest
+        # possible stops of the current stop, None chooses among all possible stops
+        self.candidate_lists = candidate_lists
+        # with candidate lists: possible stops as mask by stop index, kept in line with possible_stops
+        self.possible_mask = None if candidate_lists is None else np.zeros(len(possible_stops), dtype=bool)
+        self.set_possible_stops(possible_stops)
         self.updateTour(start_stop)
 
     def move_ant(self) -> object:
@@ -60,7 +77,7 @@ class Ant:
         Moving ant until no possible stops are left.
         :rtype: object
         """
-        print("-Ants started to move-")
+        logger.debug('-Ants started to move-')
         while self.possible_stops:
             next_stop = self.select_next_stop()
             possible_final_tour_weight = next_stop.demand_weight + self.tour_weight
@@ -78,7 +95,7 @@ class Ant:
                         if (possible_final_tour_volume <= self.ant_volume) and (
                                 possible_final_tour_weight <= self.ant_weight):
                             self.traverse_ant(self.current_stop, next_stop)
-                            self.possible_stops = self.memory_possible_stops
+                            self.set_possible_stops(self.memory_possible_stops)
                             # self.possibleStops.remove(stop)
                             continue
                         else:
@@ -90,7 +107,7 @@ class Ant:
                     self.memory_possible_stops = self.possible_stops.copy()
                     self.tour_overload += 1
                 else:
-                    self.possible_stops.remove(next_stop)
+                    self.remove_possible_stop(next_stop)
                     self.tour_overload += 1
         self.possible_stops.append(self.start_stop)
         self.microhub_counter += 1
@@ -103,46 +120,63 @@ class Ant:
         Selecting next stop
         :rtype: object
         """
-        print('-ant is selecting stop-')
+        logger.debug('-ant is selecting stop-')
         if self.first_run:
-            import random
-            return random.choice(self.possible_stops)
+            return self.rng.choice(self.possible_stops)
             # while rnd == self.current_stop and len(self.possibleStops) > 1:
             #    rnd = random.choice(self.possibleStops)
             #    # self.firstInit = !firstInit
             # return rnd
 
-        stop_attraction = dict()
-        total_attraction = 0.0
-
-        for possible_next_stop in self.possible_stops:
-            current_hash = self.current_stop.hash_id
-            next_hash = possible_next_stop.hash_id
-            if current_hash == self.microhub_hash:
-                current_hash = '{}/{}'.format(self.microhub_hash, self.microhub_counter)
-            if next_hash == self.microhub_hash:
-                next_hash = '{}/{}'.format(self.microhub_hash, self.microhub_counter + 1)
-            print("-ant is retrieving pheromone-")
-            if '{}/{}'.format(self.microhub_hash, self.microhub_counter) not in self.df_pheromone_matrix.index.values:
-                print("-ant filled missing microhub in df_pheromoneMatrix-")
-                new_row = pd.Series(name='{}/{}'.format(self.microhub_hash, self.microhub_counter))
-                self.df_pheromone_matrix = self.df_pheromone_matrix.append(new_row, ignore_index=False)
-                self.df_pheromone_matrix['{}/{}'.format(self.microhub_hash, self.microhub_counter)] = 0.0
-                self.df_pheromone_matrix.fillna(value=0.0, inplace=True)
-            df_pheromone_value = self.df_pheromone_matrix.at[current_hash, next_hash]
-            print("-ant is looking up distance-")
-            distance = float(tManager.get_distance_by_matrix(self.current_stop.hash_id, possible_next_stop.hash_id))
-            stop_attraction[possible_next_stop] = pow(df_pheromone_value, self.discount_alpha) * pow(
-                ((1 / distance) if distance else 0),
-                self.discount_beta)
-            total_attraction += stop_attraction[possible_next_stop]
+        candidate_stops = self.get_candidate_stops()
+        next_stop_ids = np.fromiter((stop.stop_id for stop in candidate_stops), dtype=np.intp,
+                                    count=len(candidate_stops))
+        logger.debug('-ant is retrieving pheromone-')
+        # microhub visit slots that were not deposited on yet hold no pheromone
+        current_slot = self.pheromone_matrix.get_slot(self.current_stop.stop_id, self.microhub_counter)
+        next_slots = self.pheromone_matrix.get_slots(next_stop_ids, self.microhub_counter + 1)
+        pheromone_values = self.pheromone_matrix.get_pheromones(current_slot, next_slots)
+        logger.debug('-ant is looking up distance-')
+        distances = self.distance_matrix.get_distances_from(self.current_stop.stop_id, next_stop_ids)
+        inverse_distances = np.zeros_like(distances)
+        np.divide(1, distances, out=inverse_distances, where=distances != 0)
+        stop_attraction = np.power(pheromone_values, self.discount_alpha) * np.power(inverse_distances,
+                                                                                    self.discount_beta)
+        total_attraction = np.cumsum(stop_attraction)[-1]
 
         if total_attraction == 0.0:
-            for key, value in stop_attraction.items():
-                stop_attraction[key] = self.define_threshold_for_next_stop(value)
+            stop_attraction = np.array([self.define_threshold_for_next_stop(value) for value in stop_attraction])
             total_attraction = self.define_threshold_for_next_stop(total_attraction)
 
-        return self.evaluate_weight_choices(stop_attraction, total_attraction)
+        return candidate_stops[self.evaluate_weight_choices(stop_attraction, total_attraction, self.rng)]
+
+    def get_candidate_stops(self) -> object:
+        """
+        :return: possible stops among the nearest stops of the current stop (nearest first), all possible stops
+        without candidate lists or if none of the nearest stops is possible anymore
+        """
+        if self.candidate_lists is None:
+            return self.possible_stops
+        candidates = self.candidate_lists[self.current_stop.stop_id]
+        candidate_stops = [self.stops[stop_id] for stop_id in candidates[self.possible_mask[candidates]].tolist()]
+        return candidate_stops if candidate_stops else self.possible_stops
+
+    def set_possible_stops(self, possible_stops: object) -> object:
+        """
+        :param possible_stops: new possible stops
+        """
+        self.possible_stops = possible_stops
+        if self.possible_mask is not None:
+            self.possible_mask[:] = False
+            self.possible_mask[[stop.stop_id for stop in possible_stops]] = True
+
+    def remove_possible_stop(self, stop: object) -> object:
+        """
+        :param stop: stop that is not possible anymore
+        """
+        self.possible_stops.remove(stop)
+        if self.possible_mask is not None:
+            self.possible_mask[stop.stop_id] = False
 
     @staticmethod
     def define_threshold_for_next_stop(x: object) -> object:
@@ -163,22 +197,19 @@ class Ant:
         return struct.unpack('<d', struct.pack('<q', n))[0]
 
     @staticmethod
-    def evaluate_weight_choices(choices: object, total: object) -> object:
+    def evaluate_weight_choices(choices: object, total: object, rng: object = random) -> object:
         """
         Evaluate weights of each possible next stop and chooses based on the defined threshold.
-        :param choices: dict of all next stops
+        :param choices: array of the attraction of every possible next stop
         :param total: threshold for choosing next stop
-        :return: next stop hash_id
+        :param rng: random stream
+        :return: index of the next stop
         """
-        print('-ant is evaluating weight choices-')
-        import random
-        r = random.uniform(0, total)
-        current_value_sum = 0
-        for key, value in choices.items():
-            if current_value_sum + value >= r:
-                return key
-            current_value_sum += value
-        assert False
+        logger.debug('-ant is evaluating weight choices-')
+        r = rng.uniform(0, total)
+        reached = np.cumsum(choices) >= r
+        assert reached.any()
+        return int(np.argmax(reached))
 
     def traverse_ant(self, startStop: object, endStop: object) -> object:
         """
@@ -186,7 +217,7 @@ class Ant:
         :param startStop: point of departure
         :param endStop: final point
         """
-        print('-ant is traversing between stops-')
+        logger.debug('-ant is traversing between stops-')
         self.updateTour(endStop)
         self.update_distance_travelled(startStop, endStop)
         self.current_stop = endStop
@@ -198,7 +229,7 @@ class Ant:
         :param temp_stops: List of temporary stops to not lose track of last possible stop.
         :return:
         """
-        print('-ant is starting a new tour-')
+        logger.debug('-ant is starting a new tour-')
         self.microhub_counter += 1
         self.tour.append(microHub)
         self.all_tours.append(self.tour.copy())
@@ -207,9 +238,9 @@ class Ant:
         self.reset_tour()
         self.tour.append(microHub)
         if not self.memory_possible_stops:
-            self.possible_stops = temp_stops
+            self.set_possible_stops(temp_stops)
         else:
-            self.possible_stops = self.memory_possible_stops
+            self.set_possible_stops(self.memory_possible_stops)
         # self.possibleStops = list(self.possibleStops)
         # self.possibleStops.remove(microHub)
 
@@ -217,19 +248,19 @@ class Ant:
         """
         Resets tour and tour meta data.
         """
-        print('-ant is resetting Tour-')
+        logger.debug('-ant is resetting Tour-')
         self.tour = []
         self.tour_overload = 0
         self.tour_weight = 0.0
         self.tour_volume = 0.0
 
     def updateTour(self, newStopToAdd):
-        print('-ant is updating Tour-')
+        logger.debug('-ant is updating Tour-')
         self.tour.append(newStopToAdd)
         self.tour_weight += newStopToAdd.demand_weight
         self.tour_volume += newStopToAdd.demand_volume
         self.possible_stops = list(self.possible_stops)
-        self.possible_stops.remove(newStopToAdd)
+        self.remove_possible_stop(newStopToAdd)
         self.memory_possible_stops = []
 
     def update_distance_travelled(self, startStop: object, endStop: object) -> object:
@@ -239,7 +270,7 @@ class Ant:
         :param endStop: final point
         :return: updated distance travelled
         """
-        self.distance_travelled += float(calculate_distance(startStop, endStop))
+        self.distance_travelled += self.distance_matrix.get_distance(startStop.stop_id, endStop.stop_id)
 
     def get_all_tours(self) -> object:
         """
@@ -1,13 +1,24 @@
+import random
+from timeit import default_timer as timer
+
+import numpy as np
 import pandas as pd
 
-import src.Tour.TourManager as tManager
 from src.Aco.Ant import Ant
+from src.Aco.ColonyPool import ColonyPool
+from src.Aco.PheromoneMatrix import PheromoneMatrix
+from src.Utils.instrumentation import add_duration, increment, timed
+from src.Utils.logger import get_logger
+
+logger = get_logger('aco')
 
 
 class AntManager:
     def __init__(self,
                  stops,
                  start_stop,
+                 distance_matrix,
+                 stop_index,
                  vehicleCount,
                  vehicle_weight,
                  vehicle_volume,
@@ -15,7 +26,9 @@ class AntManager:
                  discount_beta,
                  pheromone_evaporation_coefficient,
                  pheromone_constant,
-                 iterations):
+                 iterations,
+                 workers=1,
+                 candidate_lists=None):
 
         # --------------------
         # NODES
@@ -25,14 +38,15 @@ class AntManager:
         self.start_stop = 0 if start_stop is None else start_stop
         self.microhub_hash = self.start_stop.hash_id
         self.microhub_counter = 0
+        self.distance_matrix = distance_matrix
+        self.stop_index = stop_index
 
         self.first_run = True
 
         # --------------------
         # PHEROMONE
         self.tour_size = len(stops)
-        self.df_pheromone_matrix = self.setup_pheromone_matrix()
-        self.df_updated_pheromone_matrix = self.setup_pheromone_matrix()
+        self.pheromone_matrix = self.setup_pheromone_matrix()
 
         # --------------------
         # ACO-PARAMETER
@@ -41,6 +55,10 @@ class AntManager:
         self.pheromone_evaporation_coefficient = pheromone_evaporation_coefficient
         self.pheromone_constant = pheromone_constant
         self.iterations = iterations
+        # amount of worker processes constructing the ant tours, 1 moves the ants one after another
+        self.workers = workers
+        # (stops x k)-array of the nearest stop indices of every stop, restricts the choice of the ants' next stop
+        self.candidate_lists = candidate_lists
 
         # --------------------
         # LIST OF ANTS
@@ -63,106 +81,55 @@ class AntManager:
         :param startStop: point of departure
         :return: Ant objects
         """
-        print("-Setting up Ants-")
+        logger.debug('-Setting up Ants-')
         if self.first_run:
-            return [Ant(startStop, startStop, self.antWeight, self.antVolume, self.nodes, self.df_pheromone_matrix,
-                        self.discountAlpha, self.discountBeta, self.pheromone_evaporation_coefficient, first_run=True)
+            return [Ant(startStop, startStop, self.antWeight, self.antVolume, self.nodes, self.distance_matrix,
+                        self.pheromone_matrix, self.discountAlpha, self.discountBeta,
+                        self.pheromone_evaporation_coefficient, first_run=True,
+                        candidate_lists=self.candidate_lists)
                     for _ in range(self.antCount)]
 
         for ant in self.ants:
-            ant.__init__(startStop, startStop, self.antWeight, self.antVolume, self.nodes, self.df_pheromone_matrix,
-                         self.discountAlpha, self.discountBeta, self.pheromone_evaporation_coefficient, first_run=False)
+            ant.__init__(startStop, startStop, self.antWeight, self.antVolume, self.nodes, self.distance_matrix,
+                         self.pheromone_matrix, self.discountAlpha, self.discountBeta,
+                         self.pheromone_evaporation_coefficient, first_run=False,
+                         candidate_lists=self.candidate_lists)
 
     def setup_ant_probability_matrix(self) -> object:
         """
         :return: ant probability matrix
         """
-        df_new_ant_probability_matrix = pd.DataFrame(index=self.state_hashes[1:], columns=self.state_hashes[1:])
-        new_row = pd.Series(name='{}/{}'.format(self.microhub_hash, 0))
-        df_new_pickle = df_new_ant_probability_matrix.append(new_row, ignore_index=False)
-        df_new_pickle['{}/{}'.format(self.microhub_hash, 0)] = 0.0
-        df_new_ant_probability_matrix.fillna(value=0.0, inplace=True)
-        return df_new_ant_probability_matrix
+        return pd.DataFrame(0.0, index=self.state_hashes[1:], columns=self.state_hashes[1:])
 
     def setup_pheromone_matrix(self) -> object:
         """
         :return: pheromone matrix
         """
-        df_new_pheromone_matrix = pd.DataFrame(index=self.state_hashes[1:], columns=self.state_hashes[1:])
-        new_row = pd.Series(name='{}/{}'.format(self.microhub_hash, 0))
-        df_new_pheromone_matrix = df_new_pheromone_matrix.append(new_row, ignore_index=False)
-        df_new_pheromone_matrix['{}/{}'.format(self.microhub_hash, 0)] = 0.0
-        df_new_pheromone_matrix.fillna(value=0.0, inplace=True)
-        return df_new_pheromone_matrix
+        return PheromoneMatrix(self.state_hashes)
 
     def update_probability_matrix(self) -> object:
         """
         Updates the probability matrix of the ant manager.
+        The probabilities are normed by the sum over the first stop's row (stops only).
         :return: None
         """
-        print('-updating aco probability matrix-')
-        sum_all_probabilities = 0.0
-        for i in self.ant_probability_Matrix:
-            for j in self.ant_probability_Matrix:
-                # (\tau_{i,j})^\alpha
-                tau_i_j = float(self.df_pheromone_matrix.at[i, j])
-                # (\eta_{i,j})}^\beta
-                stop_row = next((node for node in self.nodes if node.hash_id == i), None)
-                stop_col = next((node for node in self.nodes if node.hash_id == j), None)
-                eta_i_j = float(tManager.get_distance_by_matrix(stop_row.hash_id, stop_col.hash_id))
-                # get the sum of all probabilities
-                sum_all_probabilities += (tau_i_j * eta_i_j)
-            break
-
-        for i in self.df_pheromone_matrix:
-            self.microhub_counter = 0
-            for j in self.df_pheromone_matrix:
-                if i not in self.ant_probability_Matrix.index.values:
-                    new_row = pd.Series(name=j)
-                    self.ant_probability_Matrix = self.ant_probability_Matrix.append(new_row, ignore_index=False)
-                    self.ant_probability_Matrix[j] = 0.0
-                    self.ant_probability_Matrix.fillna(value=0.0, inplace=True)
-                if j not in self.ant_probability_Matrix.index.values:
-                    new_row = pd.Series(name=j)
-                    self.ant_probability_Matrix = self.ant_probability_Matrix.append(new_row, ignore_index=False)
-                    self.ant_probability_Matrix[j] = 0.0
-                    self.ant_probability_Matrix.fillna(value=0.0, inplace=True)
-                # (\tau_{i,j})^\alpha
-                tau_i_j = self.df_pheromone_matrix.at[i, j]
-                # (\eta_{i,j})}^\beta
-                i_hash_comparer = i
-                j_hash_comparer = j
-                if "/" in str(i_hash_comparer):
-                    i_hash_comparer = self.microhub_hash
-                if "/" in str(j_hash_comparer):
-                    j_hash_comparer = self.microhub_hash
-                stop_row = next((node for node in self.nodes if node.hash_id == i_hash_comparer), None)
-                stop_col = next((node for node in self.nodes if node.hash_id == j_hash_comparer), None)
-                eta_i_j = tManager.get_distance_by_matrix(stop_row.hash_id, stop_col.hash_id)
-                # calculate Probability
-                probability_i_j = float(((tau_i_j * eta_i_j) / sum_all_probabilities))
-                # set Probability
-                self.ant_probability_Matrix.at[i, j] = float(probability_i_j)
+        logger.debug('-updating aco probability matrix-')
+        slot_stops = self.pheromone_matrix.get_slot_stops()
+        # (\tau_{i,j})^\alpha * (\eta_{i,j})}^\beta
+        attraction = self.pheromone_matrix.get_matrix() * self.distance_matrix.distances[np.ix_(slot_stops, slot_stops)]
+        # get the sum of all probabilities (summed up in order)
+        sum_all_probabilities = np.cumsum(attraction[0, :self.pheromone_matrix.stop_count])[-1]
+        self.ant_probability_Matrix = self.pheromone_matrix.to_dataframe(attraction / sum_all_probabilities)
 
     def update_pheromone_matrix(self) -> object:
         """
         Updates the pheromone matrix of the ant manager.
         :return: None
         """
-        print('-updating pheromone matrix-')
-        for df_start in self.df_updated_pheromone_matrix:
-            self.microhub_counter = 0
-            for df_end in self.df_updated_pheromone_matrix:
-                if df_end not in self.df_pheromone_matrix.index.values:
-                    new_row = pd.Series(name=df_end)
-                    self.df_pheromone_matrix = self.df_pheromone_matrix.append(new_row, ignore_index=False)
-                    self.df_pheromone_matrix[df_end] = 0.0
-                    self.df_pheromone_matrix.fillna(value=0.0, inplace=True)
-
-                self.df_pheromone_matrix.at[df_start, df_end] *= (1 - self.pheromone_evaporation_coefficient)
-                self.df_pheromone_matrix.at[df_start, df_end] += self.df_updated_pheromone_matrix.at[df_start, df_end]
-        self.df_pheromone_matrix.reset_index()
-        print('done updating pheromone matrix')
+        logger.debug('-updating pheromone matrix-')
+        self.pheromone_matrix.evaporate(self.pheromone_evaporation_coefficient)
+        self.pheromone_matrix.apply_deposits()
+        logger.debug('done updating pheromone matrix')
 
     def update_pheromone_matrix_by_ant_solution(self, ant: object) -> object:
         """
@@ -170,56 +137,44 @@ class AntManager:
         :param ant: Ant object
         :return: None
         """
-        print('-updating pheromone matrix based on ant solution-')
-        tours = ant.get_all_tours()
-        self.microhub_counter = 0
-        for tour in tours:
-            for index, stop in enumerate(tour):
-                microhub_exists = False
-                stop_b = 0
-                if index == len(tour) - 1:
-                    break
-                    # stop_b = tour[0]
-                else:
-                    stop_b = tour[index + 1]
-
-                stop_hash = stop.hash_id
-                stop_b_hash = stop_b.hash_id
-
-                if stop_hash == self.microhub_hash:
-                    stop_hash = '{}/{}'.format(self.microhub_hash, self.microhub_counter)
-                if stop_b_hash == self.microhub_hash:
-                    self.microhub_counter += 1
-                    stop_b_hash = '{}/{}'.format(self.microhub_hash, self.microhub_counter)
-                    microhub_exists = True
-
-                new_pheromone_value = float(self.pheromone_constant / ant.get_travelled_distance())  # 1/Total Length
-
-                if microhub_exists:
-                    if ('{}/{}'.format(self.microhub_hash,
-                                       self.microhub_counter) not in self.df_updated_pheromone_matrix.index.values):
-                        new_row = pd.Series(name='{}/{}'.format(self.microhub_hash, self.microhub_counter))
-                        self.df_updated_pheromone_matrix = self.df_updated_pheromone_matrix.append(new_row,
-                                                                                                   ignore_index=False)
-                        self.df_updated_pheromone_matrix[
-                            '{}/{}'.format(self.microhub_hash, self.microhub_counter)] = 0.0
-                        self.df_updated_pheromone_matrix.fillna(value=0.0, inplace=True)
-                    self.df_updated_pheromone_matrix.at[stop_hash, stop_b_hash] += new_pheromone_value
-                    self.df_updated_pheromone_matrix.at[stop_b_hash, stop_hash] += new_pheromone_value
-                else:
-                    self.df_updated_pheromone_matrix.at[stop_hash, stop_b_hash] += new_pheromone_value
-                    self.df_updated_pheromone_matrix.at[stop_b_hash, stop_hash] += new_pheromone_value
-            self.df_updated_pheromone_matrix.reset_index()
-            # self.updated_pheromoneMatrix[stop.stopid][stop_b.stopid] += new_pheromone_value
-            # self.updated_pheromoneMatrix[stop_b.stopid][stop.stopid] += new_pheromone_value
+        tours = [np.fromiter((stop.stop_id for stop in tour), dtype=np.intp, count=len(tour))
+                 for tour in ant.get_all_tours()]
+        self.update_pheromone_matrix_by_tours(tours, ant.get_travelled_distance())
 
+    def update_pheromone_matrix_by_tours(self, tours: object, travelled_distance: float) -> object:
+        """
+        Updates the pheromone matrix of the ant manager by the tours of one ant.
+        Every edge of the tours receives pheromone_constant / travelled distance in both directions.
+        :param tours: list of arrays of stop_ids, one per tour
+        :param travelled_distance: overall distance of the tours
+        :return: None
+        """
+        logger.debug('-updating pheromone matrix based on ant solution-')
+        self.microhub_counter = 0
+        slots_a = []
+        slots_b = []
+        for stop_ids in tours:
+            slots, self.microhub_counter = self.pheromone_matrix.get_tour_slots(stop_ids, self.microhub_counter)
+            slots_a.append(slots[:-1])
+            slots_b.append(slots[1:])
+        if not slots_a:
+            return
+        slots_a = np.concatenate(slots_a)
+        slots_b = np.concatenate(slots_b)
+        new_pheromone_value = float(self.pheromone_constant / travelled_distance)  # 1/Total Length
+        self.pheromone_matrix.deposit(slots_a, slots_b, np.full(len(slots_a), new_pheromone_value))
+
+    @timed('aco_run')
     def run_aco(self) -> object:
         """
         Runs the whole Ant colony optimization. Main Method of the class.
         :return: shortest overall distance, shortest path (tours), updated ant probability matrix
         """
-        print("-Running Colony Optimization-")
+        logger.info('-Running Colony Optimization-')
+        if self.workers > 1:
+            return self.run_aco_parallel()
         for iteration in range(self.iterations):
+            iteration_start = timer()
             for ant in self.ants:
                 ant.move_ant()
             self.ants = sorted(self.ants, key=lambda ant: ant.get_travelled_distance())
@@ -240,10 +195,47 @@ class AntManager:
                 self.first_run = False
 
             self.set_ants(self.start_stop)
-            # self.updated_pheromoneMatrix = [[0.0] * self.tour_size for _ in range(self.tour_size)]
-            for col in self.df_updated_pheromone_matrix.columns:
-                self.df_updated_pheromone_matrix[col].values[:] = 0.0
-            print('{0}/{1} Searching...'.format(iteration + 1, self.iterations))
+            add_duration('aco_run/aco_iteration', timer() - iteration_start)
+            increment('aco_ants', self.antCount)
+            logger.info('%d/%d Searching... (shortest distance %s)', iteration + 1, self.iterations,
+                        self.shortest_distance)
+
+        self.update_probability_matrix()
+
+        return self.shortest_distance, self.shortest_path, self.ant_probability_Matrix
+
+    def run_aco_parallel(self) -> object:
+        """
+        Runs the Ant colony optimization with the ants of every iteration moving in parallel worker processes.
+        The workers only return the tours as stop_ids, the pheromone update stays in this process. The ants use
+        their own random streams derived from one seed, winner_ant is not set.
+        :return: shortest overall distance, shortest path (tours), updated ant probability matrix
+        """
+        logger.info('-Running Colony Optimization with %d workers-', self.workers)
+        with ColonyPool(self.workers, self.nodes, self.distance_matrix, self.antWeight, self.antVolume,
+                        self.discountAlpha, self.discountBeta, self.pheromone_evaporation_coefficient,
+                        random.getrandbits(32), candidate_lists=self.candidate_lists) as colony_pool:
+            for iteration in range(self.iterations):
+                iteration_start = timer()
+                ant_solutions = colony_pool.construct_tours(self.pheromone_matrix, self.antCount, iteration,
+                                                            self.first_run)
+                ant_solutions = sorted(ant_solutions, key=lambda ant_solution: ant_solution[2])
+                for stop_ids, tour_lengths, travelled_distance in ant_solutions:
+                    tours = np.split(stop_ids, np.cumsum(tour_lengths)[:-1])
+                    self.update_pheromone_matrix_by_tours(tours, travelled_distance)
+                    if not self.shortest_distance or travelled_distance < self.shortest_distance:
+                        self.shortest_distance = travelled_distance
+                        self.shortest_path = [[self.nodes[stop_id] for stop_id in tour] for tour in tours]
+
+                self.update_pheromone_matrix()
+
+                if self.first_run:
+                    self.first_run = False
+
+                add_duration('aco_run/aco_iteration', timer() - iteration_start)
+                increment('aco_ants', self.antCount)
+                logger.info('%d/%d Searching... (shortest distance %s)', iteration + 1, self.iterations,
+                            self.shortest_distance)
 
         self.update_probability_matrix()
 
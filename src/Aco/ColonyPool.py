@@ -0,0 +1,166 @@
+import random
+from multiprocessing import Pool
+from multiprocessing.shared_memory import SharedMemory
+from typing import List, Tuple
+
+import numpy as np
+
+from src.Aco.Ant import Ant
+from src.Aco.PheromoneMatrix import PheromoneMatrix
+from src.Tour.DistanceMatrix import DistanceMatrix
+from src.Tour.StopIndex import StopIndex
+from src.Utils.logger import get_log_level, setup_logging
+
+# --------------------
+# WORKER STATE
+# set up once per worker process by init_colony_worker
+worker_state = dict()
+
+
+def init_colony_worker(stops, distance_shm_name, ant_weight, ant_volume, discount_alpha, discount_beta,
+                       pheromone_evaporation_coefficient, log_level, candidate_lists=None):
+    """
+    Attaches the worker process to the shared distance matrix and keeps the static colony settings.
+    """
+    setup_logging(log_level)
+    distance_shm = SharedMemory(name=distance_shm_name)
+    distances = np.ndarray((len(stops), len(stops)), dtype=np.float64, buffer=distance_shm.buf)
+    worker_state['stops'] = stops
+    worker_state['distance_shm'] = distance_shm
+    worker_state['distance_matrix'] = DistanceMatrix(distances, StopIndex(stops))
+    worker_state['ant_settings'] = (ant_weight, ant_volume)
+    worker_state['aco_settings'] = (discount_alpha, discount_beta, pheromone_evaporation_coefficient)
+    worker_state['pheromone_shm'] = None
+    worker_state['candidate_lists'] = candidate_lists
+
+
+def attach_pheromone_matrix(pheromone_shm_name, capacity, hub_slots):
+    """
+    :return: read-only pheromone matrix on the shared pheromone values of the current iteration
+    """
+    pheromone_shm = worker_state['pheromone_shm']
+    if pheromone_shm is None or pheromone_shm.name != pheromone_shm_name:
+        if pheromone_shm is not None:
+            pheromone_shm.close()
+        pheromone_shm = SharedMemory(name=pheromone_shm_name)
+        worker_state['pheromone_shm'] = pheromone_shm
+    values = np.ndarray((capacity, capacity), dtype=np.float64, buffer=pheromone_shm.buf)
+    return PheromoneMatrix.from_values([stop.hash_id for stop in worker_state['stops']], values, hub_slots)
+
+
+def construct_ant_tours(task):
+    """
+    Lets one ant construct its tours on the shared matrices.
+    :param task: (pheromone shm name, pheromone capacity, hub slots, first run, seed of the ant)
+    :return: stop_ids of all tours concatenated, length of every tour, travelled distance
+    """
+    pheromone_shm_name, capacity, hub_slots, first_run, seed = task
+    stops = worker_state['stops']
+    ant_weight, ant_volume = worker_state['ant_settings']
+    discount_alpha, discount_beta, pheromone_evaporation_coefficient = worker_state['aco_settings']
+    ant = Ant(stops[0], stops[0], ant_weight, ant_volume, stops, worker_state['distance_matrix'],
+              attach_pheromone_matrix(pheromone_shm_name, capacity, hub_slots), discount_alpha, discount_beta,
+              pheromone_evaporation_coefficient, first_run=first_run, rng=random.Random(seed),
+              candidate_lists=worker_state['candidate_lists'])
+    ant.move_ant()
+    tours = ant.get_all_tours()
+    stop_ids = np.fromiter((stop.stop_id for tour in tours for stop in tour), dtype=np.int32)
+    tour_lengths = np.fromiter((len(tour) for tour in tours), dtype=np.int32, count=len(tours))
+    return stop_ids, tour_lengths, ant.get_travelled_distance()
+
+
+class ColonyPool:
+    """
+    Pool of worker processes constructing the tours of the ants of one iteration in parallel.
+    The distance matrix is shared once, the pheromone values are published to shared memory before every
+    iteration. Every ant draws from its own random stream seeded by (seed, iteration, ant), so the result only
+    depends on the seed and not on the scheduling of the workers.
+    """
+
+    def __init__(self,
+                 workers: int,
+                 stops: List[object],
+                 distance_matrix: DistanceMatrix,
+                 ant_weight: float,
+                 ant_volume: float,
+                 discount_alpha: float,
+                 discount_beta: float,
+                 pheromone_evaporation_coefficient: float,
+                 seed: int,
+                 candidate_lists: np.ndarray = None) -> None:
+
+        # --------------------
+        # SHARED DISTANCES
+        self.distance_shm = SharedMemory(create=True, size=max(distance_matrix.distances.nbytes, 1))
+        distances = np.ndarray(distance_matrix.distances.shape, dtype=np.float64, buffer=self.distance_shm.buf)
+        distances[:] = distance_matrix.distances
+
+        # --------------------
+        # SHARED PHEROMONE
+        # reallocated when the pheromone matrix grows
+        self.pheromone_shm = None
+        self.pheromone_values = None
+
+        # --------------------
+        # SEEDING
+        self.seed = seed
+
+        # --------------------
+        # WORKERS
+        self.pool = Pool(processes=workers,
+                         initializer=init_colony_worker,
+                         initargs=(stops, self.distance_shm.name, ant_weight, ant_volume, discount_alpha,
+                                   discount_beta, pheromone_evaporation_coefficient, get_log_level(),
+                                   candidate_lists))
+
+    def __enter__(self) -> object:
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback) -> None:
+        self.close()
+
+    def publish_pheromone_matrix(self, pheromone_matrix: PheromoneMatrix) -> None:
+        """
+        Copies the pheromone values into shared memory.
+        :param pheromone_matrix: pheromone matrix of the ant manager
+        """
+        if self.pheromone_values is None or self.pheromone_values.shape != pheromone_matrix.values.shape:
+            self.release_pheromone_matrix()
+            self.pheromone_shm = SharedMemory(create=True, size=pheromone_matrix.values.nbytes)
+            self.pheromone_values = np.ndarray(pheromone_matrix.values.shape, dtype=np.float64,
+                                               buffer=self.pheromone_shm.buf)
+        self.pheromone_values[:] = pheromone_matrix.values
+
+    def release_pheromone_matrix(self) -> None:
+        """
+        Releases the shared pheromone values.
+        """
+        if self.pheromone_shm is not None:
+            self.pheromone_values = None
+            self.pheromone_shm.close()
+            self.pheromone_shm.unlink()
+            self.pheromone_shm = None
+
+    def construct_tours(self, pheromone_matrix: PheromoneMatrix, ant_count: int, iteration: int,
+                        first_run: bool) -> List[Tuple[np.ndarray, np.ndarray, float]]:
+        """
+        :param pheromone_matrix: pheromone matrix of the ant manager
+        :param ant_count: amount of ants
+        :param iteration: current iteration
+        :param first_run: whether the ants choose their stops randomly
+        :return: stop_ids, tour lengths and travelled distance of every ant, in ant order
+        """
+        self.publish_pheromone_matrix(pheromone_matrix)
+        tasks = [(self.pheromone_shm.name, pheromone_matrix.get_capacity(), pheromone_matrix.hub_slots, first_run,
+                  '{}/{}/{}'.format(self.seed, iteration, ant)) for ant in range(ant_count)]
+        return self.pool.map(construct_ant_tours, tasks)
+
+    def close(self) -> None:
+        """
+        Stops the workers and releases the shared memory.
+        """
+        self.pool.close()
+        self.pool.join()
+        self.release_pheromone_matrix()
+        self.distance_shm.close()
+        self.distance_shm.unlink()
@@ -0,0 +1,207 @@
+from typing import List, Tuple
+
+import numpy as np
+import pandas as pd
+
+
+class PheromoneMatrix:
+    """
+    Pheromone trails of the ant colony stored as a dense float64 matrix.
+    Rows and columns are slots: the stops (without the microhub) in stop_id order followed by the microhub visit
+    slots '{microhub_hash}/{microhub_counter}'. The matrix is preallocated with spare capacity for further microhub
+    visit slots, when the capacity is exhausted it is doubled.
+    Deposits of one iteration are collected in a second matrix of the same shape and applied after the evaporation.
+    """
+
+    HUB_SLOT_RESERVE = 16
+
+    def __init__(self,
+                 stop_hashes: List[str],
+                 hub_slot_reserve: int = HUB_SLOT_RESERVE) -> None:
+
+        # --------------------
+        # LABELS
+        # stop_hashes in stop_id order, the microhub first
+        self.stop_hashes = list(stop_hashes)
+        self.microhub_hash = self.stop_hashes[0]
+        self.stop_count = len(self.stop_hashes) - 1
+        self.hub_slots = 1
+        self.size = self.stop_count + self.hub_slots
+
+        # --------------------
+        # PHEROMONE / DEPOSITS
+        capacity = self.size + max(hub_slot_reserve, 1)
+        self.values = np.zeros((capacity, capacity), dtype=np.float64)
+        self.deposits = np.zeros((capacity, capacity), dtype=np.float64)
+
+        # --------------------
+        # SLOT -> STOP
+        # every microhub visit slot belongs to the microhub (stop_id 0)
+        self.slot_stops = np.zeros(capacity, dtype=np.intp)
+        self.slot_stops[:self.stop_count] = np.arange(1, self.stop_count + 1)
+
+    @classmethod
+    def from_values(cls, stop_hashes: List[str], values: np.ndarray, hub_slots: int) -> object:
+        """
+        Wraps existing pheromone values (e.g. in shared memory) without copying them. The wrapper only supports
+        reading, it holds no deposits.
+        :param stop_hashes: stop hash_ids in stop_id order, the microhub first
+        :param values: (capacity x capacity)-array of pheromone values
+        :param hub_slots: amount of used microhub visit slots
+        :return: pheromone matrix
+        """
+        pheromone_matrix = PheromoneMatrix.__new__(PheromoneMatrix)
+        pheromone_matrix.stop_hashes = list(stop_hashes)
+        pheromone_matrix.microhub_hash = pheromone_matrix.stop_hashes[0]
+        pheromone_matrix.stop_count = len(pheromone_matrix.stop_hashes) - 1
+        pheromone_matrix.hub_slots = hub_slots
+        pheromone_matrix.size = pheromone_matrix.stop_count + hub_slots
+        pheromone_matrix.values = values
+        pheromone_matrix.deposits = None
+        pheromone_matrix.slot_stops = None
+        return pheromone_matrix
+
+    def __len__(self) -> int:
+        return self.size
+
+    def get_capacity(self) -> int:
+        """
+        :return: amount of allocated rows/columns
+        """
+        return self.values.shape[0]
+
+    def get_matrix(self) -> np.ndarray:
+        """
+        :return: view on the used part of the pheromone matrix
+        """
+        return self.values[:self.size, :self.size]
+
+    def get_labels(self) -> List[str]:
+        """
+        :return: row/column labels of the used slots
+        """
+        return self.stop_hashes[1:] + ['{}/{}'.format(self.microhub_hash, counter)
+                                       for counter in range(self.hub_slots)]
+
+    def get_slot_stops(self) -> np.ndarray:
+        """
+        :return: stop_id of every used slot
+        """
+        return self.slot_stops[:self.size]
+
+    def get_slot(self, stop_id: int, microhub_counter: int) -> int:
+        """
+        :param stop_id: stop_id of given stop
+        :param microhub_counter: counter of the microhub visit, only used for the microhub
+        :return: slot of the stop, slots of microhub visits may not be allocated yet
+        """
+        if stop_id == 0:
+            return self.stop_count + microhub_counter
+        return stop_id - 1
+
+    def get_slots(self, stop_ids: np.ndarray, microhub_counter: int) -> np.ndarray:
+        """
+        :param stop_ids: array of stop_ids
+        :param microhub_counter: counter of the microhub visit, only used for the microhub
+        :return: array of slots of the stops
+        """
+        return np.where(stop_ids == 0, self.stop_count + microhub_counter, stop_ids - 1)
+
+    def get_tour_slots(self, stop_ids: np.ndarray, microhub_counter: int) -> Tuple[np.ndarray, int]:
+        """
+        Translates a tour into slots. Every arrival at the microhub increases the microhub counter, the following
+        departure uses the same counter.
+        :param stop_ids: array of stop_ids of the tour
+        :param microhub_counter: microhub counter at the first stop of the tour
+        :return: array of slots, microhub counter at the last stop of the tour
+        """
+        is_microhub = stop_ids == 0
+        counters = np.full(len(stop_ids), microhub_counter, dtype=np.intp)
+        counters[1:] += np.cumsum(is_microhub[1:])
+        slots = np.where(is_microhub, self.stop_count + counters, stop_ids - 1)
+        return slots, int(counters[-1]) if len(counters) else microhub_counter
+
+    def get_pheromone(self, row: int, col: int) -> float:
+        """
+        :param row: row slot
+        :param col: column slot
+        :return: pheromone of the cell, 0.0 for unallocated microhub visit slots
+        """
+        if row >= self.size or col >= self.size:
+            return 0.0
+        return self.values.item(row, col)
+
+    def get_pheromones(self, row: int, cols: np.ndarray) -> np.ndarray:
+        """
+        :param row: row slot
+        :param cols: column slots
+        :return: pheromones of the given cells, 0.0 for unallocated microhub visit slots
+        """
+        if row >= self.size:
+            return np.zeros(len(cols), dtype=np.float64)
+        return np.where(cols < self.size, self.values[row, np.minimum(cols, self.size - 1)], 0.0)
+
+    def ensure_hub_slots(self, hub_slots: int) -> None:
+        """
+        Allocates microhub visit slots up to the given amount, new slots are filled with 0.0.
+        :param hub_slots: required amount of microhub visit slots
+        """
+        if hub_slots <= self.hub_slots:
+            return
+        size = self.stop_count + hub_slots
+        if size > self.get_capacity():
+            self.grow(max(2 * self.get_capacity(), size))
+        self.hub_slots = hub_slots
+        self.size = size
+
+    def grow(self, capacity: int) -> None:
+        """
+        Reallocates the pheromone and deposit matrix with the given capacity.
+        :param capacity: new amount of allocated rows/columns
+        """
+        values = np.zeros((capacity, capacity), dtype=np.float64)
+        values[:self.size, :self.size] = self.get_matrix()
+        deposits = np.zeros((capacity, capacity), dtype=np.float64)
+        deposits[:self.size, :self.size] = self.deposits[:self.size, :self.size]
+        slot_stops = np.zeros(capacity, dtype=np.intp)
+        slot_stops[:self.stop_count] = self.slot_stops[:self.stop_count]
+        self.values = values
+        self.deposits = deposits
+        self.slot_stops = slot_stops
+
+    def deposit(self, slots_a: np.ndarray, slots_b: np.ndarray, amounts: np.ndarray) -> None:
+        """
+        Scatter-adds the amounts on both directions of the given edges. Edges are applied in the given order, the
+        way (a, b) before (b, a).
+        :param slots_a: slots of the points of departure
+        :param slots_b: slots of the final points
+        :param amounts: pheromone amount of every edge
+        """
+        if len(slots_a) == 0:
+            return
+        highest_slot = max(int(slots_a.max()), int(slots_b.max()))
+        self.ensure_hub_slots(highest_slot - self.stop_count + 1)
+        rows = np.column_stack((slots_a, slots_b)).ravel()
+        cols = np.column_stack((slots_b, slots_a)).ravel()
+        np.add.at(self.deposits, (rows, cols), np.repeat(amounts, 2))
+
+    def evaporate(self, evaporation_coefficient: float) -> None:
+        """
+        :param evaporation_coefficient: share of the pheromone that evaporates
+        """
+        self.values[:self.size, :self.size] *= (1 - evaporation_coefficient)
+
+    def apply_deposits(self) -> None:
+        """
+        Adds the collected deposits to the pheromone and empties the deposits.
+        """
+        self.values[:self.size, :self.size] += self.deposits[:self.size, :self.size]
+        self.deposits[:self.size, :self.size] = 0.0
+
+    def to_dataframe(self, values: np.ndarray = None) -> pd.DataFrame:
+        """
+        :param values: (size x size)-array with the same slots, the pheromone matrix if None
+        :return: values as DataFrame with slot labels as index and columns
+        """
+        labels = self.get_labels()
+        return pd.DataFrame(self.get_matrix() if values is None else values, index=labels, columns=labels)
@@ -1,19 +1,25 @@
+import numpy as np
+
+
 class VRPEnvironment:
     def __init__(self,
                  states,
                  actions,
                  distance_matrix,
+                 stop_index,
                  microhub,
                  capacity_demands,
                  vehicles,
                  vehicle_weight,
-                 vehicle_volume):
+                 vehicle_volume,
+                 candidate_lists=None):
 
         # --------------------
         # STATES / ACTIONS
         self.states = states
         self.actions = actions
         self.distance_matrix = distance_matrix
+        self.stop_index = stop_index
         self.microhub = microhub
         self.microhub_counter = 0
 
@@ -26,26 +32,61 @@ class VRPEnvironment:
 
         # --------------------
         # META/MICRO INFORMATION
-        self.current_state = None
-        self.current_state = [self.microhub if self.current_state is None else self.current_state]
-        self.possible_stops = []
+        self.current_state = self.microhub
         self.done = False
 
+        # --------------------
+        # CANDIDATE LISTS
+        # (stops x k)-array of the nearest stop indices of every stop (e.g. by NeighborIndex.get_neighbors), the
+        # legal next states are searched among them first, None searches all possible stops
+        self.candidate_lists = candidate_lists
+
+        # --------------------
+        # DEMANDS / FEASIBILITY
+        # arrays by stop index (stop.stop_id). A stop is possible while it is not visited, and feasible while it is
+        # possible and fits into the current tour. Since the tour only gets fuller, the stops that do not fit anymore
+        # are removed from the feasibility mask along the heaviest/largest first orderings.
+        self.state_hashes = [state.hash_id for state in states]
+        self.demand_weights = np.array([float(state.demand_weight) for state in states], dtype=np.float64)
+        self.demand_volumes = np.array([float(state.demand_volume) for state in states], dtype=np.float64)
+        # ordering of the bin packing: highest weight first, then highest volume, then stop index
+        self.capacity_ordering = np.lexsort((np.arange(len(states)), -self.demand_volumes, -self.demand_weights))
+        self.capacity_ranks = np.empty_like(self.capacity_ordering)
+        self.capacity_ranks[self.capacity_ordering] = np.arange(len(states))
+        self.volume_ordering = np.argsort(-self.demand_volumes, kind='stable')
+        self.initial_possible_mask = np.ones(len(states), dtype=bool)
+        self.initial_possible_mask[self.microhub.stop_id] = False
+        # stops sharing the hash_id of the microhub are never legal next states
+        self.selectable_mask = np.array([state.hash_id != self.microhub.hash_id for state in states], dtype=bool)
+        self.possible_mask = np.zeros(len(states), dtype=bool)
+        self.possible_count = 0
+        self.feasible_mask = np.zeros(len(states), dtype=bool)
+        self.weight_position = 0
+        self.volume_position = 0
+        self.microhub_indices = np.array([self.microhub.stop_id], dtype=np.intp)
+
         # --------------------
         # TOURS META
-        self.all_tours = []
-        self.current_tour = []
-        self.current_tour.append(self.current_state)
         self.current_tour_weight = 0.0
         self.current_tour_volume = 0.0
 
+        # --------------------
+        # TOUR BUFFER
+        # stop indices of the episode in visiting order, consecutive tours share their microhub visit:
+        # tour i is tour_stops[tour_ends[i - 1]:tour_ends[i] + 1] (the first tour starts at 0)
+        self.tour_stops = np.zeros(2 * len(states) + 2, dtype=np.intp)
+        self.tour_ends = np.zeros(len(states) + 1, dtype=np.intp)
+        self.tour_length = 0
+        self.tour_count = 0
+
         # --------------------
         # ON INIT
         self.reset_possible_stops()
+        self.reset_tours()
 
     def reset(self) -> object:
         """
-        Resets whole environment to initialization state.
+        Resets whole environment to initialization state. Only the preallocated arrays are refilled.
         :return: starting state (depot)
         """
         self.done = False
@@ -59,7 +100,7 @@ class VRPEnvironment:
         Does a step in the environment following an given action by the agent.
         :param action: choosed action by the agent
         :param suggested_next_state: suggested next state by the agent
-        :return: next_state, reward, boolean done, current_tour, all_tours
+        :return: next_state, reward, boolean done, current_tour, tour_ends (see get_current_tour and get_tour_ends)
         """
         if action == 0:
             return self.evaluate_action_0()
@@ -73,78 +114,146 @@ class VRPEnvironment:
     def evaluate_action_0(self) -> object:
         """
         Evaluates action 0, that the next stop will be the microhub but there are still possible stops left.
-        :return: next_state, reward, boolean done, current_tour, all_tours
+        :return: next_state, reward, boolean done, current_tour, tour_ends
         """
         next_state = self.get_microhub()
         reward = self.reward_func(self.current_state, next_state)
-        self.current_tour.append(next_state)
+        self.append_tour_stop(next_state.stop_id)
         self.current_state = next_state
         self.reset_tour()
-        return next_state, reward, self.done, self.current_tour, self.all_tours
+        return next_state, reward, self.done, self.get_current_tour(), self.get_tour_ends()
 
     def evaluate_action_1(self, suggested_next_state: object) -> object:
         """
         Evaluates action 1, that the next stop will be one of the possible stops but there are still more possible stops left.
         :param suggested_next_state: suggested next state by the agent
-        :return: next_state, reward, boolean done, current_tour, all_tours
+        :return: next_state, reward, boolean done, current_tour, tour_ends
         """
         next_state = self.get_state_by_hash(suggested_next_state)
         reward = self.reward_func(self.current_state, next_state)
         self.current_state = next_state
         self.update_tour_meta(next_state)
-        return next_state, reward, self.done, self.current_tour, self.all_tours
+        return next_state, reward, self.done, self.get_current_tour(), self.get_tour_ends()
 
     def evaluate_action_2(self) -> object:
         """
         Evaluates action 2, that the next stop will be the microhub and there no possible stops left.
-        :return: next_state, reward, boolean done, current_tour, all_tours
+        :return: next_state, reward, boolean done, current_tour, tour_ends
         """
         next_state = self.get_microhub()
         reward = self.reward_func(self.current_state, next_state)
-        self.current_tour.append(next_state)
+        self.append_tour_stop(next_state.stop_id)
         self.current_state = next_state
         self.done = True
         self.reset_tour()
-        return next_state, reward, self.done, self.current_tour, self.all_tours
+        return next_state, reward, self.done, self.get_current_tour(), self.get_tour_ends()
 
     def reset_possible_stops(self) -> object:
         """
-        Resets the list of possible stops and loads all states expect the microhub.
+        Marks all states expect the microhub as possible stops.
         :return: None
         """
-        copy_states = self.states.copy()
-        copy_states.remove(self.microhub)
         self.current_state = self.microhub
-        self.possible_stops = copy_states
+        np.copyto(self.possible_mask, self.initial_possible_mask)
+        self.possible_count = len(self.states) - 1
+        self.reset_feasibility()
 
     def reset_tours(self) -> object:
         """
         Resets tour and all tours, aswell as the tour meta data.
         :return: None
         """
-        self.all_tours = []
-        self.current_tour = []
-        self.current_tour.append(self.current_state)
+        self.tour_length = 0
+        self.tour_count = 0
+        self.append_tour_stop(self.current_state.stop_id)
         self.current_tour_weight = 0.0
         self.current_tour_volume = 0.0
+        self.reset_feasibility()
 
     def reset_tour(self) -> object:
         """
-        Resets tour and tour meta data. Adds the previous tour to all tours and adds the microhub as the first stop
-        of the current tour.
+        Resets tour and tour meta data. Finishes the previous tour, its closing microhub visit is the first stop of
+        the current tour.
         :return: None
         """
-        self.all_tours.append(self.current_tour)
-        self.current_tour = []
-        self.current_tour.append(self.current_state)
+        if self.tour_count == len(self.tour_ends):
+            self.tour_ends = np.concatenate((self.tour_ends, np.zeros_like(self.tour_ends)))
+        self.tour_ends[self.tour_count] = self.tour_length - 1
+        self.tour_count += 1
         self.current_tour_weight = 0.0
         self.current_tour_volume = 0.0
+        self.reset_feasibility()
 
     def update_tour_meta(self, next_state: object) -> object:
-        self.possible_stops.remove(next_state)
-        self.current_tour.append(next_state)
+        self.possible_mask[next_state.stop_id] = False
+        self.possible_count -= 1
+        self.feasible_mask[next_state.stop_id] = False
+        self.append_tour_stop(next_state.stop_id)
         self.current_tour_weight += next_state.demand_weight
         self.current_tour_volume += next_state.demand_volume
+        self.update_feasibility()
+
+    def append_tour_stop(self, stop_id: int) -> object:
+        """
+        Appends a stop to the tour buffer, the buffer is doubled when it is full.
+        :param stop_id: index of the stop
+        :return: None
+        """
+        if self.tour_length == len(self.tour_stops):
+            self.tour_stops = np.concatenate((self.tour_stops, np.zeros_like(self.tour_stops)))
+        self.tour_stops[self.tour_length] = stop_id
+        self.tour_length += 1
+
+    def get_current_tour(self) -> object:
+        """
+        :return: stop indices of the current tour (view on the tour buffer, valid until the next reset)
+        """
+        return self.tour_stops[self.tour_ends[self.tour_count - 1] if self.tour_count else 0:self.tour_length]
+
+    def get_tour_ends(self) -> object:
+        """
+        :return: positions of the closing microhub visits of the finished tours in the tour buffer (view, valid until
+        the next reset)
+        """
+        return self.tour_ends[:self.tour_count]
+
+    def get_all_tours(self) -> object:
+        """
+        :return: finished tours as lists of stops
+        """
+        tour_starts = [0] + self.tour_ends[:self.tour_count - 1].tolist() if self.tour_count else []
+        return [[self.states[stop_id] for stop_id in self.tour_stops[tour_start:tour_end + 1].tolist()]
+                for tour_start, tour_end in zip(tour_starts, self.tour_ends[:self.tour_count].tolist())]
+
+    def reset_feasibility(self) -> object:
+        """
+        Marks every possible stop as feasible again (e.g. for a new tour) and removes the ones exceeding the capacity
+        of the current tour.
+        :return: None
+        """
+        np.logical_and(self.possible_mask, self.selectable_mask, out=self.feasible_mask)
+        self.weight_position = 0
+        self.volume_position = 0
+        self.update_feasibility()
+
+    def update_feasibility(self) -> object:
+        """
+        Removes the stops that do not fit into the current tour anymore from the feasibility mask. The stops are
+        checked heaviest (largest) first and only once per tour, as the remaining capacity only shrinks.
+        :return: None
+        """
+        while self.weight_position < len(self.capacity_ordering):
+            stop_id = self.capacity_ordering[self.weight_position]
+            if self.demand_weights[stop_id] + self.current_tour_weight <= self.vehicle_weight:
+                break
+            self.feasible_mask[stop_id] = False
+            self.weight_position += 1
+        while self.volume_position < len(self.volume_ordering):
+            stop_id = self.volume_ordering[self.volume_position]
+            if self.demand_volumes[stop_id] + self.current_tour_volume <= self.vehicle_volume:
+                break
+            self.feasible_mask[stop_id] = False
+            self.volume_position += 1
 
     def reward_func(self, current_stop: object, next_stop: object) -> object:
         """
@@ -152,7 +261,7 @@ class VRPEnvironment:
         :param next_stop: next possible stop
         :return: reward of traversing between the given stops
         """
-        reward = self.distance_matrix.at[current_stop.hash_id, next_stop.hash_id]
+        reward = self.distance_matrix.get_distance(current_stop.stop_id, next_stop.stop_id)
         return reward
 
     def reward_func_hash(self, current_stop: float, next_stop: float) -> object:
@@ -161,7 +270,14 @@ class VRPEnvironment:
         :param next_stop: next possible stop hash
         :return: reward of traversing between the given stops
         """
-        return self.distance_matrix.at[current_stop, next_stop]
+        return self.distance_matrix.get_distance_by_hash(current_stop, next_stop)
+
+    def expected_rewards(self, next_state_probabilities: object) -> object:
+        """
+        :param next_state_probabilities: probability of every state (in state order) to be the next stop
+        :return: expected reward of traversing from every state to the next stop
+        """
+        return self.distance_matrix.distances @ next_state_probabilities
 
     def get_capacity_demand_of_stop(self, stop_hash: float) -> object:
         """
@@ -187,7 +303,7 @@ class VRPEnvironment:
         :param hashIdentifier: hash_id of given stop
         :return: stop by hash_id
         """
-        return next((state for state in self.states if state.hash_id == hashIdentifier), None)
+        return self.stop_index.get_stop_by_hash(hashIdentifier)
 
     def get_all_state_hashes(self) -> object:
         """
@@ -195,62 +311,87 @@ class VRPEnvironment:
         """
         return [state.hash_id for state in self.states]
 
-    def possible_rewards(self, state: object, action_space_list: object) -> object:
+    def possible_rewards(self, state: object, action_space_indices: object) -> object:
         """
-        :param state: current state hash_id
-        :param action_space_list: list of possible next states hash_ids
-        :return: list of possible rewards
+        :param state: current state
+        :param action_space_indices: list of possible next state indices
+        :return: array of possible rewards
         """
-        possible_rewards = self.distance_matrix.loc[state, action_space_list]
+        possible_rewards = self.distance_matrix.get_distances_from(state.stop_id, action_space_indices)
         return possible_rewards
 
+    def get_legal_stop_ids(self) -> object:
+        """
+        :return: indices of the feasible stops, among the nearest stops of the current state first (nearest first)
+        if there are candidate lists, otherwise in index order
+        """
+        if self.candidate_lists is not None:
+            candidates = self.candidate_lists[self.current_state.stop_id]
+            legal_stop_ids = candidates[self.feasible_mask[candidates]]
+            if len(legal_stop_ids):
+                return legal_stop_ids
+        return np.flatnonzero(self.feasible_mask)
+
+    @staticmethod
+    def order_by(ordering: object, ranks: object, stop_ids: object) -> object:
+        """
+        :param ordering: precomputed ordering of all stops
+        :param ranks: position of every stop in the ordering
+        :param stop_ids: indices of the stops to be ordered
+        :return: indices of the stops in the order of the ordering
+        """
+        if len(stop_ids) * 8 < len(ordering):
+            return stop_ids[np.argsort(ranks[stop_ids], kind='stable')]
+        selected = np.zeros(len(ordering), dtype=bool)
+        selected[stop_ids] = True
+        return ordering[selected[ordering]]
+
     def get_next_legal_action(self) -> object:
         """
-        :return: action, legal next states, legal next states with hub counter ignored, local search distances,
+        The legal next states are the stops of the feasibility mask, with candidate lists the nearest feasible stops
+        of the current state (all feasible stops only if none of them is feasible). The local search distances are
+        ranked by the precomputed distance ordering of the current state, the bin packing capacities by the
+        heaviest first ordering.
+        :return: action, legal next states, legal next state indices (hub counter ignored), local search distances,
         bin packing capacities, microhub counter
         """
-        legal_next_states = []
-        legal_next_states_hubs_ignored = []
+        legal_stop_ids = self.get_legal_stop_ids()
+        legal_next_states = [self.state_hashes[stop_id] for stop_id in legal_stop_ids.tolist()]
+        legal_next_state_indices = legal_stop_ids
         legal_next_states_local_search_distance = dict()
         legal_next_states_bin_packing_capacities = dict()
 
-        for stop in self.possible_stops:
-            possible_tour_weight = float(stop.demand_weight) + self.current_tour_weight
-            possible_tour_volume = float(stop.demand_volume) + self.current_tour_volume
-            if possible_tour_weight <= self.vehicle_weight and possible_tour_volume <= self.vehicle_volume:
-                if stop.hash_id == self.microhub.hash_id:
-                    continue
-                else:
-                    legal_next_states.append(stop.hash_id)
-                    legal_next_states_hubs_ignored.append(stop.hash_id)
-                    legal_next_states_local_search_distance[stop.hash_id] = self.reward_func(
-                        self.current_state, stop)
-                    legal_next_states_bin_packing_capacities[stop.hash_id] = [
-                        possible_tour_weight / self.vehicle_weight, possible_tour_volume / self.vehicle_volume]
-
-        legal_next_states_local_search_distance = {k: v for k, v in
-                                                   sorted(legal_next_states_local_search_distance.items(),
-                                                          key=lambda x: x[1])}
-        legal_next_states_bin_packing_capacities = {k: v for k, v in
-                                                     sorted(legal_next_states_bin_packing_capacities.items(),
-                                                            key=lambda x: x[1], reverse=True)}
+        if legal_next_states:
+            distance_ordering, distance_ranks = self.distance_matrix.get_ordering(self.current_state.stop_id)
+            distance_ranked = self.order_by(distance_ordering, distance_ranks, legal_stop_ids)
+            legal_next_states_local_search_distance = dict(zip(
+                [self.state_hashes[stop_id] for stop_id in distance_ranked],
+                self.distance_matrix.get_distances_from(self.current_state.stop_id, distance_ranked)))
+            capacity_ranked = self.order_by(self.capacity_ordering, self.capacity_ranks, legal_stop_ids)
+            weight_utilizations = (self.demand_weights[capacity_ranked] + self.current_tour_weight) / self.vehicle_weight
+            volume_utilizations = (self.demand_volumes[capacity_ranked] + self.current_tour_volume) / self.vehicle_volume
+            legal_next_states_bin_packing_capacities = {
+                self.state_hashes[stop_id]: [weight_utilization, volume_utilization]
+                for stop_id, weight_utilization, volume_utilization in zip(capacity_ranked.tolist(),
+                                                                          weight_utilizations.tolist(),
+                                                                          volume_utilizations.tolist())}
 
         if legal_next_states:
             action = 1
-            return action, legal_next_states, legal_next_states_hubs_ignored, legal_next_states_local_search_distance, legal_next_states_bin_packing_capacities, self.microhub_counter
+            return action, legal_next_states, legal_next_state_indices, legal_next_states_local_search_distance, legal_next_states_bin_packing_capacities, self.microhub_counter
 
-        if not legal_next_states and not self.possible_stops:
+        if not legal_next_states and not self.possible_count:
             microhub_counter = self.microhub_counter + 1
             legal_next_states.append('{}/{}'.format(self.microhub.hash_id, microhub_counter))
-            legal_next_states_hubs_ignored.append(self.microhub.hash_id)
+            legal_next_state_indices = self.microhub_indices
             action = 2
             self.microhub_counter += 1
-            return action, legal_next_states, legal_next_states_hubs_ignored, legal_next_states_local_search_distance, legal_next_states_bin_packing_capacities, self.microhub_counter
+            return action, legal_next_states, legal_next_state_indices, legal_next_states_local_search_distance, legal_next_states_bin_packing_capacities, self.microhub_counter
 
-        if not legal_next_states and self.possible_stops:
+        if not legal_next_states and self.possible_count:
             microhub_counter = self.microhub_counter + 1
             legal_next_states.append('{}/{}'.format(self.microhub.hash_id, microhub_counter))
-            legal_next_states_hubs_ignored.append(self.microhub.hash_id)
+            legal_next_state_indices = self.microhub_indices
             action = 0
             self.microhub_counter += 1
-            return action, legal_next_states, legal_next_states_hubs_ignored, legal_next_states_local_search_distance, legal_next_states_bin_packing_capacities, self.microhub_counter
+            return action, legal_next_states, legal_next_state_indices, legal_next_states_local_search_distance, legal_next_states_bin_packing_capacities, self.microhub_counter
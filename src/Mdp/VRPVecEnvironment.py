@@ -0,0 +1,201 @@
+import numpy as np
+
+
+class VRPVecEnvironment:
+    """
+    Batch of independent episodes on the instance of one VRPEnvironment, stepped in lockstep.
+    The state of all episodes is kept in (episodes x stops)-arrays by stop index (stop.stop_id): possible stops,
+    tour loads, current positions and microhub counters. One call of step advances every running episode, the legal
+    next states are returned as boolean masks. The rules are the ones of VRPEnvironment, the feasibility of all
+    episodes is evaluated at once instead of along the capacity orderings.
+    """
+
+    def __init__(self,
+                 env,
+                 batch_size):
+
+        # --------------------
+        # INSTANCE
+        # shared with the given environment, only read
+        self.env = env
+        self.states = env.states
+        self.distances = env.distance_matrix.distances
+        self.demand_weights = env.demand_weights
+        self.demand_volumes = env.demand_volumes
+        self.capacity_ranks = env.capacity_ranks
+        self.vehicle_weight = env.vehicle_weight
+        self.vehicle_volume = env.vehicle_volume
+        self.selectable_mask = env.selectable_mask
+        self.initial_possible_mask = env.initial_possible_mask
+        self.candidate_lists = env.candidate_lists
+        self.microhub_index = env.microhub.stop_id
+
+        # --------------------
+        # EPISODES
+        self.batch_size = batch_size
+        self.episode_indices = np.arange(batch_size)
+        self.positions = np.full(batch_size, self.microhub_index, dtype=np.intp)
+        self.microhub_counters = np.zeros(batch_size, dtype=np.int64)
+        self.dones = np.zeros(batch_size, dtype=bool)
+
+        # --------------------
+        # DEMANDS / FEASIBILITY
+        self.possible_masks = np.zeros((batch_size, len(self.states)), dtype=bool)
+        self.possible_counts = np.zeros(batch_size, dtype=np.int64)
+        self.tour_weights = np.zeros(batch_size, dtype=np.float64)
+        self.tour_volumes = np.zeros(batch_size, dtype=np.float64)
+
+        # --------------------
+        # TOUR BUFFERS
+        # one row per episode, laid out like the tour buffer of VRPEnvironment
+        self.tour_stops = np.zeros((batch_size, 2 * len(self.states) + 2), dtype=np.intp)
+        self.tour_ends = np.zeros((batch_size, len(self.states) + 1), dtype=np.intp)
+        self.tour_lengths = np.zeros(batch_size, dtype=np.int64)
+        self.tour_counts = np.zeros(batch_size, dtype=np.int64)
+
+        # --------------------
+        # ON INIT
+        self.reset()
+
+    def __len__(self) -> int:
+        return self.batch_size
+
+    def reset(self) -> object:
+        """
+        Resets all episodes to the initialization state.
+        :return: current positions (stop indices) of the episodes
+        """
+        self.positions[:] = self.microhub_index
+        self.microhub_counters[:] = 0
+        self.dones[:] = False
+        self.possible_masks[:] = self.initial_possible_mask
+        self.possible_counts[:] = len(self.states) - 1
+        self.tour_weights[:] = 0.0
+        self.tour_volumes[:] = 0.0
+        self.tour_lengths[:] = 0
+        self.tour_counts[:] = 0
+        self.append_tour_stops(self.episode_indices, self.positions)
+        return self.positions.copy()
+
+    def get_feasible_masks(self) -> object:
+        """
+        :return: (episodes x stops)-mask of the possible stops fitting into the current tour of every episode
+        """
+        feasible_masks = self.possible_masks & self.selectable_mask
+        feasible_masks &= self.demand_weights + self.tour_weights[:, None] <= self.vehicle_weight
+        feasible_masks &= self.demand_volumes + self.tour_volumes[:, None] <= self.vehicle_volume
+        feasible_masks[self.dones] = False
+        return feasible_masks
+
+    def get_legal_masks(self) -> object:
+        """
+        With candidate lists the legal next states of an episode are its feasible nearest stops of the current
+        position, all feasible stops only if none of them is feasible.
+        :return: (episodes x stops)-mask of the legal next states of every episode
+        """
+        feasible_masks = self.get_feasible_masks()
+        if self.candidate_lists is None or not self.candidate_lists.shape[1]:
+            return feasible_masks
+        candidates = self.candidate_lists[self.positions]
+        feasible_candidates = feasible_masks[self.episode_indices[:, None], candidates]
+        restricted = feasible_candidates.any(axis=1)
+        legal_masks = feasible_masks
+        legal_masks[restricted] = False
+        legal_masks[self.episode_indices[restricted, None], candidates[restricted]] = feasible_candidates[restricted]
+        return legal_masks
+
+    def get_next_legal_actions(self) -> object:
+        """
+        Action of every running episode like VRPEnvironment.get_next_legal_action: 1 if there are legal next states,
+        otherwise 0 (return to the microhub) or 2 (return to the microhub, no possible stops left). The microhub
+        counter of an episode returning to the microhub is increased. Finished episodes get the action -1.
+        :return: actions, (episodes x stops)-mask of the legal next states, microhub counters
+        """
+        legal_masks = self.get_legal_masks()
+        actions = np.where(legal_masks.any(axis=1), 1, np.where(self.possible_counts > 0, 0, 2))
+        actions[self.dones] = -1
+        self.microhub_counters[(actions == 0) | (actions == 2)] += 1
+        return actions, legal_masks, self.microhub_counters.copy()
+
+    def step(self, actions: object, next_stops: object) -> object:
+        """
+        Does a step in every running episode.
+        :param actions: actions of the episodes (by get_next_legal_actions)
+        :param next_stops: indices of the chosen next stops, ignored for the actions 0, 2 and -1
+        :return: next positions, rewards, dones
+        """
+        running = actions >= 0
+        to_microhub = (actions == 0) | (actions == 2)
+        targets = np.where(to_microhub, self.microhub_index, next_stops)
+        rewards = np.zeros(self.batch_size, dtype=np.float64)
+        rewards[running] = self.distances[self.positions[running], targets[running]]
+
+        # --------------------
+        # ACTION 1
+        # visit the chosen stop
+        visits = np.flatnonzero(actions == 1)
+        visited = targets[visits]
+        self.possible_masks[visits, visited] = False
+        self.possible_counts[visits] -= 1
+        self.tour_weights[visits] += self.demand_weights[visited]
+        self.tour_volumes[visits] += self.demand_volumes[visited]
+
+        # --------------------
+        # ACTION 0 / 2
+        # return to the microhub, action 2 finishes the episode
+        self.append_tour_stops(np.flatnonzero(running), targets[running])
+        self.finish_tours(np.flatnonzero(to_microhub))
+        self.dones |= actions == 2
+
+        self.positions[running] = targets[running]
+        return self.positions.copy(), rewards, self.dones.copy()
+
+    def append_tour_stops(self, episodes: object, stop_ids: object) -> object:
+        """
+        Appends one stop to the tour buffer of every given episode, the buffers are doubled when one is full.
+        :param episodes: indices of the episodes
+        :param stop_ids: stop index per episode
+        :return: None
+        """
+        if len(episodes) and self.tour_lengths[episodes].max() == self.tour_stops.shape[1]:
+            self.tour_stops = np.concatenate((self.tour_stops, np.zeros_like(self.tour_stops)), axis=1)
+        self.tour_stops[episodes, self.tour_lengths[episodes]] = stop_ids
+        self.tour_lengths[episodes] += 1
+
+    def finish_tours(self, episodes: object) -> object:
+        """
+        Finishes the current tour of every given episode, its closing microhub visit is the first stop of the next
+        tour.
+        :param episodes: indices of the episodes
+        :return: None
+        """
+        if len(episodes) and self.tour_counts[episodes].max() == self.tour_ends.shape[1]:
+            self.tour_ends = np.concatenate((self.tour_ends, np.zeros_like(self.tour_ends)), axis=1)
+        self.tour_ends[episodes, self.tour_counts[episodes]] = self.tour_lengths[episodes] - 1
+        self.tour_counts[episodes] += 1
+        self.tour_weights[episodes] = 0.0
+        self.tour_volumes[episodes] = 0.0
+
+    def get_possible_rewards(self) -> object:
+        """
+        :return: (episodes x stops)-array of the rewards of traversing from the current positions to every stop
+        """
+        return self.distances[self.positions]
+
+    def get_tour_stop_ids(self, episode: int) -> object:
+        """
+        :param episode: index of the episode
+        :return: finished tours of the episode as lists of stop indices
+        """
+        tour_count = int(self.tour_counts[episode])
+        tour_ends = self.tour_ends[episode, :tour_count].tolist()
+        tour_starts = [0] + tour_ends[:-1] if tour_count else []
+        return [self.tour_stops[episode, tour_start:tour_end + 1].tolist()
+                for tour_start, tour_end in zip(tour_starts, tour_ends)]
+
+    def get_all_tours(self, episode: int) -> object:
+        """
+        :param episode: index of the episode
+        :return: finished tours of the episode as lists of stops
+        """
+        return [[self.states[stop_id] for stop_id in tour] for tour in self.get_tour_stop_ids(episode)]
@@ -0,0 +1,112 @@
+import numpy as np
+
+
+class EpisodeBuffer:
+    """
+    Fixed-capacity, columnar memory of one episode.
+    Every step is stored as integer state indices (stop_id), the legal next states of a step are packed into one
+    candidate array and addressed by offsets, so a rollout allocates no per-step Python objects.
+    """
+
+    def __init__(self,
+                 max_steps,
+                 candidate_capacity=None):
+
+        # --------------------
+        # STEP COLUMNS
+        self.capacity = max_steps
+        self.states = np.zeros(max_steps, dtype=np.int32)
+        self.actions = np.zeros(max_steps, dtype=np.int8)
+        self.action_space_probs = np.zeros(max_steps, dtype=np.float64)
+        self.rewards = np.zeros(max_steps, dtype=np.float64)
+        self.next_states = np.zeros(max_steps, dtype=np.int32)
+        self.dones = np.zeros(max_steps, dtype=bool)
+        self.microhub_counters = np.zeros(max_steps, dtype=np.int32)
+
+        # --------------------
+        # PACKED CANDIDATES
+        # candidates of step t are candidates[candidate_offsets[t]:candidate_offsets[t + 1]]
+        self.candidate_offsets = np.zeros(max_steps + 1, dtype=np.int64)
+        candidate_capacity = max_steps if candidate_capacity is None else max(candidate_capacity, 1)
+        self.candidates = np.zeros(candidate_capacity, dtype=np.int32)
+        self.possible_rewards = np.zeros(candidate_capacity, dtype=np.float64)
+
+        self.size = 0
+
+    def __len__(self) -> int:
+        return self.size
+
+    def reset(self) -> object:
+        """
+        Empties the buffer, the allocated memory is kept.
+        :return: None
+        """
+        self.size = 0
+
+    def add(self, state: int, action: int, action_space_prob: float, reward: float, next_state: int, done: bool,
+            candidates: object, possible_rewards: object, microhub_counter: int) -> object:
+        """
+        :param state: index of the current state
+        :param action: taken action
+        :param action_space_prob: taken action space prob
+        :param reward: received reward
+        :param next_state: index of the following state
+        :param done: done boolean
+        :param candidates: indices of the possible next states (microhub visits as microhub index)
+        :param possible_rewards: rewards of the possible next states
+        :param microhub_counter: counter number specifying how often the tour constructor returned to the hub
+        :return: None
+        """
+        t = self.size
+        if t == self.capacity:
+            raise IndexError('episode buffer is full ({} steps)'.format(self.capacity))
+        start = self.candidate_offsets[t]
+        end = start + len(candidates)
+        if end > len(self.candidates):
+            self.grow_candidates(max(2 * len(self.candidates), end))
+
+        self.states[t] = state
+        self.actions[t] = action
+        self.action_space_probs[t] = action_space_prob
+        self.rewards[t] = reward
+        self.next_states[t] = next_state
+        self.dones[t] = done
+        self.microhub_counters[t] = microhub_counter
+        self.candidates[start:end] = candidates
+        self.possible_rewards[start:end] = possible_rewards
+        self.candidate_offsets[t + 1] = end
+        self.size += 1
+
+    def grow_candidates(self, capacity: int) -> object:
+        """
+        Reallocates the packed candidate arrays with the given capacity.
+        :param capacity: new candidate capacity
+        :return: None
+        """
+        used = self.candidate_offsets[self.size]
+        candidates = np.zeros(capacity, dtype=np.int32)
+        candidates[:used] = self.candidates[:used]
+        possible_rewards = np.zeros(capacity, dtype=np.float64)
+        possible_rewards[:used] = self.possible_rewards[:used]
+        self.candidates = candidates
+        self.possible_rewards = possible_rewards
+
+    def get_candidates(self, t: int) -> np.ndarray:
+        """
+        :param t: step
+        :return: indices of the possible next states of the step
+        """
+        return self.candidates[self.candidate_offsets[t]:self.candidate_offsets[t + 1]]
+
+    def get_possible_rewards(self, t: int) -> np.ndarray:
+        """
+        :param t: step
+        :return: rewards of the possible next states of the step
+        """
+        return self.possible_rewards[self.candidate_offsets[t]:self.candidate_offsets[t + 1]]
+
+    def get_rewards(self) -> np.ndarray:
+        """
+        :return: rewards of all recorded steps
+        """
+        return self.rewards[:self.size]
@@ -0,0 +1,328 @@
+import itertools
+from typing import Dict, List
+
+import numpy as np
+import pandas as pd
+
+from src.Utils.helper import activation_by_softmax
+
+# Row versions are drawn from one clock shared by all policies, so a policy copy (e.g. the one restored on a
+# policy reset) never hands out a version that was already used for different row contents.
+version_clock = itertools.count(1)
+
+
+class PolicyActionSpace:
+    """
+    Parameterized policy stored as a square float32 weight matrix.
+    Rows and columns share the same labels: the stop hash_ids (without the microhub) followed by the
+    microhub visit slots '{microhub_hash}/{microhub_counter}'.
+    The matrix is preallocated with spare capacity for further microhub visit slots, when the capacity is
+    exhausted it is doubled, so adding a slot never copies the whole policy.
+    Every row carries a version that changes whenever the row is written.
+    While a write journal is open (begin_journal), every write records the previous state of its cells, so an update
+    is reverted (rollback) or kept (commit) in time proportional to its writes instead of copying the matrix.
+    """
+
+    HUB_SLOT_RESERVE = 16
+
+    def __init__(self,
+                 labels: List[str],
+                 weights: np.ndarray = None,
+                 fill_value: float = 0.0,
+                 hub_slot_reserve: int = HUB_SLOT_RESERVE) -> None:
+
+        # --------------------
+        # LABELS
+        self.labels = list(labels)
+        self.label_index: Dict[str, int] = {label: index for index, label in enumerate(self.labels)}
+        self.size = len(self.labels)
+
+        # --------------------
+        # WEIGHTS
+        capacity = self.size + max(hub_slot_reserve, 1)
+        self.weights = np.zeros((capacity, capacity), dtype=np.float32)
+        if weights is None:
+            self.weights[:self.size, :self.size] = fill_value
+        else:
+            self.weights[:self.size, :self.size] = weights
+
+        # --------------------
+        # ROW VERSIONS
+        self.row_versions = np.full(capacity, next(version_clock), dtype=np.int64)
+
+        # --------------------
+        # WRITE JOURNAL
+        # entries in writing order, None while no journal is open
+        self.journal = None
+
+    @classmethod
+    def from_dataframe(cls, df_policy: pd.DataFrame, hub_slot_reserve: int = HUB_SLOT_RESERVE) -> object:
+        """
+        :param df_policy: policy as DataFrame with the same labels as index and columns
+        :param hub_slot_reserve: amount of preallocated microhub visit slots
+        :return: policy action space
+        """
+        labels = list(df_policy.index) + [label for label in df_policy.columns if label not in df_policy.index]
+        df_policy = df_policy.reindex(index=labels, columns=labels).fillna(value=0.0)
+        return cls(labels, df_policy.to_numpy(dtype=np.float32), hub_slot_reserve=hub_slot_reserve)
+
+    def to_dataframe(self) -> pd.DataFrame:
+        """
+        :return: policy as DataFrame with labels as index and columns
+        """
+        return pd.DataFrame(self.get_matrix().astype(np.float64), index=list(self.labels), columns=list(self.labels))
+
+    def __len__(self) -> int:
+        return self.size
+
+    def __contains__(self, label: str) -> bool:
+        return label in self.label_index
+
+    def get_capacity(self) -> int:
+        """
+        :return: amount of allocated rows/columns
+        """
+        return self.weights.shape[0]
+
+    def get_matrix(self) -> np.ndarray:
+        """
+        :return: view on the used part of the weight matrix
+        """
+        return self.weights[:self.size, :self.size]
+
+    def get_index(self, label: str) -> int:
+        """
+        :param label: row/column label
+        :return: row/column index
+        """
+        return self.label_index[label]
+
+    def get_indices(self, labels: List[str]) -> np.ndarray:
+        """
+        :param labels: list of row/column labels
+        :return: array of row/column indices
+        """
+        return np.fromiter((self.label_index[label] for label in labels), dtype=np.intp, count=len(labels))
+
+    def get_row_version(self, row: int) -> int:
+        """
+        :param row: row index
+        :return: current version of the row
+        """
+        return self.row_versions.item(row)
+
+    def get_weight(self, row: int, col: int) -> float:
+        """
+        :param row: row index
+        :param col: column index
+        :return: weight as float
+        """
+        return self.weights.item(row, col)
+
+    def set_weight(self, row: int, col: int, weight: float) -> None:
+        """
+        :param row: row index
+        :param col: column index
+        :param weight: new weight
+        """
+        self.record_cells(row, col)
+        self.weights[row, col] = weight
+        self.row_versions[row] = next(version_clock)
+
+    def get_row(self, row: int) -> np.ndarray:
+        """
+        :param row: row index
+        :return: view on the used part of the row
+        """
+        return self.weights[row, :self.size]
+
+    def get_weights(self, row: int, cols: np.ndarray) -> np.ndarray:
+        """
+        :param row: row index
+        :param cols: column indices
+        :return: weights of the given cells as float64-array
+        """
+        return self.weights[row, cols].astype(np.float64)
+
+    def get_softmax_weights(self, row: int, cols: np.ndarray) -> np.ndarray:
+        """
+        :param row: row index
+        :param cols: column indices
+        :return: softmax of the whole row at the given columns as float64-array
+        """
+        return activation_by_softmax(self.get_row(row))[cols]
+
+    def power_weights(self, row: int, cols: np.ndarray, exponent: float) -> None:
+        """
+        Raises the weights of the given cells to the given power.
+        :param row: row index
+        :param cols: column indices
+        :param exponent: exponent
+        """
+        self.record_cells(row, cols)
+        self.weights[row, cols] = self.weights[row, cols].astype(np.float64) ** exponent
+        self.row_versions[row] = next(version_clock)
+
+    def get_cells(self, rows: np.ndarray, cols: np.ndarray) -> np.ndarray:
+        """
+        :param rows: row index of every cell
+        :param cols: column index of every cell
+        :return: weights of the given cells as float64-array
+        """
+        return self.weights[rows, cols].astype(np.float64)
+
+    def set_cells(self, rows: np.ndarray, cols: np.ndarray, weights: np.ndarray) -> None:
+        """
+        Sets the weights of the given cells in one scatter, every cell must be given once.
+        :param rows: row index of every cell
+        :param cols: column index of every cell
+        :param weights: new weight of every cell
+        """
+        self.record_cells(rows, cols)
+        self.weights[rows, cols] = weights
+        self.row_versions[rows] = next(version_clock)
+
+    def power_cells(self, rows: np.ndarray, cols: np.ndarray, exponent: float) -> None:
+        """
+        Raises the weights of the given cells to the given power in one scatter, every cell must be given once.
+        :param rows: row index of every cell
+        :param cols: column index of every cell
+        :param exponent: exponent
+        """
+        self.record_cells(rows, cols)
+        self.weights[rows, cols] = self.weights[rows, cols].astype(np.float64) ** exponent
+        self.row_versions[rows] = next(version_clock)
+
+    def add_label(self, label: str, row_fill: float, column_fill: float) -> int:
+        """
+        Adds a new row/column. The row is filled first, the column afterwards, so the new diagonal cell holds the
+        column value.
+        :param label: new row/column label
+        :param row_fill: value of the new row
+        :param column_fill: value of the new column
+        :return: index of the new row/column
+        """
+        self.record_labels()
+        if self.size == self.get_capacity():
+            self.grow(2 * self.get_capacity())
+        index = self.size
+        self.labels.append(label)
+        self.label_index[label] = index
+        self.size += 1
+        self.weights[index, :self.size] = row_fill
+        self.weights[:self.size, index] = column_fill
+        self.row_versions[:self.size] = next(version_clock)
+        return index
+
+    def add_labels(self, labels: List[str], row_fill: float, column_fill: float) -> np.ndarray:
+        """
+        Adds several new rows/columns at once, the matrix grows at most once. The new rows are filled first, the
+        new columns afterwards, so the cells between two new labels hold the column value.
+        :param labels: new row/column labels
+        :param row_fill: value of the new rows
+        :param column_fill: value of the new columns
+        :return: indices of the new rows/columns
+        """
+        self.record_labels()
+        size = self.size + len(labels)
+        if size > self.get_capacity():
+            self.grow(max(2 * self.get_capacity(), size))
+        indices = np.arange(self.size, size)
+        for index, label in zip(indices, labels):
+            self.label_index[label] = int(index)
+        self.labels.extend(labels)
+        self.size = size
+        self.weights[self.size - len(labels):self.size, :self.size] = row_fill
+        self.weights[:self.size, self.size - len(labels):self.size] = column_fill
+        self.row_versions[:self.size] = next(version_clock)
+        return indices
+
+    def remove_labels(self, labels: List[str]) -> None:
+        """
+        Removes the rows/columns of the given labels, the remaining labels keep their order.
+        :param labels: row/column labels to be removed
+        """
+        removed = set(labels)
+        keep = np.fromiter((index for index, label in enumerate(self.labels) if label not in removed), dtype=np.intp)
+        weights = self.get_matrix()[np.ix_(keep, keep)]
+        self.labels = [self.labels[index] for index in keep]
+        self.label_index = {label: index for index, label in enumerate(self.labels)}
+        self.size = len(self.labels)
+        self.weights[:, :] = 0.0
+        self.weights[:self.size, :self.size] = weights
+        self.row_versions[:] = next(version_clock)
+
+    def begin_journal(self) -> None:
+        """
+        Opens a write journal, the following writes (weights and new labels) can be reverted with rollback.
+        Removing labels is not journaled.
+        """
+        self.journal = []
+
+    def record_cells(self, rows: object, cols: object) -> None:
+        """
+        Records the weights and row versions of the given cells before they are written.
+        :param rows: row index (of every cell)
+        :param cols: column indices
+        """
+        if self.journal is not None:
+            rows, cols = np.broadcast_arrays(np.atleast_1d(rows), np.atleast_1d(cols))
+            self.journal.append(('cells', rows.copy(), cols.copy(), self.weights[rows, cols].copy(),
+                                 self.row_versions[rows].copy()))
+
+    def record_labels(self) -> None:
+        """
+        Records the labels and row versions before labels are added.
+        """
+        if self.journal is not None:
+            self.journal.append(('labels', self.size, self.row_versions[:self.size].copy()))
+
+    def rollback(self) -> None:
+        """
+        Reverts all writes since begin_journal in reverse order and closes the journal.
+        """
+        for entry in reversed(self.journal):
+            if entry[0] == 'cells':
+                rows, cols, weights, row_versions = entry[1:]
+                # reversed, so the first recorded state of a cell given twice is restored last
+                self.weights[rows[::-1], cols[::-1]] = weights[::-1]
+                self.row_versions[rows[::-1]] = row_versions[::-1]
+            else:
+                size, row_versions = entry[1:]
+                for label in self.labels[size:]:
+                    del self.label_index[label]
+                del self.labels[size:]
+                self.size = size
+                self.row_versions[:size] = row_versions
+        self.journal = None
+
+    def commit(self) -> None:
+        """
+        Keeps all writes since begin_journal and closes the journal.
+        """
+        self.journal = None
+
+    def grow(self, capacity: int) -> None:
+        """
+        Reallocates the weight matrix with the given capacity.
+        :param capacity: new amount of allocated rows/columns
+        """
+        weights = np.zeros((capacity, capacity), dtype=np.float32)
+        weights[:self.size, :self.size] = self.get_matrix()
+        self.weights = weights
+        row_versions = np.zeros(capacity, dtype=np.int64)
+        row_versions[:self.size] = self.row_versions[:self.size]
+        self.row_versions = row_versions
+
+    def copy(self) -> object:
+        """
+        :return: deep copy of the policy action space
+        """
+        policy_copy = PolicyActionSpace.__new__(PolicyActionSpace)
+        policy_copy.labels = list(self.labels)
+        policy_copy.label_index = dict(self.label_index)
+        policy_copy.size = self.size
+        policy_copy.weights = self.weights.copy()
+        policy_copy.row_versions = self.row_versions.copy()
+        policy_copy.journal = None
+        return policy_copy
@@ -1,17 +1,24 @@
+import os
 import random
+from datetime import date
 
 import numpy as np
-import pandas as pd
 
-from src.Utils.helper import normalize_list, action_by_softmax_as_dict
-from src.Utils.memoryLoader import load_memory_df_from_local, save_memory_df_to_local
+from src.Mdp.VRPVecEnvironment import VRPVecEnvironment
+from src.RL.Policy.PolicyActionSpace import PolicyActionSpace
+from src.RL.Policy.SparsePolicyActionSpace import SparsePolicyActionSpace
+from src.Utils.helper import normalize_list, calculate_discounted_returns, choose_in_rows
+from src.Utils.instrumentation import increment, timed
+from src.Utils.logger import get_logger
+from src.Utils.memoryLoader import load_memory_df_from_local, load_model_from_local, model_exists, \
+    save_model_to_local, save_sparse_model_to_local
+
+logger = get_logger('policy')
 
 
 def clip_weight(current_weight, clipValue):
-    if current_weight >= 1:
-        current_weight = 1 - clipValue
-    if current_weight <= 0:
-        current_weight = 0 + clipValue
+    current_weight = np.where(current_weight >= 1, 1 - clipValue, current_weight)
+    current_weight = np.where(current_weight <= 0, 0 + clipValue, current_weight)
     return current_weight
 
 
@@ -29,7 +36,11 @@ class PolicyManager:
                  distance_utilization_threshold,
                  capacity_utilization_threshold,
                  local_search_threshold,
-                 policy_reset_threshold):
+                 policy_reset_threshold,
+                 value_func_solver='sweep',
+                 legacy_discounting=False,
+                 stale_stop_days=None,
+                 policy_neighbors=None):
 
         # --------------------
         # STATES / ACTIONS
@@ -57,22 +68,43 @@ class PolicyManager:
         self.enhance_good_episode = False
         self.theta = float(baseline_theta)
         self.penultimate_reward = 0.0
+        self.value_func_solver = value_func_solver
+        self.legacy_discounting = legacy_discounting
 
         # --------------------
         # MODEL-CONTEXT SPECIFIC
         self.G = 0
         self.old_policy_reward = 0.0
         self.baseline_estimate = np.zeros_like(state_hashes, dtype=np.float32)
+        # (policy row, row version, microhub counter) -> baseline estimate
+        self.baseline_cache = dict()
 
         # --------------------
         # PARAMETERIZED POLICY
-        self.policy_action_space = pd.DataFrame()
+        self.policy_action_space = PolicyActionSpace([])
+        self.state_columns = None
+        self.state_columns_policy = None
+        # with policy_neighbors ((stops x k)-array of the nearest stop indices, by NeighborIndex.get_neighbors like
+        # the candidate lists of the environment) only the weights of the k nearest stops of every stop are stored
+        self.policy_candidates = None
+        self.policy_top_k = None
+        if policy_neighbors is not None:
+            self.policy_top_k = policy_neighbors.shape[1]
+            self.policy_candidates = {state: [self.state_hashes[neighbor] for neighbor in neighbors if neighbor != 0]
+                                      for state, neighbors in zip(state_hashes, policy_neighbors)}
+
+        # --------------------
+        # MODEL MAINTENANCE
+        # stop label -> ISO date the stop was last part of the stop data
+        self.stop_last_seen = dict()
+        # stops not seen for more than stale_stop_days days are removed from the loaded model, None keeps them
+        self.stale_stop_days = stale_stop_days
 
     def policy_update_by_learning(self, env: object, episode: object, episode_reward: int, gamma: float, max_steps: int, num_episodes: int, epoch: int) -> object:
         """
         Takes the episodes "on-policy" experience and updates the policy.
         :param env: environment instance
-        :param episode: List of every taken step in the episode
+        :param episode: EpisodeBuffer holding every taken step in the episode
         :param episode_reward: Cumulative reward of the episode
         :param gamma: gamma factor
         :param max_steps: max steps amount that the policy manager is allowed to use
@@ -81,169 +113,280 @@ class PolicyManager:
         :return: Cumulative discount reward, average reward, lose history, epsilon, current policy reward
         """
         # --------------------
-        # COPY OLD POLICY
-        policy_action_space_copy = self.policy_action_space.copy()
+        # JOURNAL THE UPDATE
+        # the writes of the update are recorded, a rejected update is reverted instead of restoring a copy
+        self.policy_action_space.begin_journal()
+
+        G_t, J_avR, loseHistory = self.learn_from_episode(env, episode, episode_reward, gamma, epoch)
+        eps, policy_relevant_reward = self.evaluate_policy_update(env, max_steps, num_episodes, epoch)
+        return G_t, J_avR, loseHistory, eps, policy_relevant_reward
+
+    def policy_update_by_batch(self, env: object, episodes: object, episode_rewards: object, gamma: float, max_steps: int, num_episodes: int, epoch: int) -> object:
+        """
+        Takes the experience of several episodes, which were rolled out on the same policy, and updates the policy
+        once. The episodes are learned one after another, the new policy is evaluated afterwards.
+        :param env: environment instance
+        :param episodes: list of EpisodeBuffers
+        :param episode_rewards: Cumulative reward of every episode
+        :param gamma: gamma factor
+        :param max_steps: max steps amount that the policy manager is allowed to use
+        :param num_episodes: the overall amount of defined episodes
+        :param epoch: last epoch of the batch
+        :return: list of (Cumulative discount reward, average reward) per episode, lose history, epsilon, current
+        policy reward
+        """
+        # --------------------
+        # JOURNAL THE UPDATE
+        # the writes of the update are recorded, a rejected update is reverted instead of restoring a copy
+        self.policy_action_space.begin_journal()
 
+        # --------------------
+        # ADD MICROHUB VISITS OF THE ROLLOUTS
+        for episode in episodes:
+            for microhub_counter in range(int(episode.microhub_counters[:len(episode)].max(initial=0)) + 1):
+                if '{}/{}'.format(self.microhub_hash, microhub_counter) not in self.policy_action_space:
+                    self.policy_action_space.add_label('{}/{}'.format(self.microhub_hash, microhub_counter), 0.05,
+                                                       1 / len(self.state_hashes))
+
+        returns = []
+        loseHistory = []
+        enhance_good_episode = False
+        for episode, episode_reward in zip(episodes, episode_rewards):
+            G_t, J_avR, episode_lose_history = self.learn_from_episode(env, episode, episode_reward, gamma, epoch)
+            returns.append((G_t, J_avR))
+            loseHistory.extend(episode_lose_history)
+            enhance_good_episode = enhance_good_episode or self.enhance_good_episode
+        self.enhance_good_episode = enhance_good_episode
+
+        eps, policy_relevant_reward = self.evaluate_policy_update(env, max_steps, num_episodes, epoch)
+        return returns, loseHistory, eps, policy_relevant_reward
+
+    @timed('policy_update')
+    def learn_from_episode(self, env: object, episode: object, episode_reward: int, gamma: float, epoch: int) -> object:
+        """
+        Applies the policy gradient steps of one episode.
+        :param env: environment instance
+        :param episode: EpisodeBuffer holding every taken step in the episode
+        :param episode_reward: Cumulative reward of the episode
+        :param gamma: gamma factor
+        :param epoch: current epoch
+        :return: Cumulative discount reward, average reward, lose history
+        """
         # --------------------
         # PREPARE EPISODE MEMORY
-        # state_memory = np.array([step_t.state for step_t in episode])
-        # action_memory = np.array([step_t.action for step_t in episode])
-        # action_space_memory = np.array([step_t.next_state for step_t in episode])
-        reward_memory = np.array([step_t.reward for step_t in episode])
+        reward_memory = episode.get_rewards()
 
         # --------------------
         # CALCULATE G_t
-        G_t = self.compute_G_t(reward_memory)
+        G_t, self.G, J_avR = calculate_discounted_returns(reward_memory,
+                                                         self.discount_factor,
+                                                         legacy_discounting=self.legacy_discounting)
         loseHistory = []
-        J_avR = self.compute_J_avR(G_t)
-        std_deviation = np.std(G_t) if np.std(G_t) > 0 else 1
-        self.G = (G_t - J_avR) / std_deviation
 
         # --------------------
         # COMPARE OLD POLICY REWARD TO EPISODE REWARD
         # increase probability factor when current episode reward > old policy reward
-        print("------------------Comparison------------------")
-        print("--------Old_Policy-vs-Current_Episode---------")
-        print("Epoch: ", epoch)
-        print("Old_Policy_Reward: ", self.old_policy_reward)
-        print("Current_Episode_Reward: ", episode_reward)
+        logger.debug("------------------Comparison------------------")
+        logger.debug("--------Old_Policy-vs-Current_Episode---------")
+        logger.debug("Epoch: %s", epoch)
+        logger.debug("Old_Policy_Reward: %s", self.old_policy_reward)
+        logger.debug("Current_Episode_Reward: %s", episode_reward)
         reward_difference = self.old_policy_reward - episode_reward
 
         if episode_reward < self.old_policy_reward:
-            print(
+            logger.debug(
                 "----------------------------------------------GOOD EPISODE----------------------------------------------------")
             self.enhance_good_episode = True
         else:
             self.enhance_good_episode = False
 
-        print("Enhance good episode: ", self.enhance_good_episode)
+        logger.debug("Enhance good episode: %s", self.enhance_good_episode)
 
-        for idx, g in enumerate(self.G):
-            print("------------------Step ", idx, "------------------")
-            # --------------------
-            # HANDLE MICROHUB PROBLEMATIC
-            state_hash, next_state_hash = self.handle_multiple_tours(episode[idx].state, episode[idx].next_state,
-                                                                     episode[idx].microhub_counter)
-            print("Current_state: ", state_hash)
-            print("Next_state: ", next_state_hash)
-            # --------------------
-            # FIND CURRENT WEIGHT FOR ACTION
-            current_weight = self.policy_action_space.at[state_hash, next_state_hash]
-            current_weight = clip_weight(current_weight, 0.0001)  # to avoid zero division
+        # --------------------
+        # POLICY CELLS
+        # step t updates the cell (policy row of the state, policy column of the next state)
+        steps = len(self.G)
+        state_rows = self.get_policy_indices_by_counters(episode.states[:steps], episode.microhub_counters[:steps])
+        next_state_cols = self.get_policy_indices_by_counters(episode.next_states[:steps],
+                                                              episode.microhub_counters[:steps])
 
-            # --------------------
-            # VALUE FUNCTION (Policy Evaluation)
-            # Get possible lowest reward | goal to minimize reward (as lowest distance)
-            softmax_weights = action_by_softmax_as_dict(self.policy_action_space.loc[state_hash, :])
-            baseline_estimate = self.calculate_value_func(env,
-                                                          softmax_weights,
-                                                          gamma,
-                                                          episode[idx].microhub_counter)
-            print("Relevant_Baseline_Estimate: ", baseline_estimate[episode[idx].state.stop_id])
+        for start, end in self.get_unique_row_segments(state_rows):
+            loseHistory.extend(self.learn_from_steps(env, episode, gamma, slice(start, end), state_rows,
+                                                     next_state_cols, reward_difference))
 
-            # --------------------
-            # ADVANTAGE / APPLY TEMPORAL DIFFERENCE ERROR
-            # USES SIMPLE MONTE CARLO
-            advantage_estimate = baseline_estimate[episode[idx].state.stop_id] + self.learning_rate * (
-                    g - baseline_estimate[episode[idx].state.stop_id])
+        # --------------------
+        # DECAY LEARNING RATE
+        """
+        self.learning_rate = self.learning_rate * (1 / (1 + self.learning_rate_decay * epoch))  # learning rate decay
+        """
+        return G_t, J_avR, loseHistory
 
-            print("Current_g: ", g)
-            print("Advantage_Estimate: ", advantage_estimate)
+    def learn_from_steps(self, env: object, episode: object, gamma: float, steps: slice, state_rows: object,
+                         next_state_cols: object, reward_difference: float) -> object:
+        """
+        Applies the policy gradient steps of a segment of an episode that updates every policy row at most once.
+        The baselines are estimated step by step, everything else is calculated over arrays of (row, column,
+        advantage) per step and written in one scatter per kind of update. As no step reads a row written by another
+        step of the segment, the weights are the same as when updating step by step.
+        :param env: environment instance
+        :param episode: EpisodeBuffer holding every taken step in the episode
+        :param gamma: gamma factor
+        :param steps: steps of the segment
+        :param state_rows: policy row of the state of every step of the episode
+        :param next_state_cols: policy column of the next state of every step of the episode
+        :param reward_difference: old policy reward - episode reward
+        :return: lose of every step
+        """
+        rows = state_rows[steps]
+        cols = next_state_cols[steps]
+        states = episode.states[steps]
+        next_states = episode.next_states[steps]
+        g = self.G[steps]
 
-            # --------------------
-            # CALCULATE LOSE/COST
-            lose = self.calculate_cost(current_weight, g, advantage_estimate)
-            loseHistory.append(lose)
-            print("Current_lose: ", lose)
+        # --------------------
+        # VALUE FUNCTION (Policy Evaluation)
+        # Get possible lowest reward | goal to minimize reward (as lowest distance)
+        state_baselines = np.zeros(len(rows))
+        next_state_baselines = np.zeros(len(rows))
+        value_weights = np.zeros(len(rows))
+        for step, (state_row, next_state_col, state, next_state, microhub_counter) in enumerate(
+                zip(rows.tolist(), cols.tolist(), states.tolist(), next_states.tolist(),
+                    episode.microhub_counters[steps].tolist())):
+            baseline_estimate = self.estimate_baseline(env, state_row, gamma, microhub_counter)
+            state_baselines[step] = baseline_estimate[state]
+            next_state_baselines[step] = baseline_estimate[next_state]
+            value_weights[step] = self.policy_action_space.get_softmax_weights(state_row, cols[step:step + 1])[0]
+            logger.debug("Step %d: %s -> %s, baseline estimate %s", steps.start + step,
+                         self.policy_action_space.labels[state_row], self.policy_action_space.labels[next_state_col],
+                         state_baselines[step])
 
-            # --------------------
-            # SETUP LEARNING RATE AND GAMMA_T
-            lr = self.learning_rate
-            print("Learning_rate: ", lr)
+        # --------------------
+        # FIND CURRENT WEIGHTS FOR ACTIONS
+        current_weights = clip_weight(self.policy_action_space.get_cells(rows, cols), 0.0001)  # to avoid zero division
 
-            # gamma_t = self.discountFactor/(1 + self.learning_rate_decay * epoch)
-            gamma_t = self.discount_factor
-            print("Gamma_t: ", gamma_t)
+        # --------------------
+        # ADVANTAGE / APPLY TEMPORAL DIFFERENCE ERROR
+        # USES SIMPLE MONTE CARLO
+        advantage_estimates = state_baselines + self.learning_rate * (g - state_baselines)
 
-            # --------------------
-            # CALCULATE AND UPDATE VALUE WEIGHT
-            value_weight = softmax_weights.get(next_state_hash)
-            value_weight = clip_weight(value_weight, 0.0001)
-            print("Current_value_weight: ", value_weight)
+        # --------------------
+        # CALCULATE LOSE/COST
+        loses = self.calculate_cost(current_weights, g, advantage_estimates)
 
-            value_weight_new = value_weight + (lr * gamma_t * (baseline_estimate[episode[idx].next_state.stop_id]))
-            value_weight_new = clip_weight(value_weight_new, 0.0001)
-            print("Current_value_weight_new: ", value_weight_new)
+        # --------------------
+        # SETUP LEARNING RATE AND GAMMA_T
+        lr = self.learning_rate
+        # gamma_t = self.discountFactor/(1 + self.learning_rate_decay * epoch)
+        gamma_t = self.discount_factor
 
-            # --------------------
-            # DO STOCHASTIC GRADIENT STEP AND UPDATE PARAMETER OF POLICY
-            gradient_step = lr * gamma_t * (advantage_estimate * np.log(value_weight_new))
-            print("Gradient_step: ", gradient_step)
+        # --------------------
+        # CALCULATE AND UPDATE VALUE WEIGHTS
+        value_weights = clip_weight(value_weights, 0.0001)
+        value_weights_new = clip_weight(value_weights + (lr * gamma_t * next_state_baselines), 0.0001)
 
-            # --------------------
-            # APPLY MONTE-CARLO
-            updated_weight = current_weight - gradient_step
-            print("Current_weight: ", current_weight)
-            print("Pre_updated__weight: ", updated_weight)
+        # --------------------
+        # DO STOCHASTIC GRADIENT STEP AND UPDATE PARAMETER OF POLICY
+        gradient_steps = lr * gamma_t * (advantage_estimates * np.log(value_weights_new))
 
-            # --------------------
-            # APPLY PROBABILITY IN-/DECREASING FACTOR
-            final_weight = updated_weight
-            if updated_weight > current_weight:
-                final_weight = current_weight ** (
-                    self.increasing_factor_good_episode if self.enhance_good_episode is True else self.increasing_factor)
-            if updated_weight < current_weight and self.enhance_good_episode is False:
-                final_weight = current_weight ** (
-                    self.decreasing_factor_good_episode if self.enhance_good_episode is True else self.decreasing_factor)
+        # --------------------
+        # APPLY MONTE-CARLO
+        updated_weights = current_weights - gradient_steps
 
-            # --------------------
-            # REDUCE ALTERNATIVE ACTION EVALUATIONS
-            if self.enhance_good_episode is True and updated_weight > current_weight:
-                reward_difference_reduced = (
-                        ((10 * np.log10(reward_difference)) / np.log(10)) / 100) if reward_difference > 0 else 0
-                to_update_states = episode[idx].possible_next_states
-                to_update_states.remove(next_state_hash)
-                self.policy_action_space.loc[state_hash, to_update_states] **= (
-                        self.decreasing_factor_good_episode + (reward_difference_reduced if reward_difference_reduced > 0 else 0))
+        # --------------------
+        # APPLY PROBABILITY IN-/DECREASING FACTOR
+        increased = updated_weights > current_weights
+        final_weights = updated_weights
+        final_weights = np.where(increased, current_weights ** (
+            self.increasing_factor_good_episode if self.enhance_good_episode is True else self.increasing_factor),
+                                 final_weights)
+        if self.enhance_good_episode is False:
+            final_weights = np.where(updated_weights < current_weights, current_weights ** self.decreasing_factor,
+                                     final_weights)
 
-            # --------------------
-            # SET UPDATED NEW WEIGHT
-            print("Final_weight: ", final_weight)
-            self.policy_action_space.at[state_hash, next_state_hash] = final_weight
+        # --------------------
+        # REDUCE ALTERNATIVE ACTION EVALUATIONS
+        # the other candidates of every step with an increased weight
+        if self.enhance_good_episode is True and increased.any():
+            reward_difference_reduced = (
+                    ((10 * np.log10(reward_difference)) / np.log(10)) / 100) if reward_difference > 0 else 0
+            reduced_rows = []
+            reduced_cols = []
+            for step in np.flatnonzero(increased).tolist():
+                t = steps.start + step
+                to_update_states = self.get_policy_indices(episode.get_candidates(t), episode.microhub_counters[t])
+                to_update_states = to_update_states[to_update_states != cols[step]]
+                reduced_rows.append(np.full(len(to_update_states), rows[step]))
+                reduced_cols.append(to_update_states)
+            self.policy_action_space.power_cells(np.concatenate(reduced_rows),
+                                                 np.concatenate(reduced_cols),
+                                                 self.decreasing_factor_good_episode + (
+                                                     reward_difference_reduced if reward_difference_reduced > 0 else 0))
 
         # --------------------
-        # DECAY LEARNING RATE
-        """
-        self.learning_rate = self.learning_rate * (1 / (1 + self.learning_rate_decay * epoch))  # learning rate decay
-        """
+        # SET UPDATED NEW WEIGHTS
+        logger.debug("Final weights: %s", final_weights)
+        self.policy_action_space.set_cells(rows, cols, final_weights)
+        return loses.tolist()
 
+    @staticmethod
+    def get_unique_row_segments(rows: object) -> object:
+        """
+        :param rows: policy row of every step
+        :return: (start, end) of the consecutive segments of steps in which no row appears twice
+        """
+        segments = []
+        start = 0
+        segment_rows = set()
+        for step, row in enumerate(rows.tolist()):
+            if row in segment_rows:
+                segments.append((start, step))
+                start = step
+                segment_rows = set()
+            segment_rows.add(row)
+        if start < len(rows):
+            segments.append((start, len(rows)))
+        return segments
+
+    def evaluate_policy_update(self, env: object, max_steps: int, num_episodes: int, epoch: int) -> object:
+        """
+        Constructs the updated policy and resets it to the old policy when it became worse, by rolling back or
+        committing the write journal of the update.
+        :param env: environment instance
+        :param max_steps: max steps amount that the policy manager is allowed to use
+        :param num_episodes: the overall amount of defined episodes
+        :param epoch: current epoch
+        :return: epsilon, current policy reward
+        """
         # --------------------
         # BUILD AND COMPARE POLICIES (OLD vs. NEW)
-        print('Constructing new Policy')
+        logger.debug('Constructing new Policy')
         self.microhub_counter = 0
         new_policy_reward, new_tour = self.construct_policy(self.policy_action_space, env, max_steps)
-        print("-------------------Finalize-------------------")
-        print("Enhance good episode: ", self.enhance_good_episode)
-        print("Old_Policy_Reward: ", self.old_policy_reward)
-        print("New_Policy_Reward: ", new_policy_reward)
+        logger.debug("-------------------Finalize-------------------")
+        logger.debug("Enhance good episode: %s", self.enhance_good_episode)
+        logger.debug("Old_Policy_Reward: %s", self.old_policy_reward)
+        logger.debug("New_Policy_Reward: %s", new_policy_reward)
         policy_relevant_reward = new_policy_reward
 
         if self.enhance_good_episode is False and ((self.old_policy_reward - new_policy_reward) < self.policy_reset_threshold) and self.old_policy_reward > 0.0:
-            print("-Resetting policy to old standard-")
-            self.policy_action_space = policy_action_space_copy
+            logger.info("-Resetting policy to old standard-")
+            self.policy_action_space.rollback()
             policy_relevant_reward = self.old_policy_reward
 
         if self.enhance_good_episode is True and ((self.old_policy_reward - new_policy_reward) < -5) and self.old_policy_reward > 0.0:
-            print("-Resetting policy to old standard-")
-            self.policy_action_space = policy_action_space_copy
+            logger.info("-Resetting policy to old standard-")
+            self.policy_action_space.rollback()
             policy_relevant_reward = self.old_policy_reward
 
+        # keeps the update, if it was not reset
+        self.policy_action_space.commit()
+
         # --------------------
         # EVALUATE INCREASING EPSILON
         # IF REWARD WAS STABLE OVER 3 TIMESTEPS, increase epsilon
         eps = self.eps
         if (self.penultimate_reward == self.old_policy_reward == new_policy_reward) and epoch < (0.7 * num_episodes):
-            print("Increased exploration chance")
+            logger.info("Increased exploration chance")
             eps = self.eps ** 0.8
 
         # --------------------
@@ -251,13 +394,15 @@ class PolicyManager:
         self.microhub_counter = 0
         self.enhance_good_episode = False
         self.baseline_estimate = np.zeros_like(self.state_hashes, dtype=np.float32)
+        self.prune_baseline_cache()
         self.penultimate_reward = self.old_policy_reward
         self.old_policy_reward = new_policy_reward
 
         # --------------------
         # RETURN
-        return G_t, J_avR, loseHistory, eps, policy_relevant_reward
+        return eps, policy_relevant_reward
 
+    @timed('policy_construction')
     def construct_policy(self, policy: object, env: object, max_steps: int) -> object:
         """
         Construct current policy by optimal path.
@@ -273,12 +418,12 @@ class PolicyManager:
         tour.append(state)
 
         for step_t in range(max_steps):
-            print("constructing policy: get legal next states")
-            legal_next_action, legal_next_states, legal_next_states_hubs_ignored, legal_next_states_local_search_distance, legal_next_states_bin_packing_capacities, microhub_counter = env.get_next_legal_action()
-            print("constructing policy: getting action space")
+            logger.debug("constructing policy: get legal next states")
+            legal_next_action, legal_next_states, legal_next_state_indices, legal_next_states_local_search_distance, legal_next_states_bin_packing_capacities, microhub_counter = env.get_next_legal_action()
+            logger.debug("constructing policy: getting action space")
             action_space = self.get_action_space_by_policy(state, legal_next_states, policy, microhub_counter)
-            print("constructing policy: doing step")
-            next_state, reward, done, current_tour, current_tours = env.step(legal_next_action, action_space)
+            logger.debug("constructing policy: doing step")
+            next_state, reward, done, current_tour, tour_ends = env.step(legal_next_action, action_space)
             policy_reward += reward
 
             state = next_state
@@ -291,57 +436,132 @@ class PolicyManager:
 
         return policy_reward, all_tours
 
-    def handle_multiple_tours(self, state: object, next_state: object, microhub_counter: int) -> object:
+    def estimate_baseline(self, env: object, state_index: int, gamma: float, microhub_counter: int) -> object:
         """
-        Defines handle logic for multiple hub entries in policy.
-        :param state: current state
-        :param next_state: next state
+        Memoized policy evaluation. The baseline only depends on the softmax of one policy row and the microhub
+        counter, so it is cached per (policy row, row version, microhub counter) and only recalculated (warm-started
+        from the previous estimate) once the row was written.
+        :param env: environment instance
+        :param state_index: policy row of the current state
+        :param gamma: gamma factor
         :param microhub_counter: counter number specifying how often the tour constructor returned to the hub
-        :return: state hash_id, next state hash_id
+        :return: baseline estimate
         """
-        if state.hash_id == self.microhub_hash:
-            state_hash = '{}/{}'.format(state.hash_id, microhub_counter)
-        else:
-            state_hash = state.hash_id
-        if next_state.hash_id == self.microhub_hash:
-            next_state_hash = '{}/{}'.format(next_state.hash_id, microhub_counter)
-        else:
-            next_state_hash = next_state.hash_id
-
-        return state_hash, next_state_hash
+        key = (state_index, self.policy_action_space.get_row_version(state_index), microhub_counter)
+        cached_baseline = self.baseline_cache.get(key)
+        if cached_baseline is not None:
+            increment('baseline_cache_hits')
+            self.baseline_estimate[:] = cached_baseline
+            return self.baseline_estimate
+        increment('baseline_cache_misses')
+        probabilities = self.policy_action_space.get_softmax_weights(state_index,
+                                                                     self.get_state_columns(microhub_counter))
+        baseline_estimate = self.calculate_value_func(env, probabilities, gamma, microhub_counter)
+        self.baseline_cache[key] = baseline_estimate.copy()
+        return baseline_estimate
+
+    def prune_baseline_cache(self) -> object:
+        """
+        Drops all cached baseline estimates of policy rows that were written since.
+        :return: None
+        """
+        self.baseline_cache = {key: baseline for key, baseline in self.baseline_cache.items()
+                               if key[0] < len(self.policy_action_space)
+                               and key[1] == self.policy_action_space.get_row_version(key[0])}
 
-    def calculate_value_func(self, env: object, weights_dict: dict, gamma: float, microhub_counter: int, theta: float = 0.0001) -> object:
+    @timed('policy_update/value_function')
+    def calculate_value_func(self, env: object, probabilities: object, gamma: float, microhub_counter: int, theta: float = 0.0001) -> object:
         """
         Calculates state-value function.
+        The backup V(s) = sum_s' p(s') * (r(s, s') + gamma * V(s')) is the same for every state apart from the
+        reward, so each sweep reduces to one matrix-vector product (expected rewards) and a linear recurrence.
         :param env: environment instance
-        :param weights_dict: dictionary of states with associated softmax weights
+        :param probabilities: softmax weights of a policy row, indexed like the states (stop_id)
         :param gamma: gamma factor
         :param microhub_counter: counter number specifying how often the tour constructor returned to the hub
         :param theta: threshold indicator for termination
         :return: baseline estimate
         """
+        expected_rewards = env.expected_rewards(probabilities)
+
+        if self.value_func_solver == 'solve':
+            # Direct solve of (I - gamma * 1 p^T) V = r, meant for small instances
+            transition = np.eye(len(probabilities)) - gamma * np.outer(np.ones_like(probabilities), probabilities)
+            self.baseline_estimate[:] = np.linalg.solve(transition, expected_rewards)
+            return self.baseline_estimate
+
         while True:
-            delta = 0.0
-            old_values = np.copy(self.baseline_estimate)
-            for s_a in self.state_hashes:
-                s_a_stop = env.get_state_by_hash(s_a)
-                v = np.zeros_like(self.state_hashes, dtype=np.float32)
-                for s_n in self.state_hashes:
-                    s_next = env.get_state_by_hash(s_n)
-                    pi_s_a = 1
-                    p = weights_dict.get(s_n if s_n != self.microhub_hash else '{}/{}'.format(s_n, microhub_counter))
-                    r = env.reward_func_hash(s_a_stop.hash_id, s_n)
-                    # v[s_next.stopid] = r + gamma * (p * self.baseline_estimate[s_next.stopid])
-                    v[s_next.stop_id] = pi_s_a * p * (r + gamma * self.baseline_estimate[s_next.stop_id])
-                    # if (s_next.hashIdentifier == self.microhub_hash):
-                    #    v[s_next.stopid] *= self.microhub_counter
-                self.baseline_estimate[s_a_stop.stop_id] = np.sum(v)
-                delta = np.maximum(delta,
-                                   np.absolute(old_values[s_a_stop.stop_id]) - self.baseline_estimate[s_a_stop.stop_id])
+            old_values = self.baseline_estimate.astype(np.float64)
+            self.baseline_estimate[:] = self.sweep_value_func(old_values, probabilities, expected_rewards, gamma)
+            increment('value_function_sweeps')
+            delta = np.maximum(0.0, np.max(np.absolute(old_values) - self.baseline_estimate))
             if delta < theta:
                 break
         return self.baseline_estimate
 
+    @staticmethod
+    def sweep_value_func(values: object, probabilities: object, expected_rewards: object, gamma: float) -> object:
+        """
+        Does one in-place sweep over all states in order, every state already sees the updated values of the
+        states before it. With S_i = sum_j p_j * V_j at the time state i is updated, the sweep is the linear
+        recurrence S_i+1 = (1 + gamma * p_i) * S_i + p_i * (r_i - V_i), which is solved by cumulative products.
+        :param values: current state values
+        :param probabilities: next state probabilities
+        :param expected_rewards: expected reward of every state
+        :param gamma: gamma factor
+        :return: updated state values
+        """
+        growth = np.cumprod(1 + gamma * probabilities)
+        prefix_growth = np.concatenate(([1.0], growth[:-1]))
+        increments = np.cumsum(probabilities * (expected_rewards - values) / growth)
+        running_sum = prefix_growth * (np.dot(probabilities, values) + np.concatenate(([0.0], increments[:-1])))
+        return expected_rewards + gamma * running_sum
+
+    def get_state_columns(self, microhub_counter: int) -> object:
+        """
+        :param microhub_counter: counter number specifying how often the tour constructor returned to the hub
+        :return: policy column of every state, the microhub mapped to its current visit slot
+        """
+        if self.state_columns_policy is not self.policy_action_space:
+            self.state_columns = self.policy_action_space.get_indices(
+                ['{}/{}'.format(self.microhub_hash, 0)] + self.state_hashes[1:])
+            self.state_columns_policy = self.policy_action_space
+        state_columns = self.state_columns.copy()
+        state_columns[0] = self.policy_action_space.get_index('{}/{}'.format(self.microhub_hash, microhub_counter))
+        return state_columns
+
+    def get_policy_index(self, state_index: int, microhub_counter: int) -> int:
+        """
+        Defines handle logic for multiple hub entries in policy.
+        :param state_index: index (stop_id) of the state
+        :param microhub_counter: counter number specifying how often the tour constructor returned to the hub
+        :return: policy row/column of the state
+        """
+        if state_index == 0:
+            return self.policy_action_space.get_index('{}/{}'.format(self.microhub_hash, microhub_counter))
+        return self.policy_action_space.get_index(self.state_hashes[state_index])
+
+    def get_policy_indices_by_counters(self, state_indices: object, microhub_counters: object) -> object:
+        """
+        :param state_indices: indices (stop_id) of the states
+        :param microhub_counters: microhub counter of every state
+        :return: policy rows/columns of the states, microhub visits by their counter
+        """
+        policy_indices = self.get_state_columns(0)[state_indices]
+        at_microhub = state_indices == 0
+        for microhub_counter in np.unique(microhub_counters[at_microhub]).tolist():
+            policy_indices[at_microhub & (microhub_counters == microhub_counter)] = self.policy_action_space.get_index(
+                '{}/{}'.format(self.microhub_hash, microhub_counter))
+        return policy_indices
+
+    def get_policy_indices(self, state_indices: object, microhub_counter: int) -> object:
+        """
+        :param state_indices: indices (stop_id) of the states
+        :param microhub_counter: counter number specifying how often the tour constructor returned to the hub
+        :return: policy rows/columns of the states
+        """
+        return self.get_state_columns(microhub_counter)[state_indices]
+
     def resolve_weight(self, grad_weight: object, current_weight: float, possible_rewards: object) -> object:
         """
         Clipping
@@ -361,11 +581,11 @@ class PolicyManager:
         return 1 / (1 + np.exp(-z))
 
     def calculate_dot_product(self, W: object, X: object) -> object:
-        return self.sigmoid_activation(np.dot(X, W))
+        return self.sigmoid_activation(np.multiply(X, W))
 
     def calculate_cost(self, W: object, X: object, Y: object) -> object:
         """
-        Calculate the cost for choosing an specific action.
+        Calculate the cost for choosing an specific action (elementwise for arrays of steps).
         :param W: the current weight of the choosen action.
         :param X: Discounted reward for current timestep.
         :param Y: Advantage estimate
@@ -384,24 +604,15 @@ class PolicyManager:
         :return:
         """
         if state.hash_id == self.microhub_hash:
-            self.policy_action_space.fillna(value=0.05, inplace=True)
-            if '{}/{}'.format(self.microhub_hash, microhub_counter) not in self.policy_action_space.index.values:
-                new_row = pd.Series(name='{}/{}'.format(self.microhub_hash, microhub_counter))
-                self.policy_action_space = self.policy_action_space.append(new_row, ignore_index=False)
-                self.policy_action_space.fillna(value=0.05, inplace=True)
-                self.policy_action_space['{}/{}'.format(self.microhub_hash, microhub_counter)] = 1 / len(self.state_hashes)
-            action_space_prob = policy.loc['{}/{}'.format(state.hash_id, microhub_counter), legal_next_states].to_numpy()
+            state_label = '{}/{}'.format(self.microhub_hash, microhub_counter)
+            if state_label not in policy:
+                policy.add_label(state_label, 0.05, 1 / len(self.state_hashes))
         else:
-            if len(legal_next_states) == 1:
-                if legal_next_states[0] not in self.policy_action_space.index.values:
-                    new_row = pd.Series(name=legal_next_states[0])
-                    self.policy_action_space = self.policy_action_space.append(new_row, ignore_index=False)
-                    self.policy_action_space.fillna(value=0.05, inplace=True)
-                    self.policy_action_space[legal_next_states[0]] = 1 / len(self.state_hashes)
-            action_space_prob = policy.loc[state.hash_id, legal_next_states].to_numpy()
-        highest_prob = max(action_space_prob)
-        index_highest_prob = np.where(action_space_prob == highest_prob)[0]
-        index = index_highest_prob[0]
+            state_label = state.hash_id
+            if len(legal_next_states) == 1 and legal_next_states[0] not in policy:
+                policy.add_label(legal_next_states[0], 0.05, 1 / len(self.state_hashes))
+        action_space_prob = policy.get_weights(policy.get_index(state_label), policy.get_indices(legal_next_states))
+        index = int(np.argmax(action_space_prob))
         highest_prob_action_space = legal_next_states[index]
         return highest_prob_action_space
 
@@ -420,27 +631,23 @@ class PolicyManager:
         """
         if self.microhub_counter != microhub_counter_env:
             self.microhub_counter = microhub_counter_env
-            if ('{}/{}'.format(self.microhub_hash, self.microhub_counter) not in self.policy_action_space.index.values):
-                new_row = pd.Series(name='{}/{}'.format(self.microhub_hash, self.microhub_counter))
-                self.policy_action_space = self.policy_action_space.append(new_row, ignore_index=False)
-                self.policy_action_space.fillna(value=0.05, inplace=True)
-                self.policy_action_space['{}/{}'.format(self.microhub_hash, self.microhub_counter)] = 1 / len(
-                    self.state_hashes)
-                # self.policy_action_space.fillna(value=0.05, inplace=True)
-                # self.policy_action_space[self.policy_action_space.eq(0.0)] = self.policy_action_space + (1 / len(self.state_hashes))
+            if '{}/{}'.format(self.microhub_hash, self.microhub_counter) not in self.policy_action_space:
+                self.policy_action_space.add_label('{}/{}'.format(self.microhub_hash, self.microhub_counter), 0.05,
+                                                   1 / len(self.state_hashes))
 
         # epsilon greedy
         p = np.random.random()
         if p < eps:
-            print("Choosed random action from action space.")
+            logger.debug("Choosed random action from action space.")
             highest_prob_action_space = random.choice(legal_next_states)
             return highest_prob_action_space, 1
         else:
             if state.hash_id == self.microhub_hash:
-                action_space_prob = self.policy_action_space.loc[
-                    '{}/{}'.format(state.hash_id, self.microhub_counter), legal_next_states].to_numpy()
+                state_index = self.policy_action_space.get_index('{}/{}'.format(state.hash_id, self.microhub_counter))
             else:
-                action_space_prob = self.policy_action_space.loc[state.hash_id, legal_next_states].to_numpy()
+                state_index = self.policy_action_space.get_index(state.hash_id)
+            action_space_prob = self.policy_action_space.get_weights(state_index,
+                                                                     self.policy_action_space.get_indices(legal_next_states))
             # softmax_space_prob = activationBySoftmax(action_space_prob) if len(legal_next_states) > 1 else [1.0]
             normalized_action_space_prob = normalize_list(action_space_prob) if len(legal_next_states) > 1 else [1.0]
             # highest_prob_action_space_nr = np.random.choice(len(legal_next_states), p=softmax_space_prob)
@@ -489,6 +696,120 @@ class PolicyManager:
             else:
                 return highest_prob_action_space, highest_prob
 
+    def get_action_spaces(self, policy: object, eps: float, vec_env: object, actions: object, legal_masks: object,
+                          microhub_counters: object, state_columns: object, sample_actions: bool = False) -> object:
+        """
+        Gets the action spaces of all episodes of a vectorized environment at once, following the rules of
+        get_action_space: epsilon greedy on the policy weights of the legal next states (ties broken randomly),
+        corrected by the local search and the bin packing. With sample_actions the next stops are drawn
+        proportionally to the policy weights instead, without exploration and corrections.
+        :param policy: policy to follow
+        :param eps: exploration threshold
+        :param vec_env: vectorized environment instance
+        :param actions: actions of the episodes (by vec_env.get_next_legal_actions)
+        :param legal_masks: (episodes x stops)-mask of the legal next states
+        :param microhub_counters: microhub counter of every episode
+        :param state_columns: policy column of every state (by stop index), the microhub mapped to any visit slot
+        :param sample_actions: draw the next stops instead of choosing the most likely ones
+        :return: next stop index, action space prob of every episode (microhub index and 1 if it is not visiting a stop)
+        """
+        next_stops = np.full(len(actions), vec_env.microhub_index, dtype=np.intp)
+        action_space_probs = np.ones(len(actions))
+        visits = np.flatnonzero(actions == 1)
+        if not len(visits):
+            return next_stops, action_space_probs
+
+        # --------------------
+        # POLICY ROWS
+        # the episodes at the microhub read the row of their current visit slot
+        positions = vec_env.positions[visits]
+        state_rows = state_columns[positions]
+        at_microhub = positions == vec_env.microhub_index
+        for microhub_counter in np.unique(microhub_counters[visits][at_microhub]).tolist():
+            state_label = '{}/{}'.format(self.microhub_hash, microhub_counter)
+            if state_label not in policy:
+                policy.add_label(state_label, 0.05, 1 / len(self.state_hashes))
+            state_rows[at_microhub & (microhub_counters[visits] == microhub_counter)] = policy.get_index(state_label)
+
+        legal = legal_masks[visits]
+        weights = np.stack([policy.get_weights(state_row, state_columns) for state_row in state_rows.tolist()])
+        weights = np.where(legal, weights, 0.0)
+        totals = weights.sum(axis=1)
+        counts = legal.sum(axis=1)
+        episodes = np.arange(len(visits))
+
+        if sample_actions:
+            chosen = choose_in_rows(np.where(totals[:, None] > 0, weights, legal))
+            next_stops[visits] = chosen
+            action_space_probs[visits] = np.where(totals > 0, weights[episodes, chosen] / np.where(totals > 0, totals, 1),
+                                                  1 / counts)
+            return next_stops, action_space_probs
+
+        # --------------------
+        # EPSILON GREEDY
+        highest_weights = np.where(legal, weights, -np.inf).max(axis=1)
+        chosen = choose_in_rows(legal & (weights == highest_weights[:, None]))
+        highest_probs = np.where(totals > 0, highest_weights / np.where(totals > 0, totals, 1), 1 / counts)
+        explore = np.random.random(len(visits)) < eps
+        if explore.any():
+            chosen[explore] = choose_in_rows(legal[explore])
+            highest_probs[explore] = 1
+
+        # --------------------
+        # APPLY LOCAL SEARCH AND BIN-PACKING(First Fit Decreasing)
+        distances = vec_env.distances[positions]
+        lowest_states_distance = np.where(legal, distances, np.inf).argmin(axis=1)
+        highest_states_capacities_utilization = np.where(legal, vec_env.capacity_ranks,
+                                                         len(vec_env.capacity_ranks)).argmin(axis=1)
+        tour_weights = vec_env.tour_weights[visits]
+        lowest_distances = distances[episodes, lowest_states_distance]
+        with np.errstate(divide='ignore', invalid='ignore'):
+            diviation_distances_highest_utilization = \
+                1 - lowest_distances / distances[episodes, highest_states_capacities_utilization]
+            diviation_distances_choosen = 1 - lowest_distances / distances[episodes, chosen]
+            divation_weights_to_max = (vec_env.demand_weights[lowest_states_distance] + tour_weights) / \
+                                      (vec_env.demand_weights[highest_states_capacities_utilization] + tour_weights)
+        corrected = np.where(diviation_distances_highest_utilization - diviation_distances_choosen <
+                             self.distance_utilization_threshold, highest_states_capacities_utilization, chosen)
+        corrected = np.where((diviation_distances_highest_utilization > self.local_search_threshold) &
+                             (diviation_distances_choosen > self.local_search_threshold) &
+                             (divation_weights_to_max > self.capacity_utilization_threshold),
+                             lowest_states_distance, corrected)
+        chosen = np.where(~explore & (counts > 1), corrected, chosen)
+
+        next_stops[visits] = chosen
+        action_space_probs[visits] = highest_probs
+        return next_stops, action_space_probs
+
+    def sample_policy(self, policy: object, env: object, max_steps: int, samples: int) -> object:
+        """
+        Constructs samples episodes at once in a vectorized environment by drawing every next stop proportionally to
+        the policy weights.
+        :param policy: current policy
+        :param env: environment instance
+        :param max_steps: max steps amount that the policy manager is allowed to use
+        :param samples: amount of sampled episodes
+        :return: policy reward, all constructed tours of the shortest finished episode
+        """
+        vec_env = VRPVecEnvironment(env, samples)
+        state_columns = policy.get_indices(['{}/{}'.format(self.microhub_hash, 0)] + self.state_hashes[1:])
+        policy_rewards = np.zeros(samples)
+        dones = np.zeros(samples, dtype=bool)
+
+        for step_t in range(max_steps):
+            actions, legal_masks, microhub_counters = vec_env.get_next_legal_actions()
+            next_stops = self.get_action_spaces(policy, 0.0, vec_env, actions, legal_masks, microhub_counters,
+                                                state_columns, sample_actions=True)[0]
+            rewards, dones = vec_env.step(actions, next_stops)[1:]
+            policy_rewards += rewards
+            if dones.all():
+                break
+
+        best_sample = int(np.argmin(np.where(dones, policy_rewards, np.inf))) if dones.any() else int(
+            np.argmin(policy_rewards))
+        logger.debug("sampled %d episodes, shortest policy reward %s", samples, policy_rewards[best_sample])
+        return float(policy_rewards[best_sample]), vec_env.get_all_tours(best_sample)
+
     def get_action(self, state: object) -> object:
         """
         :param state: given state
@@ -515,16 +836,12 @@ class PolicyManager:
 
     def compute_G_t(self, reward_memory: object) -> object:
         """
-        :param reward_memory: list of rewards
+        :param reward_memory: array of rewards, or (batch x T)-array of padded rewards
         :returns: a list of cummulated rewards G_t = R_{t+1} + gamma*R_{t+2} + gamma^2*R_{t+3} + .. + gamma^{T-t-1}*R_{T}
         """
-        G_t = np.zeros_like(reward_memory)
-        for t in range(len(reward_memory)):
-            G_sum = 0
-            for k in range(t, len(reward_memory)):
-                G_sum += reward_memory[k] * self.discount_factor
-                # discount *= gamma
-            G_t[t] = G_sum
+        G_t, _, _ = calculate_discounted_returns(reward_memory,
+                                                 self.discount_factor,
+                                                 legacy_discounting=self.legacy_discounting)
         return G_t
 
     @staticmethod
@@ -543,29 +860,135 @@ class PolicyManager:
         :param aco_probability_matrix: aco result
         :return: None
         """
-        for index, row in aco_probability_matrix.iterrows():
-            for state, aco_probability in row.items():
-                if state not in self.policy_action_space.index.values:
-                    new_row = pd.Series(name=state)
-                    self.policy_action_space = self.policy_action_space.append(new_row, ignore_index=False)
-                    self.policy_action_space[state] = 1 / len(self.state_hashes)
-                    self.policy_action_space.fillna(value=1 / len(self.state_hashes), inplace=True)
-                if aco_probability > 0.00:
-                    self.policy_action_space.at[index, state] = self.policy_action_space.at[
-                                                                    index, state] ** increasing_factor
-
+        for state in aco_probability_matrix.columns:
+            if state not in self.policy_action_space:
+                self.policy_action_space.add_label(state, 1 / len(self.state_hashes), 1 / len(self.state_hashes))
+        aco_columns = self.policy_action_space.get_indices(list(aco_probability_matrix.columns))
+        aco_probabilities = aco_probability_matrix.to_numpy(dtype=np.float64)
+        for index, aco_probability_row in zip(aco_probability_matrix.index, aco_probabilities):
+            self.policy_action_space.power_weights(self.policy_action_space.get_index(index),
+                                                   aco_columns[aco_probability_row > 0.00],
+                                                   increasing_factor)
+
+    def create_policy_action_space(self, labels: object, weights: object = None, fill_value: float = 0.0) -> object:
+        """
+        Creates a dense policy, or a sparse top-k policy if policy_neighbors were given.
+        :param labels: row/column labels
+        :param weights: dense (labels x labels)-weight matrix, None fills every weight with fill_value
+        :param fill_value: initial weight without weight matrix
+        :return: policy action space
+        """
+        if self.policy_candidates is None:
+            return PolicyActionSpace(labels, weights, fill_value)
+        if weights is None:
+            return SparsePolicyActionSpace(labels, self.policy_candidates, self.microhub_hash, self.policy_top_k,
+                                           fill_value)
+        return SparsePolicyActionSpace.from_dense(labels, weights, self.policy_candidates, self.microhub_hash,
+                                                  self.policy_top_k)
+
+    @timed('model_save')
     def saveModel(self, model_name: str) -> object:
         """
+        Saves the policy as float32 weight matrix (.npy), a sparse policy as arrays of its stored cells (.npz), with a
+        JSON header (.json) holding the labels.
         :param model_name: ML-Model name that will be saved
         :return: None
         """
-        save_memory_df_to_local('./model/' + model_name + '.pkl', self.policy_action_space)
+        last_seen = {label: self.stop_last_seen[label] for label in self.policy_action_space.labels
+                     if label in self.stop_last_seen}
+        meta = {'model_name': model_name, 'stop_count': len(self.state_hashes) - 1}
+        if isinstance(self.policy_action_space, SparsePolicyActionSpace):
+            save_sparse_model_to_local('./model/' + model_name, self.policy_action_space.labels,
+                                       self.policy_action_space.get_arrays(), self.microhub_hash,
+                                       self.policy_action_space.top_k, last_seen=last_seen, meta=meta)
+        else:
+            save_model_to_local('./model/' + model_name, self.policy_action_space.labels,
+                                self.policy_action_space.get_matrix(), self.microhub_hash,
+                                last_seen=last_seen, meta=meta)
 
+    @timed('model_load')
     def loadModel(self, model_name: str) -> object:
         """
+        Loads the policy from the memory mapped .npy/.json model. A pickled model (.pkl) of older versions is loaded
+        once and converted, without any model a new policy is created. Dense and sparse models are converted to the
+        representation of the policy manager. With stale_stop_days set, stops that were not part of the stop data
+        for more than stale_stop_days days are removed.
         :param model_name: ML-Model name that will be loaded
         :return: None
         """
-        loaded_model = load_memory_df_from_local('./model/' + model_name + '.pkl', self.state_hashes,
-                                                 self.microhub_hash)
-        self.policy_action_space = loaded_model
+        model_path = './model/' + model_name
+        if model_exists(model_path):
+            header, weights = load_model_from_local(model_path)
+            if header.get('representation', 'dense') == 'sparse':
+                sparse_policy = SparsePolicyActionSpace.from_arrays(header['labels'], weights,
+                                                                    self.policy_candidates or dict(),
+                                                                    self.microhub_hash, header['top_k'])
+                self.policy_action_space = sparse_policy if self.policy_candidates is not None else \
+                    PolicyActionSpace(header['labels'], sparse_policy.get_matrix())
+            else:
+                self.policy_action_space = self.create_policy_action_space(header['labels'], weights)
+            self.stop_last_seen = dict(header.get('last_seen', {}))
+            self.add_missing_states()
+            self.update_stop_last_seen()
+        elif os.path.exists(model_path + '.pkl'):
+            loaded_model = load_memory_df_from_local(model_path + '.pkl', self.state_hashes, self.microhub_hash)
+            dense_policy = PolicyActionSpace.from_dataframe(loaded_model)
+            self.policy_action_space = self.create_policy_action_space(dense_policy.labels,
+                                                                       dense_policy.get_matrix())
+            self.stop_last_seen = dict()
+            self.update_stop_last_seen()
+            logger.info("Converting pickled model %s", model_path)
+            self.saveModel(model_name)
+        else:
+            logger.info("No model to load from, creating new model")
+            self.policy_action_space = self.create_policy_action_space(
+                self.state_hashes[1:] + ['{}/{}'.format(self.microhub_hash, 0)], fill_value=1 / len(self.state_hashes))
+            self.stop_last_seen = dict()
+            self.update_stop_last_seen()
+        if self.stale_stop_days is not None:
+            self.prune_stale_stops()
+        self.baseline_cache = dict()
+
+    def add_missing_states(self) -> object:
+        """
+        Adds the states that the loaded policy does not know yet (the microhub as first microhub visit), their rows
+        and columns are filled with 1 / amount of states.
+        :return: None
+        """
+        states = ['{}/{}'.format(self.microhub_hash, 0) if state == self.microhub_hash else state
+                  for state in self.state_hashes]
+        missing_states = [state for state in states if state not in self.policy_action_space]
+        if missing_states:
+            logger.debug("Filling up the model with %d missing hashIdentifiers", len(missing_states))
+            self.policy_action_space.add_labels(missing_states, 1 / len(self.state_hashes), 1 / len(self.state_hashes))
+
+    def update_stop_last_seen(self) -> object:
+        """
+        Marks the current stops as seen today. Stops of the model without a date (e.g. of converted models) are
+        treated as seen today as well.
+        :return: None
+        """
+        today = date.today().isoformat()
+        for state in self.state_hashes[1:]:
+            self.stop_last_seen[state] = today
+        microhub_slot_prefix = self.microhub_hash + '/'
+        for label in self.policy_action_space.labels:
+            if not label.startswith(microhub_slot_prefix):
+                self.stop_last_seen.setdefault(label, today)
+
+    def prune_stale_stops(self) -> object:
+        """
+        Removes the stops that were not part of the stop data for more than stale_stop_days days from the policy, so
+        models do not grow forever. Microhub visit slots are kept.
+        :return: None
+        """
+        today = date.today()
+        microhub_slot_prefix = self.microhub_hash + '/'
+        stale_stops = [label for label in self.policy_action_space.labels
+                       if not label.startswith(microhub_slot_prefix)
+                       and (today - date.fromisoformat(self.stop_last_seen[label])).days > self.stale_stop_days]
+        if stale_stops:
+            logger.info("Removing %d stops not seen for more than %d days", len(stale_stops), self.stale_stop_days)
+            self.policy_action_space.remove_labels(stale_stops)
+            for label in stale_stops:
+                del self.stop_last_seen[label]
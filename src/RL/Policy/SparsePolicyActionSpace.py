@@ -0,0 +1,577 @@
+from typing import Dict, List
+
+import numpy as np
+import pandas as pd
+
+from src.RL.Policy.PolicyActionSpace import version_clock
+from src.Utils.instrumentation import increment
+
+EMPTY_COLUMN = np.iinfo(np.int32).max
+
+
+class SparsePolicyActionSpace:
+    """
+    Parameterized policy storing weights only for the candidates of every row, with the same interface as
+    PolicyActionSpace. Rows and columns share the same labels: the stop hash_ids (without the microhub) followed by
+    the microhub visit slots '{microhub_hash}/{microhub_counter}'.
+    Every row holds up to width (column, weight)-pairs sorted by column, in CSR-like arrays with a fixed row length:
+    the row's own cell, the k nearest stops of the row's stop, the microhub visit slots and spare slots for further written cells (e.g. microhub visits).
+    Every other cell holds a default value. Like in the dense policy, a cell takes the column fill of its column if
+    the column was added after the row (or with it), otherwise the fill of its row.
+    Cells are inserted when they are written. When a row has no spare slot left, the stored cell closest to its
+    default is evicted (falls back to its default), so a write of a chosen cell is never lost. Decays of cells that
+    are not stored are skipped, they keep their default and leave the spare slots to the written cells.
+    Weights and softmax of a row are calculated from its stored cells and the defaults, without building the dense
+    row.
+    While a write journal is open (begin_journal), every written row is recorded before the write, so an update is
+    reverted (rollback) or kept (commit) in time proportional to its writes.
+    """
+
+    CANDIDATE_RESERVE = 16
+    HUB_SLOT_RESERVE = 16
+
+    def __init__(self,
+                 labels: List[str],
+                 candidates: Dict[str, List[str]],
+                 microhub_hash: str,
+                 top_k: int,
+                 fill_value: float = 0.0,
+                 candidate_reserve: int = CANDIDATE_RESERVE,
+                 hub_slot_reserve: int = HUB_SLOT_RESERVE) -> None:
+
+        # --------------------
+        # LABELS
+        self.labels = list(labels)
+        self.label_index: Dict[str, int] = {label: index for index, label in enumerate(self.labels)}
+        self.size = len(self.labels)
+
+        # --------------------
+        # CANDIDATES
+        # stop label -> labels of its k nearest stops, the microhub visit slots use the candidates of the microhub
+        self.candidates = candidates
+        self.microhub_hash = microhub_hash
+        self.hub_slot_columns = [index for index, label in enumerate(self.labels)
+                                 if label.startswith(microhub_hash + '/')]
+        self.top_k = top_k
+        self.width = top_k + 1 + max(candidate_reserve, 1)
+
+        # --------------------
+        # WEIGHTS
+        capacity = self.size + max(hub_slot_reserve, 1)
+        self.columns = np.full((capacity, self.width), EMPTY_COLUMN, dtype=np.int32)
+        self.values = np.zeros((capacity, self.width), dtype=np.float32)
+        self.row_lengths = np.zeros(capacity, dtype=np.intp)
+        # column -> weight of the row read by get_weights, NaN between the reads
+        self.weight_map = np.full(capacity, np.nan, dtype=np.float64)
+
+        # --------------------
+        # DEFAULTS
+        # NaN column defaults fall back to the row default
+        self.row_defaults = np.zeros(capacity, dtype=np.float32)
+        self.row_defaults[:self.size] = fill_value
+        self.column_defaults = np.full(capacity, np.nan, dtype=np.float32)
+        # sorted indices of the columns with a column default
+        self.filled_columns = np.zeros(0, dtype=np.intp)
+
+        # --------------------
+        # ROW VERSIONS
+        self.row_versions = np.full(capacity, next(version_clock), dtype=np.int64)
+
+        # --------------------
+        # WRITE JOURNAL
+        # entries in writing order, None while no journal is open
+        self.journal = None
+
+        for row in range(self.size):
+            self.init_candidates(row)
+
+    @classmethod
+    def from_dense(cls, labels: List[str], weights: np.ndarray, candidates: Dict[str, List[str]], microhub_hash: str,
+                   top_k: int) -> object:
+        """
+        Keeps the weights of the candidates of a dense weight matrix, the median of every row becomes its default.
+        :param labels: row/column labels
+        :param weights: (labels x labels)-weight matrix
+        :param candidates: stop label -> labels of its k nearest stops
+        :param microhub_hash: hash_id of the microhub
+        :param top_k: amount of nearest stops per row
+        :return: sparse policy action space
+        """
+        policy = cls(labels, candidates, microhub_hash, top_k)
+        weights = np.asarray(weights, dtype=np.float32)
+        if policy.size:
+            policy.row_defaults[:policy.size] = np.median(weights, axis=1)
+        for row in range(policy.size):
+            row_length = policy.row_lengths[row]
+            policy.values[row, :row_length] = weights[row, policy.columns[row, :row_length]]
+        return policy
+
+    @classmethod
+    def from_arrays(cls, labels: List[str], arrays: Dict[str, np.ndarray], candidates: Dict[str, List[str]],
+                    microhub_hash: str, top_k: int) -> object:
+        """
+        :param labels: row/column labels
+        :param arrays: columns, values, row_lengths, row_defaults and column_defaults as saved by get_arrays
+        :param candidates: stop label -> labels of its k nearest stops, used for rows added later
+        :param microhub_hash: hash_id of the microhub
+        :param top_k: amount of nearest stops per row
+        :return: sparse policy action space
+        """
+        width = arrays['columns'].shape[1]
+        policy = cls([], candidates, microhub_hash, top_k, candidate_reserve=max(width - top_k - 1, 1),
+                     hub_slot_reserve=len(labels) + cls.HUB_SLOT_RESERVE)
+        size = len(labels)
+        policy.labels = list(labels)
+        policy.label_index = {label: index for index, label in enumerate(policy.labels)}
+        policy.hub_slot_columns = [index for index, label in enumerate(policy.labels)
+                                   if label.startswith(microhub_hash + '/')]
+        policy.size = size
+        policy.columns[:size, :width] = arrays['columns']
+        policy.values[:size, :width] = arrays['values']
+        policy.row_lengths[:size] = arrays['row_lengths']
+        policy.row_defaults[:size] = arrays['row_defaults']
+        policy.column_defaults[:size] = arrays['column_defaults']
+        policy.filled_columns = np.flatnonzero(~np.isnan(policy.column_defaults[:size]))
+        return policy
+
+    def get_arrays(self) -> Dict[str, np.ndarray]:
+        """
+        :return: columns, values, row lengths, row defaults and column defaults of the used rows
+        """
+        return {
+            'columns': self.columns[:self.size],
+            'values': self.values[:self.size],
+            'row_lengths': self.row_lengths[:self.size],
+            'row_defaults': self.row_defaults[:self.size],
+            'column_defaults': self.column_defaults[:self.size],
+        }
+
+    def to_dataframe(self) -> pd.DataFrame:
+        """
+        :return: policy as DataFrame with labels as index and columns
+        """
+        return pd.DataFrame(self.get_matrix().astype(np.float64), index=list(self.labels), columns=list(self.labels))
+
+    def __len__(self) -> int:
+        return self.size
+
+    def __contains__(self, label: str) -> bool:
+        return label in self.label_index
+
+    def get_capacity(self) -> int:
+        """
+        :return: amount of allocated rows
+        """
+        return self.columns.shape[0]
+
+    def get_matrix(self) -> np.ndarray:
+        """
+        :return: dense (size x size)-copy of the weights, meant for small policies only
+        """
+        return np.stack([self.get_row(row) for row in range(self.size)]) if self.size else \
+            np.zeros((0, 0), dtype=np.float32)
+
+    def get_index(self, label: str) -> int:
+        """
+        :param label: row/column label
+        :return: row/column index
+        """
+        return self.label_index[label]
+
+    def get_indices(self, labels: List[str]) -> np.ndarray:
+        """
+        :param labels: list of row/column labels
+        :return: array of row/column indices
+        """
+        return np.fromiter((self.label_index[label] for label in labels), dtype=np.intp, count=len(labels))
+
+    def get_row_version(self, row: int) -> int:
+        """
+        :param row: row index
+        :return: current version of the row
+        """
+        return self.row_versions.item(row)
+
+    def get_candidate_labels(self, label: str) -> List[str]:
+        """
+        :param label: row label
+        :return: labels of the nearest stops of the row's stop
+        """
+        candidate_labels = self.candidates.get(label)
+        if candidate_labels is None and label.startswith(self.microhub_hash + '/'):
+            candidate_labels = self.candidates.get(self.microhub_hash)
+        return candidate_labels or []
+
+    def init_candidates(self, row: int) -> None:
+        """
+        Stores the default weights of the row's own cell, its known nearest stops and the microhub visit slots (as
+        far as the row has room for them), so later writes find their slots.
+        :param row: row index
+        """
+        columns = [row] + [self.label_index[label] for label in self.get_candidate_labels(self.labels[row])
+                           if label in self.label_index] + self.hub_slot_columns
+        columns = sorted(list(dict.fromkeys(columns))[:self.width])
+        columns = np.asarray(columns, dtype=np.intp)
+        self.columns[row, :] = EMPTY_COLUMN
+        self.columns[row, :len(columns)] = columns
+        self.values[row, :len(columns)] = self.get_defaults(row, columns)
+        self.row_lengths[row] = len(columns)
+
+    def get_defaults(self, row: int, cols: np.ndarray) -> np.ndarray:
+        """
+        :param row: row index
+        :param cols: column indices
+        :return: default weights of the given cells
+        """
+        column_defaults = self.column_defaults[cols]
+        return np.where((cols >= row) & ~np.isnan(column_defaults), column_defaults, self.row_defaults[row])
+
+    def get_filled_columns(self, row: int) -> np.ndarray:
+        """
+        :param row: row index
+        :return: sorted indices of the columns whose cells in the row default to the column default
+        """
+        return self.filled_columns[np.searchsorted(self.filled_columns, row):]
+
+    def find_slots(self, row: int, cols: np.ndarray) -> (np.ndarray, np.ndarray):
+        """
+        :param row: row index
+        :param cols: column indices
+        :return: slot of every column in the row, mask of the columns that are stored
+        """
+        row_length = self.row_lengths[row]
+        slots = np.searchsorted(self.columns[row, :row_length], cols)
+        slots = np.minimum(slots, max(row_length - 1, 0))
+        stored = (self.columns[row, slots] == cols) & (row_length > 0)
+        return slots, stored
+
+    def get_weight(self, row: int, col: int) -> float:
+        """
+        :param row: row index
+        :param col: column index
+        :return: weight as float
+        """
+        slots, stored = self.find_slots(row, np.array([col]))
+        if stored[0]:
+            return self.values.item(row, slots[0])
+        return float(self.get_defaults(row, np.array([col]))[0])
+
+    def set_weight(self, row: int, col: int, weight: float) -> None:
+        """
+        Sets the weight of a stored cell, other cells are inserted while the row has spare slots.
+        :param row: row index
+        :param col: column index
+        :param weight: new weight
+        """
+        self.record_row(row)
+        slots, stored = self.find_slots(row, np.array([col]))
+        if stored[0]:
+            self.values[row, slots[0]] = weight
+        else:
+            self.insert_weight(row, col, weight)
+        self.row_versions[row] = next(version_clock)
+
+    def insert_weight(self, row: int, col: int, weight: float) -> None:
+        """
+        Stores a cell that is not stored yet. When the row has no spare slot left, the stored cell closest to its
+        default is evicted first.
+        :param row: row index
+        :param col: column index
+        :param weight: new weight
+        """
+        if self.row_lengths[row] == self.width:
+            self.evict_weight(row)
+        row_length = self.row_lengths[row]
+        slot = int(np.searchsorted(self.columns[row, :row_length], col))
+        self.columns[row, slot + 1:row_length + 1] = self.columns[row, slot:row_length].copy()
+        self.values[row, slot + 1:row_length + 1] = self.values[row, slot:row_length].copy()
+        self.columns[row, slot] = col
+        self.values[row, slot] = weight
+        self.row_lengths[row] += 1
+
+    def evict_weight(self, row: int) -> None:
+        """
+        Removes the stored cell of the row whose weight is closest to its default, the cell falls back to its
+        default.
+        :param row: row index
+        """
+        row_length = self.row_lengths[row]
+        columns = self.columns[row, :row_length].astype(np.intp)
+        slot = int(np.argmin(np.absolute(self.values[row, :row_length] - self.get_defaults(row, columns))))
+        self.columns[row, slot:row_length - 1] = self.columns[row, slot + 1:row_length].copy()
+        self.values[row, slot:row_length - 1] = self.values[row, slot + 1:row_length].copy()
+        self.columns[row, row_length - 1] = EMPTY_COLUMN
+        self.row_lengths[row] -= 1
+        increment('sparse_policy_evicted_cells')
+
+    def get_row(self, row: int) -> np.ndarray:
+        """
+        :param row: row index
+        :return: dense copy of the used part of the row
+        """
+        weights = self.get_defaults(row, np.arange(self.size)).astype(np.float32)
+        row_length = self.row_lengths[row]
+        weights[self.columns[row, :row_length]] = self.values[row, :row_length]
+        return weights
+
+    def get_weights(self, row: int, cols: np.ndarray) -> np.ndarray:
+        """
+        :param row: row index
+        :param cols: column indices
+        :return: weights of the given cells as float64-array
+        """
+        filled_columns = self.get_filled_columns(row)
+        row_columns = self.columns[row, :self.row_lengths[row]]
+        self.weight_map[filled_columns] = self.column_defaults[filled_columns]
+        self.weight_map[row_columns] = self.values[row, :len(row_columns)]
+        weights = self.weight_map[cols]
+        self.weight_map[filled_columns] = np.nan
+        self.weight_map[row_columns] = np.nan
+        weights[np.isnan(weights)] = self.row_defaults[row]
+        return weights
+
+    def get_softmax_weights(self, row: int, cols: np.ndarray) -> np.ndarray:
+        """
+        Softmax of the whole row at the given columns. The normalization is summed up from the stored cells, the
+        column defaults and the row default times the amount of its cells, so it costs O(width) instead of O(size).
+        :param row: row index
+        :param cols: column indices
+        :return: softmax weights of the given cells as float64-array
+        """
+        row_length = self.row_lengths[row]
+        stored_weights = self.values[row, :row_length].astype(np.float64)
+        filled_columns = self.get_filled_columns(row)
+        filled_columns = filled_columns[~self.find_slots(row, filled_columns)[1]]
+        filled_weights = self.column_defaults[filled_columns].astype(np.float64)
+        row_default = float(self.row_defaults[row])
+        row_default_count = self.size - row_length - len(filled_columns)
+        max_weight = max(stored_weights.max(initial=-np.inf), filled_weights.max(initial=-np.inf),
+                         row_default if row_default_count else -np.inf)
+        normalization = (np.sum(np.exp(stored_weights - max_weight)) + np.sum(np.exp(filled_weights - max_weight))
+                         + row_default_count * np.exp(row_default - max_weight))
+        return np.exp(self.get_weights(row, cols) - max_weight) / normalization
+
+    def power_weights(self, row: int, cols: np.ndarray, exponent: float) -> None:
+        """
+        Raises the weights of the given stored cells to the given power, cells that are not stored keep their
+        default.
+        :param row: row index
+        :param cols: column indices
+        :param exponent: exponent
+        """
+        self.record_row(row)
+        slots, stored = self.find_slots(row, cols)
+        stored_slots = slots[stored]
+        self.values[row, stored_slots] = self.values[row, stored_slots].astype(np.float64) ** exponent
+        self.row_versions[row] = next(version_clock)
+
+    def get_cells(self, rows: np.ndarray, cols: np.ndarray) -> np.ndarray:
+        """
+        :param rows: row index of every cell
+        :param cols: column index of every cell
+        :return: weights of the given cells as float64-array
+        """
+        weights = np.zeros(len(rows), dtype=np.float64)
+        for row, cells in self.group_cells(rows):
+            weights[cells] = self.get_weights(row, cols[cells])
+        return weights
+
+    def set_cells(self, rows: np.ndarray, cols: np.ndarray, weights: np.ndarray) -> None:
+        """
+        Sets the weights of the given cells row by row, see set_weight. Every cell must be given once.
+        :param rows: row index of every cell
+        :param cols: column index of every cell
+        :param weights: new weight of every cell
+        """
+        for row, cells in self.group_cells(rows):
+            for col, weight in zip(cols[cells].tolist(), weights[cells].tolist()):
+                self.set_weight(row, col, weight)
+
+    def power_cells(self, rows: np.ndarray, cols: np.ndarray, exponent: float) -> None:
+        """
+        Raises the weights of the given cells to the given power row by row, see power_weights. Every cell must be
+        given once.
+        :param rows: row index of every cell
+        :param cols: column index of every cell
+        :param exponent: exponent
+        """
+        for row, cells in self.group_cells(rows):
+            self.power_weights(row, cols[cells], exponent)
+
+    @staticmethod
+    def group_cells(rows: np.ndarray) -> object:
+        """
+        :param rows: row index of every cell
+        :return: (row, positions of its cells) of every given row
+        """
+        order = np.argsort(rows, kind='stable')
+        boundaries = np.flatnonzero(np.diff(rows[order])) + 1
+        return [(int(rows[cells[0]]), cells) for cells in np.split(order, boundaries) if len(cells)]
+
+    def add_label(self, label: str, row_fill: float, column_fill: float) -> int:
+        """
+        Adds a new row/column. The row is filled first, the column afterwards, so the new diagonal cell holds the
+        column value.
+        :param label: new row/column label
+        :param row_fill: value of the new row
+        :param column_fill: value of the new column
+        :return: index of the new row/column
+        """
+        self.record_labels()
+        if self.size == self.get_capacity():
+            self.grow(2 * self.get_capacity())
+        index = self.size
+        self.labels.append(label)
+        self.label_index[label] = index
+        if label.startswith(self.microhub_hash + '/'):
+            self.hub_slot_columns.append(index)
+        self.size += 1
+        self.row_defaults[index] = row_fill
+        self.column_defaults[index] = column_fill
+        self.filled_columns = np.append(self.filled_columns, index)
+        self.init_candidates(index)
+        self.row_versions[:self.size] = next(version_clock)
+        return index
+
+    def add_labels(self, labels: List[str], row_fill: float, column_fill: float) -> np.ndarray:
+        """
+        Adds several new rows/columns one after another.
+        :param labels: new row/column labels
+        :param row_fill: value of the new rows
+        :param column_fill: value of the new columns
+        :return: indices of the new rows/columns
+        """
+        return np.array([self.add_label(label, row_fill, column_fill) for label in labels], dtype=np.intp)
+
+    def remove_labels(self, labels: List[str]) -> None:
+        """
+        Removes the rows/columns of the given labels, the remaining labels keep their order.
+        :param labels: row/column labels to be removed
+        """
+        removed = set(labels)
+        keep = np.fromiter((index for index, label in enumerate(self.labels) if label not in removed), dtype=np.intp)
+        index_map = np.full(self.get_capacity(), -1, dtype=np.intp)
+        index_map[keep] = np.arange(len(keep))
+
+        columns = self.columns[keep]
+        values = self.values[keep]
+        in_use = np.arange(self.width) < self.row_lengths[keep][:, np.newaxis]
+        mapped = np.where(in_use, index_map[np.where(in_use, columns, 0)], -1)
+        mapped = np.where(mapped >= 0, mapped, EMPTY_COLUMN)
+        order = np.argsort(mapped, axis=1, kind='stable')
+
+        size = len(keep)
+        self.columns[:, :] = EMPTY_COLUMN
+        self.columns[:size] = np.take_along_axis(mapped, order, axis=1)
+        self.values[:size] = np.take_along_axis(values, order, axis=1)
+        self.row_lengths[:size] = (mapped != EMPTY_COLUMN).sum(axis=1)
+        self.row_lengths[size:] = 0
+        self.row_defaults[:size] = self.row_defaults[keep]
+        self.column_defaults[:size] = self.column_defaults[keep]
+        self.filled_columns = np.flatnonzero(~np.isnan(self.column_defaults[:size]))
+        self.labels = [self.labels[index] for index in keep]
+        self.hub_slot_columns = [int(index_map[index]) for index in self.hub_slot_columns if index_map[index] >= 0]
+        self.label_index = {label: index for index, label in enumerate(self.labels)}
+        self.size = size
+        self.row_versions[:] = next(version_clock)
+
+    def begin_journal(self) -> None:
+        """
+        Opens a write journal, the following writes (weights and new labels) can be reverted with rollback.
+        Removing labels is not journaled.
+        """
+        self.journal = []
+
+    def record_row(self, row: int) -> None:
+        """
+        Records the stored cells and the version of the row before it is written.
+        :param row: row index
+        """
+        if self.journal is not None:
+            self.journal.append(('row', row, self.columns[row].copy(), self.values[row].copy(),
+                                 self.row_lengths[row], self.row_versions[row]))
+
+    def record_labels(self) -> None:
+        """
+        Records the labels and row versions before a label is added.
+        """
+        if self.journal is not None:
+            self.journal.append(('labels', self.size, self.row_versions[:self.size].copy(),
+                                 len(self.hub_slot_columns)))
+
+    def rollback(self) -> None:
+        """
+        Reverts all writes since begin_journal in reverse order and closes the journal.
+        """
+        for entry in reversed(self.journal):
+            if entry[0] == 'row':
+                row, columns, values, row_length, row_version = entry[1:]
+                self.columns[row] = columns
+                self.values[row] = values
+                self.row_lengths[row] = row_length
+                self.row_versions[row] = row_version
+            else:
+                size, row_versions, hub_slot_count = entry[1:]
+                for label in self.labels[size:]:
+                    del self.label_index[label]
+                del self.labels[size:]
+                del self.hub_slot_columns[hub_slot_count:]
+                self.filled_columns = self.filled_columns[self.filled_columns < size]
+                self.size = size
+                self.row_versions[:size] = row_versions
+        self.journal = None
+
+    def commit(self) -> None:
+        """
+        Keeps all writes since begin_journal and closes the journal.
+        """
+        self.journal = None
+
+    def grow(self, capacity: int) -> None:
+        """
+        Reallocates the rows with the given capacity.
+        :param capacity: new amount of allocated rows
+        """
+        columns = np.full((capacity, self.width), EMPTY_COLUMN, dtype=np.int32)
+        columns[:self.size] = self.columns[:self.size]
+        values = np.zeros((capacity, self.width), dtype=np.float32)
+        values[:self.size] = self.values[:self.size]
+        row_lengths = np.zeros(capacity, dtype=np.intp)
+        row_lengths[:self.size] = self.row_lengths[:self.size]
+        row_defaults = np.zeros(capacity, dtype=np.float32)
+        row_defaults[:self.size] = self.row_defaults[:self.size]
+        column_defaults = np.full(capacity, np.nan, dtype=np.float32)
+        column_defaults[:self.size] = self.column_defaults[:self.size]
+        row_versions = np.zeros(capacity, dtype=np.int64)
+        row_versions[:self.size] = self.row_versions[:self.size]
+        self.columns = columns
+        self.values = values
+        self.row_lengths = row_lengths
+        self.row_defaults = row_defaults
+        self.column_defaults = column_defaults
+        self.row_versions = row_versions
+        self.weight_map = np.full(capacity, np.nan, dtype=np.float64)
+
+    def copy(self) -> object:
+        """
+        :return: deep copy of the policy action space, the candidates are shared
+        """
+        policy_copy = SparsePolicyActionSpace.__new__(SparsePolicyActionSpace)
+        policy_copy.labels = list(self.labels)
+        policy_copy.label_index = dict(self.label_index)
+        policy_copy.size = self.size
+        policy_copy.candidates = self.candidates
+        policy_copy.microhub_hash = self.microhub_hash
+        policy_copy.hub_slot_columns = list(self.hub_slot_columns)
+        policy_copy.top_k = self.top_k
+        policy_copy.width = self.width
+        policy_copy.columns = self.columns.copy()
+        policy_copy.values = self.values.copy()
+        policy_copy.row_lengths = self.row_lengths.copy()
+        policy_copy.row_defaults = self.row_defaults.copy()
+        policy_copy.column_defaults = self.column_defaults.copy()
+        policy_copy.filled_columns = self.filled_columns.copy()
+        policy_copy.row_versions = self.row_versions.copy()
+        policy_copy.weight_map = self.weight_map.copy()
+        policy_copy.journal = None
+        return policy_copy
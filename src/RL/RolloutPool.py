@@ -0,0 +1,101 @@
+import random
+from multiprocessing import Pool
+from typing import List, Tuple
+
+import numpy as np
+
+from src.Utils.logger import get_log_level, setup_logging
+
+# --------------------
+# WORKER STATE
+# set up once per worker process by init_rollout_worker
+worker_state = dict()
+
+
+def init_rollout_worker(env, policy_manager, num_episodes, max_steps, discount_factor, log_level):
+    """
+    Builds the worker's own agent on copies of the environment and the policy manager.
+    """
+    setup_logging(log_level)
+    # imported here, the agent module itself depends on the rollout pool
+    from src.RL.VRPAgent import VRPAgent
+    worker_state['agent'] = VRPAgent(env, policy_manager, num_episodes, max_steps, discount_factor)
+
+
+def run_rollout(task):
+    """
+    Rolls out one episode on the given policy snapshot.
+    :param task: (policy snapshot, epsilon, epoch, seed of the episode)
+    :return: episode buffer, episode reward, episode length, tours as stop_ids
+    """
+    policy_action_space, eps, epoch, seed = task
+    agent = worker_state['agent']
+    agent.policy_manager.policy_action_space = policy_action_space
+    agent.policy_manager.microhub_counter = 0
+    agent.eps = eps
+
+    # --------------------
+    # SEEDING
+    # both random streams of the process are seeded per episode
+    episode_rng = random.Random(seed)
+    random.seed(episode_rng.getrandbits(64))
+    np.random.seed(episode_rng.getrandbits(32))
+
+    agent.episode_statistics.episode_rewards[epoch] = 0.0
+    agent.run_episode(epoch)
+    tours = [[stop.stop_id for stop in tour] for tour in agent.episode_statistics.episode_tours[epoch]]
+    return agent.episode, \
+           agent.episode_statistics.episode_rewards[epoch], \
+           agent.episode_statistics.episode_lengths[epoch], \
+           tours
+
+
+class RolloutPool:
+    """
+    Pool of worker processes rolling out several episodes on a read-only snapshot of the policy.
+    Every episode is seeded by (seed, epoch), so the rollouts only depend on the seed and not on the scheduling of
+    the workers.
+    """
+
+    def __init__(self,
+                 workers: int,
+                 env: object,
+                 policy_manager: object,
+                 num_episodes: int,
+                 max_steps: int,
+                 discount_factor: float,
+                 seed: int) -> None:
+
+        # --------------------
+        # SEEDING
+        self.seed = seed
+
+        # --------------------
+        # WORKERS
+        self.pool = Pool(processes=workers,
+                         initializer=init_rollout_worker,
+                         initargs=(env, policy_manager, num_episodes, max_steps, discount_factor, get_log_level()))
+
+    def __enter__(self) -> object:
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback) -> None:
+        self.close()
+
+    def run_episodes(self, policy_action_space: object, eps: float,
+                     epochs: List[int]) -> List[Tuple[object, float, int, List[List[int]]]]:
+        """
+        :param policy_action_space: current policy, it is not changed by the rollouts
+        :param eps: exploration threshold
+        :param epochs: epochs to roll out
+        :return: episode buffer, episode reward, episode length and tours as stop_ids of every epoch, in epoch order
+        """
+        tasks = [(policy_action_space, eps, epoch, '{}/{}'.format(self.seed, epoch)) for epoch in epochs]
+        return self.pool.map(run_rollout, tasks)
+
+    def close(self) -> None:
+        """
+        Stops the workers.
+        """
+        self.pool.close()
+        self.pool.join()
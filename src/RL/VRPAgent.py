@@ -1,8 +1,16 @@
-import collections
+import random
 from collections import namedtuple
 
 import numpy as np
 
+from src.Mdp.VRPVecEnvironment import VRPVecEnvironment
+from src.RL.EpisodeBuffer import EpisodeBuffer
+from src.RL.RolloutPool import RolloutPool
+from src.Utils.instrumentation import increment, timed
+from src.Utils.logger import get_logger
+
+logger = get_logger('agent')
+
 
 class VRPAgent:
     """
@@ -21,7 +29,10 @@ class VRPAgent:
                  num_episodes,
                  max_steps,
                  discount_factor,
-                 eps=0.15):
+                 eps=0.15,
+                 rollout_workers=1,
+                 episodes_per_update=1,
+                 vectorized_rollouts=False):
 
         # --------------------
         # GIVEN INSTANCES
@@ -34,23 +45,15 @@ class VRPAgent:
         self.max_steps = max_steps
         self.gamma = discount_factor
         self.eps = eps
+        # batched training: episodes_per_update episodes are rolled out in rollout_workers processes per update
+        self.rollout_workers = rollout_workers
+        self.episodes_per_update = episodes_per_update
+        # the episodes of a batched update are rolled out in lockstep in one vectorized environment instead
+        self.vectorized_rollouts = vectorized_rollouts
 
         # --------------------
         # EPISODE META
-        self.episode = []
-        self.Transition = collections.namedtuple("Transition",
-                                                 ["state",
-                                                  "action",
-                                                  "action_space_prob",
-                                                  "reward",
-                                                  "next_state",
-                                                  "done",
-                                                  "possible_next_states",
-                                                  "possible_next_states_hub_ignored",
-                                                  "possible_rewards",
-                                                  "microhub_counter"
-                                                  ]
-                                                 )
+        self.episode = EpisodeBuffer(max_steps, candidate_capacity=max_steps * 4)
         self.episode_statistics = VRPAgent.EpisodeStats(
             episode_lengths=np.zeros(num_episodes),
             episode_rewards=np.zeros(num_episodes),
@@ -60,11 +63,21 @@ class VRPAgent:
             episode_policy_reward=np.zeros(num_episodes)
         )
 
+        # --------------------
+        # VECTORIZED ROLLOUTS
+        # created on the first batch, one episode buffer per episode of the batch
+        self.vec_env = None
+        self.vec_episodes = []
+
     def train_model(self) -> object:
         """
         START TRAINING THE ML-MODEL
         :return: episode statistics, policy action space, best policy reward, worst policy reward, last policy reward
         """
+        if self.rollout_workers > 1 or self.episodes_per_update > 1 or self.vectorized_rollouts:
+            self.train_model_batched()
+            return self.get_training_results()
+
         for epoch in range(self.num_episodes):
             self.run_episode(epoch)
             G_t, J_avR, loseHistory, eps, policy_reward = self.policy_manager.policy_update_by_learning(self.env,
@@ -83,7 +96,74 @@ class VRPAgent:
 
             self.eps = eps
             self.env.reset()
+            logger.info("Episode %d/%d: episode reward %s, policy reward %s, steps %d", epoch + 1, self.num_episodes,
+                        self.episode_statistics.episode_rewards[epoch], policy_reward,
+                        self.episode_statistics.episode_lengths[epoch] + 1)
+
+        return self.get_training_results()
+
+    def train_model_batched(self) -> object:
+        """
+        Rolls out episodes_per_update episodes in parallel on a snapshot of the policy (or in lockstep in a vectorized
+        environment) and learns from all of them in one policy update.
+        :return: None
+        """
+        if self.vectorized_rollouts:
+            self.train_batches(self.run_episodes_vectorized)
+            return
+
+        with RolloutPool(self.rollout_workers, self.env, self.policy_manager, self.num_episodes, self.max_steps,
+                         self.gamma, random.getrandbits(32)) as rollout_pool:
+            self.train_batches(lambda epochs: rollout_pool.run_episodes(self.policy_manager.policy_action_space,
+                                                                        self.eps, epochs))
+
+    def train_batches(self, run_episodes: object) -> object:
+        """
+        Trains batch by batch. The episode statistics are still filled per episode, the policy reward of an update
+        is assigned to every episode of its batch.
+        :param run_episodes: rolls out the given epochs on the current policy, returns the episode buffer, episode
+        reward, episode length and tours as stop_ids of every epoch
+        :return: None
+        """
+        for first_epoch in range(0, self.num_episodes, self.episodes_per_update):
+            epochs = list(range(first_epoch, min(first_epoch + self.episodes_per_update, self.num_episodes)))
+            with timed('episode_rollout_batch'):
+                rollouts = run_episodes(epochs)
+
+            episodes = []
+            for epoch, (episode, episode_reward, episode_length, tours) in zip(epochs, rollouts):
+                episodes.append(episode)
+                increment('episode_steps', len(episode))
+                self.episode_statistics.episode_rewards[epoch] = episode_reward
+                self.episode_statistics.episode_lengths[epoch] = episode_length
+                self.episode_statistics.episode_tours[epoch] = [
+                    [self.env.stop_index.get_stop_by_index(stop_id) for stop_id in tour] for tour in tours]
+
+            returns, loseHistory, eps, policy_reward = self.policy_manager.policy_update_by_batch(
+                self.env,
+                episodes,
+                self.episode_statistics.episode_rewards[epochs],
+                self.gamma,
+                self.max_steps,
+                self.num_episodes,
+                epochs[-1])
+
+            # Update Meta information
+            for epoch, (G_t, J_avR) in zip(epochs, returns):
+                self.episode_statistics.episode_G_t[epoch] = sum(G_t)
+                self.episode_statistics.episode_J_avR[epoch] = J_avR
+                self.episode_statistics.episode_policy_reward[epoch] = policy_reward
+
+            self.eps = eps
+            self.env.reset()
+            logger.info("Episodes %d-%d/%d: mean episode reward %s, policy reward %s", epochs[0] + 1,
+                        epochs[-1] + 1, self.num_episodes,
+                        np.mean(self.episode_statistics.episode_rewards[epochs]), policy_reward)
 
+    def get_training_results(self) -> object:
+        """
+        :return: episode statistics, policy action space, best policy reward, worst policy reward, last policy reward
+        """
         best_policy_reward = min(self.episode_statistics.episode_policy_reward)
         worst_policy_reward = max(self.episode_statistics.episode_policy_reward)
         last_policy_reward = self.episode_statistics.episode_policy_reward[
@@ -95,8 +175,8 @@ class VRPAgent:
                worst_policy_reward, \
                last_policy_reward
 
-    def update(self, state: object, action: object, action_space_prob: object, reward: float, next_state: object, done: bool, possible_next_states: object,
-               possible_next_states_hub_ignored: object,
+    def update(self, state: object, action: object, action_space_prob: object, reward: float, next_state: object, done: bool,
+               possible_next_state_indices: object,
                possible_rewards: object, microhub_counter: int) -> object:
         """
         :param state: current state
@@ -105,34 +185,21 @@ class VRPAgent:
         :param reward: received reward
         :param next_state: following state
         :param done: done boolean
-        :param possible_next_states: list of possible next states
-        :param possible_next_states_hub_ignored: lost of possible next states without microhub counter
+        :param possible_next_state_indices: list of possible next state indices (microhub counter ignored)
         :param possible_rewards: list of possible alternative rewards
         :param microhub_counter: counter number specifying how often the tour constructor returned to the hub
-        :return: Transition
-        """
-        return self.episode.append(
-            self.Transition(
-                state=state,
-                action=action,
-                action_space_prob=action_space_prob,
-                reward=reward,
-                next_state=next_state,
-                done=done,
-                possible_next_states=possible_next_states,
-                possible_next_states_hub_ignored=possible_next_states_hub_ignored,
-                possible_rewards=possible_rewards,
-                microhub_counter=microhub_counter
-            )
-        )
+        :return: None
+        """
+        self.episode.add(state.stop_id, action, action_space_prob, reward, next_state.stop_id, done,
+                         possible_next_state_indices, possible_rewards, microhub_counter)
 
-    def get_possible_rewards_at_t(self, state: object, action_space_list: object) -> object:
+    def get_possible_rewards_at_t(self, state: object, action_space_indices: object) -> object:
         """
-        :param state: current state hash_id
-        :param action_space_list: list of possible next states hash_ids
-        :return: list of possible rewards
+        :param state: current state
+        :param action_space_indices: list of possible next state indices
+        :return: array of possible rewards
         """
-        return self.env.possible_rewards(state, action_space_list)
+        return self.env.possible_rewards(state, action_space_indices)
 
     def get_legal_action(self) -> object:
         """
@@ -145,10 +212,11 @@ class VRPAgent:
         """
         :param action: taken action
         :param action_space: given action space
-        :return: next state, reward, done, current tour, all tours
+        :return: next state, reward, done, current tour, tour ends (stop indices in the tour buffer of the environment)
         """
         return self.env.step(action, action_space)
 
+    @timed('episode_rollout')
     def run_episode(self, epoch: int) -> object:
         """
         :param epoch: current epoch count
@@ -157,16 +225,14 @@ class VRPAgent:
         # --------------------
         # PREPARE EPOCH RUN
         state = self.env.reset()
-        self.episode = []
+        self.episode.reset()
 
         for step_t in range(self.max_steps):
             # --------------------
             # LEGAL NEXT STATES
             # given by the environment
-            legal_next_action, legal_next_states, legal_next_states_hubs_ignored, legal_next_states_local_search_distance, legal_next_states_bin_packing_capacities, microhub_counter = self.get_legal_action()
-            possible_rewards = self.get_possible_rewards_at_t(state.hash_id,
-                                                              legal_next_states if legal_next_action == 1 else [
-                                                                  self.env.get_microhub_hash()])
+            legal_next_action, legal_next_states, legal_next_state_indices, legal_next_states_local_search_distance, legal_next_states_bin_packing_capacities, microhub_counter = self.get_legal_action()
+            possible_rewards = self.get_possible_rewards_at_t(state, legal_next_state_indices)
 
             # --------------------
             # CHOOSE ACTION SPACE
@@ -180,27 +246,87 @@ class VRPAgent:
             # --------------------
             # DO STEP IN ENVIRONMENT
             # follow policy
-            next_state, reward, done, current_tour, current_tours = self.observe_transition(legal_next_action,
-                                                                                          action_space)
+            next_state, reward, done, current_tour, tour_ends = self.observe_transition(legal_next_action,
+                                                                                      action_space)
 
             # --------------------
             # SAVE TRANSITION
-            self.update(state, legal_next_action, action_space_prob, reward, next_state, done, legal_next_states,
-                        legal_next_states_hubs_ignored,
+            self.update(state, legal_next_action, action_space_prob, reward, next_state, done,
+                        legal_next_state_indices,
                         possible_rewards, microhub_counter)
 
             # --------------------
             # UPDATE EPISODE STATISTICS
             self.episode_statistics.episode_rewards[epoch] += reward
             self.episode_statistics.episode_lengths[epoch] = step_t
-            self.episode_statistics.episode_tours[epoch] = current_tours
 
             # --------------------
             # PRINT EPOCH PROGRESS
-            print("Step {} @ Episode {}/{} ({})\n".format(
-                step_t, epoch + 1, self.num_episodes, self.episode_statistics.episode_rewards[epoch]), end="")
+            logger.debug("Step %d @ Episode %d/%d (%s)", step_t, epoch + 1, self.num_episodes,
+                         self.episode_statistics.episode_rewards[epoch])
 
             if done:
                 break
 
             state = next_state
+
+        self.episode_statistics.episode_tours[epoch] = self.env.get_all_tours()
+        increment('episode_steps', len(self.episode))
+
+    def run_episodes_vectorized(self, epochs: object) -> object:
+        """
+        Rolls out one episode per epoch in lockstep in a vectorized environment, every step of all episodes is
+        decided at once by the policy manager.
+        :param epochs: epochs to roll out
+        :return: episode buffer, episode reward, episode length and tours as stop_ids of every epoch, in epoch order
+        """
+        # --------------------
+        # PREPARE BATCH RUN
+        if self.vec_env is None or len(self.vec_env) != len(epochs):
+            self.vec_env = VRPVecEnvironment(self.env, len(epochs))
+        while len(self.vec_episodes) < len(epochs):
+            self.vec_episodes.append(EpisodeBuffer(self.max_steps, candidate_capacity=self.max_steps * 4))
+        episodes = self.vec_episodes[:len(epochs)]
+        for episode in episodes:
+            episode.reset()
+        states = self.vec_env.reset()
+        episode_rewards = np.zeros(len(epochs))
+        episode_lengths = np.zeros(len(epochs), dtype=np.int64)
+        policy = self.policy_manager.policy_action_space
+        state_columns = self.policy_manager.get_state_columns(0)
+
+        for step_t in range(self.max_steps):
+            # --------------------
+            # LEGAL NEXT STATES / ACTION SPACES
+            actions, legal_masks, microhub_counters = self.vec_env.get_next_legal_actions()
+            possible_rewards = self.vec_env.get_possible_rewards()
+            action_spaces, action_space_probs = self.policy_manager.get_action_spaces(policy, self.eps, self.vec_env,
+                                                                                      actions, legal_masks,
+                                                                                      microhub_counters, state_columns)
+
+            # --------------------
+            # DO STEP IN ENVIRONMENT
+            next_states, rewards, dones = self.vec_env.step(actions, action_spaces)
+
+            # --------------------
+            # SAVE TRANSITIONS
+            # legal next state indices in index order, microhub visits as microhub index
+            for index in np.flatnonzero(actions >= 0).tolist():
+                legal_next_state_indices = np.flatnonzero(legal_masks[index]) if actions[index] == 1 \
+                    else self.env.microhub_indices
+                episodes[index].add(states[index], actions[index], action_space_probs[index], rewards[index],
+                                    next_states[index], dones[index], legal_next_state_indices,
+                                    possible_rewards[index, legal_next_state_indices], microhub_counters[index])
+                episode_lengths[index] = step_t
+            episode_rewards += rewards
+
+            logger.debug("Step %d @ Episodes %d-%d/%d (%d running)", step_t, epochs[0] + 1, epochs[-1] + 1,
+                         self.num_episodes, int(np.count_nonzero(~dones)))
+
+            if dones.all():
+                break
+
+            states = next_states
+
+        return [(episode, episode_rewards[index], episode_lengths[index], self.vec_env.get_tour_stop_ids(index))
+                for index, episode in enumerate(episodes)]
@@ -0,0 +1,79 @@
+from typing import Dict, List, Tuple
+
+import numpy as np
+
+from src.Tour.StopIndex import StopIndex
+
+
+class DistanceMatrix:
+    def __init__(self,
+                 distances: np.ndarray,
+                 stop_index: StopIndex) -> None:
+
+        # --------------------
+        # DISTANCES
+        # dense (n x n)-array, row/column i belongs to the i-th stop of the tour manager (stop.stop_id)
+        self.distances = np.ascontiguousarray(distances, dtype=np.float64)
+
+        # --------------------
+        # HASH -> INDEX
+        # shared with the stop index, only used to translate hash_ids at the I/O boundary
+        self.hash_index = stop_index.hash_index
+
+        # --------------------
+        # ORDERINGS
+        # row index -> (stop indices sorted by distance, position of every stop in that ordering), built on first use
+        self.orderings: Dict[int, Tuple[np.ndarray, np.ndarray]] = dict()
+
+    def __len__(self) -> int:
+        return len(self.distances)
+
+    def get_index(self, hash_id: str) -> int:
+        """
+        :param hash_id: hash_id of given stop
+        :return: row/column index of the stop
+        """
+        return self.hash_index[hash_id]
+
+    def get_indices(self, hash_ids: List[str]) -> np.ndarray:
+        """
+        :param hash_ids: list of stop hash_ids
+        :return: array of row/column indices of the stops
+        """
+        return np.fromiter((self.hash_index[hash_id] for hash_id in hash_ids), dtype=np.intp, count=len(hash_ids))
+
+    def get_distance(self, index_a: int, index_b: int) -> float:
+        """
+        :param index_a: index of the point of departure
+        :param index_b: index of the final point
+        :return: distance between both stops
+        """
+        return self.distances[index_a, index_b]
+
+    def get_distances_from(self, index: int, indices: object) -> np.ndarray:
+        """
+        :param index: index of the point of departure
+        :param indices: indices of the final points
+        :return: array of distances between the point of departure and each final point
+        """
+        return self.distances[index, indices]
+
+    def get_distance_by_hash(self, hash_a: str, hash_b: str) -> float:
+        """
+        :param hash_a: hash_id of the point of departure
+        :param hash_b: hash_id of the final point
+        :return: distance between both stops
+        """
+        return self.distances[self.hash_index[hash_a], self.hash_index[hash_b]]
+
+    def get_ordering(self, index: int) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        :param index: index of the point of departure
+        :return: indices of all stops sorted by their distance (ties by index), position of every stop in it
+        """
+        if index not in self.orderings:
+            ordering = np.argsort(self.distances[index], kind='stable')
+            ranks = np.empty_like(ordering)
+            ranks[ordering] = np.arange(len(ordering))
+            self.orderings[index] = (ordering, ranks)
+        return self.orderings[index]
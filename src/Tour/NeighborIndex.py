@@ -0,0 +1,114 @@
+from typing import Dict, List, Tuple
+
+import numpy as np
+
+
+class NeighborIndex:
+    """
+    Uniform grid over the stop coordinates, projected equirectangularly to km around their mean latitude.
+    Every cell holds about STOPS_PER_CELL stops, a k-nearest-neighbor query searches the cells ring by ring around the
+    cell of the stop until no stop outside the searched rings can be nearer than the k-th neighbor found.
+    Built once per instance, the sorted neighbor lists are cached per k.
+    """
+
+    EARTH_RADIUS = 6373.0
+    STOPS_PER_CELL = 2
+
+    def __init__(self,
+                 latitudes: np.ndarray,
+                 longitudes: np.ndarray) -> None:
+
+        # --------------------
+        # PROJECTED COORDINATES
+        # (n x 2)-array of x/y in km, row i belongs to the i-th stop of the tour manager (stop.stop_id)
+        latitudes = np.radians(np.asarray(latitudes, dtype=np.float64))
+        longitudes = np.radians(np.asarray(longitudes, dtype=np.float64))
+        mean_latitude = latitudes.mean() if len(latitudes) else 0.0
+        self.points = np.column_stack((self.EARTH_RADIUS * longitudes * np.cos(mean_latitude),
+                                       self.EARTH_RADIUS * latitudes))
+
+        # --------------------
+        # GRID
+        # cell -> indices of the stops in the cell
+        self.origin = self.points.min(axis=0) if len(self.points) else np.zeros(2)
+        extent = self.points.max(axis=0) - self.origin if len(self.points) else np.zeros(2)
+        area = max(float(extent[0] * extent[1]), float(extent.max()) ** 2, 1e-12)
+        self.cell_size = max(np.sqrt(area * self.STOPS_PER_CELL / max(len(self.points), 1)), 1e-6)
+        cells = np.floor((self.points - self.origin) / self.cell_size).astype(np.int64)
+        self.grid_size = cells.max(axis=0) + 1 if len(cells) else np.ones(2, dtype=np.int64)
+        self.cells: Dict[Tuple[int, int], List[int]] = dict()
+        for index, (cell_x, cell_y) in enumerate(cells.tolist()):
+            self.cells.setdefault((cell_x, cell_y), []).append(index)
+        self.stop_cells = cells
+
+        # --------------------
+        # NEIGHBOR LISTS
+        # k -> (n x k)-array of the neighbor indices, nearest first
+        self.neighbor_lists: Dict[int, np.ndarray] = dict()
+
+    def __len__(self) -> int:
+        return len(self.points)
+
+    @classmethod
+    def from_stops(cls, stops: List[object]) -> object:
+        """
+        :param stops: stops in index order
+        :return: neighbor index over the coordinates of the stops
+        """
+        return cls(np.array([stop.latitude for stop in stops], dtype=float),
+                   np.array([stop.longitude for stop in stops], dtype=float))
+
+    def get_ring(self, cell: np.ndarray, ring: int) -> List[int]:
+        """
+        :param cell: cell of the query
+        :param ring: distance in cells (0 is the cell itself)
+        :return: indices of the stops in the cells of the ring
+        """
+        cell_x, cell_y = int(cell[0]), int(cell[1])
+        if ring == 0:
+            return list(self.cells.get((cell_x, cell_y), []))
+        ring_cells = [(cell_x + offset, cell_y + side) for offset in range(-ring, ring + 1) for side in (-ring, ring)]
+        ring_cells += [(cell_x + side, cell_y + offset) for offset in range(-ring + 1, ring) for side in (-ring, ring)]
+        indices = []
+        for ring_cell in ring_cells:
+            indices.extend(self.cells.get(ring_cell, []))
+        return indices
+
+    def query(self, index: int, k: int) -> np.ndarray:
+        """
+        :param index: index of the stop
+        :param k: amount of neighbors
+        :return: indices of the k nearest other stops, nearest first (ties by index)
+        """
+        k = min(k, len(self) - 1)
+        if k <= 0:
+            return np.zeros(0, dtype=np.intp)
+        cell = self.stop_cells[index]
+        max_ring = int(max(cell.max(), (self.grid_size - 1 - cell).max()))
+        candidates = []
+        for ring in range(max_ring + 1):
+            candidates.extend(self.get_ring(cell, ring))
+            if len(candidates) > k:
+                candidate_array = np.array(candidates, dtype=np.intp)
+                candidate_array = candidate_array[candidate_array != index]
+                distances = np.linalg.norm(self.points[candidate_array] - self.points[index], axis=1)
+                # stops outside the searched rings are at least ring cell sizes away
+                if np.partition(distances, k - 1)[k - 1] <= ring * self.cell_size:
+                    break
+        candidate_array = np.array(candidates, dtype=np.intp)
+        candidate_array = candidate_array[candidate_array != index]
+        distances = np.linalg.norm(self.points[candidate_array] - self.points[index], axis=1)
+        return candidate_array[np.lexsort((candidate_array, distances))[:k]]
+
+    def get_neighbors(self, k: int) -> np.ndarray:
+        """
+        :param k: amount of neighbors per stop
+        :return: (n x k)-array with the indices of the k nearest other stops of every stop, nearest first
+        """
+        k = max(min(k, len(self) - 1), 0)
+        if k not in self.neighbor_lists:
+            neighbors = np.zeros((len(self), k), dtype=np.intp)
+            for index in range(len(self)):
+                neighbors[index] = self.query(index, k)
+            self.neighbor_lists[k] = neighbors
+        return self.neighbor_lists[k]
@@ -0,0 +1,51 @@
+from typing import Dict, List, Optional
+
+from src.Tour.Stop import Stop
+
+
+class StopIndex:
+    def __init__(self,
+                 stops: List[Stop]) -> None:
+
+        # --------------------
+        # STOPS
+        self.stops = list(stops)
+
+        # --------------------
+        # HASH -> INDEX / HASH -> STOP
+        # built once at load, shared by the distance matrix, the environment and the ant colony
+        self.hash_index: Dict[str, int] = {stop.hash_id: index for index, stop in enumerate(self.stops)}
+        self.stop_by_hash: Dict[str, Stop] = {stop.hash_id: stop for stop in self.stops}
+
+    def __len__(self) -> int:
+        return len(self.stops)
+
+    def __contains__(self, hash_id: str) -> bool:
+        return hash_id in self.hash_index
+
+    def get_hash_ids(self) -> List[str]:
+        """
+        :return: all stop hash_ids in index order
+        """
+        return [stop.hash_id for stop in self.stops]
+
+    def get_stop_by_hash(self, hash_id: str) -> Optional[Stop]:
+        """
+        :param hash_id: hash_id of given stop
+        :return: stop by hash_id, None if unknown
+        """
+        return self.stop_by_hash.get(hash_id)
+
+    def get_index_by_hash(self, hash_id: str) -> int:
+        """
+        :param hash_id: hash_id of given stop
+        :return: index of the stop
+        """
+        return self.hash_index[hash_id]
+
+    def get_stop_by_index(self, index: int) -> Stop:
+        """
+        :param index: index of given stop
+        :return: stop by index
+        """
+        return self.stops[index]
@@ -1,29 +1,43 @@
 from typing import List
 
-import pandas as pd
+import numpy as np
 
+from src.Tour.DistanceMatrix import DistanceMatrix
+from src.Tour.NeighborIndex import NeighborIndex
 from src.Tour.Stop import Stop
-from src.Utils.helper import calculate_distance
+from src.Tour.StopIndex import StopIndex
+from src.Utils.helper import calculate_distance_matrix_by_coordinates
+from src.Utils.instrumentation import timed
 
 stops: List[Stop] = []
+stop_index = StopIndex(stops)
 
 
 def setup_distance_matrix():
-    df_new_distance_matrix = pd.DataFrame(index=[stop.hash_id for stop in stops],
-                                          columns=[stop.hash_id for stop in stops])
-    df_new_distance_matrix.fillna(value=0.0, inplace=True)
-    return df_new_distance_matrix
+    return DistanceMatrix(np.zeros((len(stops), len(stops)), dtype=np.float64), stop_index)
 
 
 distance_matrix = setup_distance_matrix()
+neighbor_index = NeighborIndex.from_stops(stops)
 capacity_demands = dict()
 
 
+def init_stop_index() -> None:
+    global stop_index
+    stop_index = StopIndex(stops)
+
+
+@timed('distance_matrix_build')
 def calculate_distance_matrix() -> None:
-    for stop_i in stops:
-        for stop_j in stops:
-            distance_i_j = calculate_distance(stop_i, stop_j)
-            distance_matrix.at[stop_i.hash_id, stop_j.hash_id] = distance_i_j
+    global distance_matrix
+    distances = calculate_distance_matrix_by_coordinates(np.array([stop.latitude for stop in stops], dtype=float),
+                                                         np.array([stop.longitude for stop in stops], dtype=float))
+    distance_matrix = DistanceMatrix(distances, stop_index)
+
+
+def init_neighbor_index() -> None:
+    global neighbor_index
+    neighbor_index = NeighborIndex.from_stops(stops)
 
 
 def init_capacity_demands() -> None:
@@ -31,9 +45,34 @@ def init_capacity_demands() -> None:
         capacity_demands[stop.hash_id] = [stop.demand_weight, stop.demand_volume]
 
 
+def get_stop_data():
+    """
+    :return: loaded stops, stop index, distance matrix, capacity demands and neighbor index, e.g. to load them again by
+    set_stop_data
+    """
+    return list(stops), stop_index, distance_matrix, dict(capacity_demands), neighbor_index
+
+
+def set_stop_data(stop_data) -> None:
+    """
+    Loads stop data returned by get_stop_data without parsing the stops and calculating the distance matrix again.
+    """
+    global distance_matrix, stop_index, neighbor_index
+    stops[:] = stop_data[0]
+    stop_index = stop_data[1]
+    distance_matrix = stop_data[2]
+    capacity_demands.clear()
+    capacity_demands.update(stop_data[3])
+    neighbor_index = stop_data[4]
+
+
 def clear():
+    global distance_matrix, stop_index, neighbor_index
     stops.clear()
-    distance_matrix.iloc[0:0]
+    capacity_demands.clear()
+    stop_index = StopIndex(stops)
+    distance_matrix = setup_distance_matrix()
+    neighbor_index = NeighborIndex.from_stops(stops)
 
 
 def add_stop(stop: Stop) -> None:
@@ -49,7 +88,11 @@ def get_list_of_stops():
 
 
 def get_stop_by_hash_id(id: float) -> Stop:
-    return [x for x in stops if x.hash_id == id]
+    return stop_index.get_stop_by_hash(id)
+
+
+def get_stop_index() -> StopIndex:
+    return stop_index
 
 
 def get_length_of_stops() -> int:
@@ -64,8 +107,16 @@ def get_distances():
     return distance_matrix
 
 
+def get_neighbor_index():
+    return neighbor_index
+
+
 def get_distance_by_matrix(hash_a: float, hash_b: float) -> float:
-    return distance_matrix.at[hash_a, hash_b].astype(float)
+    return distance_matrix.get_distance_by_hash(hash_a, hash_b)
+
+
+def get_distance_by_index(index_a: int, index_b: int) -> float:
+    return distance_matrix.get_distance(index_a, index_b)
 
 
 def get_capacity_demands_as_dict():
@@ -0,0 +1,134 @@
+import traceback
+from collections import deque
+from multiprocessing import Pipe, Process
+from multiprocessing.connection import wait
+from timeit import default_timer as timer
+from typing import Callable, List
+
+from src.Utils.logger import get_log_level, get_logger, setup_logging
+
+logger = get_logger('batch')
+
+
+def run_job_process(job_function, args, job, log_level, connection):
+    """
+    Runs one job in its own worker process and sends ('done', record) or ('failed', error) back.
+    """
+    setup_logging(log_level)
+    try:
+        connection.send(('done', job_function(args, job)))
+    except Exception as ex:
+        connection.send(('failed', '{!r}\n{}'.format(ex, traceback.format_exc())))
+    finally:
+        connection.close()
+
+
+class JobScheduler:
+    """
+    Runs independent jobs in worker processes, at most workers at the same time. Every job gets a process of its
+    own, so a job that raises, crashes or exceeds the timeout is terminated and recorded without affecting the
+    other jobs. Jobs with the same key (e.g. the model name) never run at the same time, since they would write the
+    same model.
+    """
+
+    POLL_INTERVAL = 0.5
+
+    def __init__(self,
+                 job_function: Callable,
+                 args: dict,
+                 workers: int,
+                 timeout: float = None,
+                 job_key: Callable = None) -> None:
+
+        # --------------------
+        # JOB
+        # job_function(args, job) returns the result record of a job and has to be importable by the workers
+        self.job_function = job_function
+        self.args = args
+        self.job_key = job_key
+
+        # --------------------
+        # LIMITS
+        self.workers = max(workers, 1)
+        self.timeout = timeout
+
+        # --------------------
+        # RUNNING JOBS
+        # job number -> (process, connection, start, key)
+        self.running = dict()
+
+    def run(self, jobs: List[dict], on_result: Callable) -> None:
+        """
+        Runs all jobs, on_result is called with the result record of every job as soon as it finished.
+        The record holds the job, its job_number, the status ('done', 'failed' or 'timeout') and its duration.
+        :param jobs: list of jobs
+        :param on_result: callback receiving the result records in order of completion
+        """
+        pending = deque(enumerate(jobs))
+        while pending or self.running:
+            self.start_jobs(pending)
+            wait([connection for _, connection, _, _ in self.running.values()], timeout=self.POLL_INTERVAL)
+            for job_number in list(self.running):
+                record = self.collect_job(job_number, jobs[job_number])
+                if record is not None:
+                    on_result(record)
+
+    def start_jobs(self, pending: deque) -> None:
+        """
+        Starts pending jobs until the worker limit is reached. Jobs whose key is running are postponed.
+        :param pending: queue of (job number, job)
+        """
+        running_keys = set(key for _, _, _, key in self.running.values())
+        postponed = deque()
+        while pending and len(self.running) < self.workers:
+            job_number, job = pending.popleft()
+            key = self.job_key(job) if self.job_key else None
+            if key is not None and key in running_keys:
+                postponed.append((job_number, job))
+                continue
+            receiver, sender = Pipe(duplex=False)
+            process = Process(target=run_job_process,
+                              args=(self.job_function, self.args, job, get_log_level(), sender),
+                              daemon=True)
+            process.start()
+            sender.close()
+            self.running[job_number] = (process, receiver, timer(), key)
+            running_keys.add(key)
+            logger.info('Started job %d (%d running)', job_number + 1, len(self.running))
+        pending.extendleft(reversed(postponed))
+
+    def collect_job(self, job_number: int, job: dict) -> object:
+        """
+        Checks a running job.
+        :param job_number: number of the job
+        :param job: job
+        :return: result record if the job finished, failed or timed out, None while it is still running
+        """
+        process, connection, start, _ = self.running[job_number]
+        duration = timer() - start
+        status, result = None, None
+        if connection.poll():
+            try:
+                status, result = connection.recv()
+            except EOFError:
+                status, result = 'failed', 'worker exited with code {}'.format(process.exitcode)
+        elif not process.is_alive():
+            status, result = 'failed', 'worker exited with code {}'.format(process.exitcode)
+        elif self.timeout is not None and duration > self.timeout:
+            process.terminate()
+            status, result = 'timeout', 'job exceeded the timeout of {}s'.format(self.timeout)
+        if status is None:
+            return None
+
+        process.join()
+        connection.close()
+        del self.running[job_number]
+
+        record = dict(result) if status == 'done' else dict(job)
+        if status != 'done':
+            record['error'] = result
+            logger.warning('Job %d %s: %s', job_number + 1, status, result)
+        record['job_number'] = job_number + 1
+        record['status'] = status
+        record['duration'] = duration
+        return record
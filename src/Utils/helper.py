@@ -46,6 +46,75 @@ def calculate_distance(startStop, endStop):
     return distance_approximation
 
 
+def calculate_distance_matrix_by_coordinates(latitudes, longitudes):
+    """
+    Calculates the distances between all given coordinates following the Haversine Formula.
+    Broadcasts the same operations as calculate_distance over the coordinate arrays in one pass.
+    ----------
+    Returns an (n x n)-array, where the entry [i, j] is the distance from coordinate i to coordinate j.
+    """
+    R = 6373.0
+    lat = np.radians(np.asarray(latitudes, dtype=float))
+    lon = np.radians(np.asarray(longitudes, dtype=float))
+
+    dlon = lon[np.newaxis, :] - lon[:, np.newaxis]
+    dlat = lat[np.newaxis, :] - lat[:, np.newaxis]
+
+    sin_dlat = np.sin(dlat / 2)
+    sin_dlon = np.sin(dlon / 2)
+    cos_lat = np.cos(lat)
+
+    a = sin_dlat * sin_dlat + sin_dlon * sin_dlon * cos_lat[:, np.newaxis] * cos_lat[np.newaxis, :]
+    c = 2 * np.arctan2(np.sqrt(a), np.sqrt(1 - a))
+    distance = R * c
+    distance_approximation = distance * np.sqrt(2)
+    return distance_approximation
+
+
+def calculate_discounted_returns(rewards, gamma, lengths=None, legacy_discounting=False):
+    """
+    Calculates the returns of one or more trajectories by a single reverse scan over the time steps.
+    rewards is either a 1d-array (one trajectory) or a (batch x T)-array, where shorter trajectories are padded and
+    their lengths are given by lengths.
+    By default G_t = R_t + gamma*R_{t+1} + gamma^2*R_{t+2} + .. + gamma^{T-t-1}*R_{T-1}.
+    With legacy_discounting every reward is discounted by gamma only once, G_t = gamma*(R_t + .. + R_{T-1}),
+    which are the returns older models were trained with.
+    ----------
+    Returns G_t, the normalized returns (G_t - J_avR) / std(G_t) and the average return J_avR, each per trajectory.
+    Padded steps are 0 in G_t and in the normalized returns.
+    """
+    rewards = np.asarray(rewards, dtype=float)
+    single_trajectory = rewards.ndim == 1
+    rewards = np.atleast_2d(rewards)
+    batch_size, max_length = rewards.shape
+
+    if lengths is None:
+        lengths = np.full(batch_size, max_length, dtype=np.intp)
+    lengths = np.asarray(lengths, dtype=np.intp)
+    valid = np.arange(max_length)[np.newaxis, :] < lengths[:, np.newaxis]
+    rewards = np.where(valid, rewards, 0.0)
+
+    if legacy_discounting:
+        G_t = gamma * np.cumsum(rewards[:, ::-1], axis=1)[:, ::-1]
+    else:
+        G_t = np.zeros_like(rewards)
+        running_return = np.zeros(batch_size)
+        for t in range(max_length - 1, -1, -1):
+            running_return = rewards[:, t] + gamma * running_return
+            G_t[:, t] = running_return
+
+    step_count = np.maximum(lengths, 1)
+    J_avR = G_t.sum(axis=1) / step_count
+    deviation = np.where(valid, G_t - J_avR[:, np.newaxis], 0.0)
+    std_deviation = np.sqrt((deviation * deviation).sum(axis=1) / step_count)
+    std_deviation[std_deviation <= 0] = 1
+    normalized_returns = deviation / std_deviation[:, np.newaxis]
+
+    if single_trajectory:
+        return G_t[0], normalized_returns[0], J_avR[0]
+    return G_t, normalized_returns, J_avR
+
+
 def normalize_list(probList):
     """
     Normalizes a given list, that way the sum of all values sum up to 1.
@@ -57,6 +126,16 @@ def normalize_list(probList):
     normRow = [float(i) / s for i in probList]
     return normRow
 
+def choose_in_rows(weights):
+    """
+    Draws one column of every row of a (rows x columns)-array, proportionally to the non-negative weights of the row.
+    Rows without positive weight draw the first column.
+    """
+    cumulative = np.cumsum(weights, axis=1)
+    thresholds = np.random.random(len(weights)) * cumulative[:, -1]
+    columns = (cumulative <= thresholds[:, None]).sum(axis=1)
+    return np.where(cumulative[:, -1] > 0, np.minimum(columns, weights.shape[1] - 1), 0)
+
 # Not being used.
 def normalize_df(df):
     for row in df:
@@ -76,7 +155,8 @@ def activation_by_softmax(X):
     along the specified axis.
     """
 
-    z = np.exp(np.array((X - max(X)), float))
+    X = np.asarray(X, dtype=float)
+    z = np.exp(X - np.max(X))
     y = np.sum(z)
 
     return z / y
@@ -0,0 +1,119 @@
+import json
+import os
+from contextlib import contextmanager
+from datetime import datetime
+from timeit import default_timer as timer
+
+import numpy as np
+
+# --------------------
+# MEASUREMENTS
+# timer name -> list of durations in s, counter name -> count
+# A block timed inside another timed block is recorded under the name of the outer timer as prefix (e.g.
+# 'policy_update/value_function'), so the totals of the unprefixed timers add up without double counting.
+timers = dict()
+counters = dict()
+
+REPORT_PERCENTILES = [50, 90, 99]
+
+
+@contextmanager
+def timed(name):
+    """
+    Times the enclosed block and records the duration under the given timer name, e.g.
+    with timed('policy_update'):
+        ...
+    Also usable as decorator (@timed('policy_update')) to time every call of a function.
+    """
+    start = timer()
+    try:
+        yield
+    finally:
+        add_duration(name, timer() - start)
+
+
+def add_duration(name, duration):
+    """
+    :param name: timer name
+    :param duration: measured duration in s
+    """
+    timers.setdefault(name, []).append(duration)
+
+
+def increment(name, amount=1):
+    """
+    :param name: counter name
+    :param amount: amount the counter is increased by
+    """
+    counters[name] = counters.get(name, 0) + amount
+
+
+def get_total(name):
+    """
+    :param name: timer name
+    :return: summed up durations of the timer in s, 0.0 if it never ran
+    """
+    return float(sum(timers.get(name, [])))
+
+
+def clear():
+    timers.clear()
+    counters.clear()
+
+
+def summarize_timer(durations):
+    """
+    :param durations: durations of one timer
+    :return: count, total, mean, min, max and percentiles of the durations
+    """
+    durations = np.asarray(durations, dtype=np.float64)
+    summary = {
+        'count': int(len(durations)),
+        'total': float(durations.sum()),
+        'mean': float(durations.mean()),
+        'min': float(durations.min()),
+        'max': float(durations.max()),
+    }
+    for percentile, value in zip(REPORT_PERCENTILES, np.percentile(durations, REPORT_PERCENTILES)):
+        summary['p{}'.format(percentile)] = float(value)
+    return summary
+
+
+def get_report(meta=None):
+    """
+    :param meta: additional information about the run (e.g. hub, data source, mode)
+    :return: report of all timers and counters
+    """
+    return {
+        'meta': dict(meta or {}),
+        'timers': {name: summarize_timer(durations) for name, durations in sorted(timers.items()) if durations},
+        'counters': dict(sorted(counters.items())),
+    }
+
+
+def export_report(report_name, meta=None, directory='data/statistics'):
+    """
+    Writes the report of the run as JSON. An existing report is never overwritten: the file is created exclusively
+    and gets a counter suffix if a report of the same name was written in the same microsecond (e.g. by a parallel
+    batch job of the same hub).
+    :param report_name: name of the report file (without .json), a timestamp is appended
+    :param meta: additional information about the run (e.g. hub, data source, mode)
+    :param directory: directory of the report
+    :return: path of the written report
+    """
+    created = datetime.now()
+    meta = dict(meta or {})
+    meta['created'] = created.isoformat(timespec='microseconds')
+    report_base = os.path.join(directory, '{}_{}'.format(report_name, created.strftime('%Y%m%d-%H%M%S-%f')))
+    file_path = report_base + '.json'
+    suffix = 1
+    while True:
+        try:
+            file = open(file_path, 'x')
+            break
+        except FileExistsError:
+            file_path = '{}_{}.json'.format(report_base, suffix)
+            suffix += 1
+    with file:
+        json.dump(get_report(meta), file, indent=2)
+    return file_path
@@ -0,0 +1,100 @@
+import csv
+import json
+import os
+from datetime import datetime
+
+# --------------------
+# JOB FIELDS
+# field, type, default (the defaults of the interactive menu)
+JOB_FIELDS = [
+    ('data_input', str, 'short_train_data'),
+    ('microhub_name', str, 'TestHub'),
+    ('shipper_name', str, 'TestVersender'),
+    ('carrier_name', str, 'TestCarrier'),
+    ('delivery_date', str, 'Test'),
+    ('amount_vehicles', int, 2),
+    ('vehicle_speed', int, 30),
+    ('capacity_weight', float, 180.0),
+    ('capacity_volume', float, 500.0),
+]
+
+
+def create_job(data_input, microhub_name, shipper_name, carrier_name, delivery_date, amount_vehicles, vehicle_speed,
+               capacity_weight, capacity_volume):
+    """
+    :return: job with the configuration of one run
+    """
+    return {
+        'data_input': data_input,
+        'microhub_name': microhub_name,
+        'shipper_name': shipper_name,
+        'carrier_name': carrier_name,
+        'delivery_date': delivery_date,
+        'amount_vehicles': amount_vehicles,
+        'vehicle_speed': vehicle_speed,
+        'capacity_weight': capacity_weight,
+        'capacity_volume': capacity_volume,
+    }
+
+
+def parse_job(raw_job):
+    """
+    Converts the fields of a job entry, missing or empty fields get the defaults of the interactive menu.
+    :param raw_job: job entry of a job file
+    :return: job
+    """
+    unknown_fields = set(raw_job) - set(field for field, _, _ in JOB_FIELDS)
+    if unknown_fields:
+        raise ValueError('Unknown job fields: {}'.format(', '.join(sorted(unknown_fields))))
+    job = dict()
+    for field, field_type, default in JOB_FIELDS:
+        value = raw_job.get(field)
+        job[field] = default if value is None or value == '' else field_type(value)
+    return create_job(**job)
+
+
+def load_jobs(file_path):
+    """
+    Loads the jobs of a job file. JSON files hold a list of jobs (or {"jobs": [...]}), CSV files one job per row with
+    the field names as header, YAML files (requires PyYAML) the same structure as JSON.
+    :param file_path: path of the job file (.json, .csv, .yaml or .yml)
+    :return: list of jobs
+    """
+    extension = os.path.splitext(file_path)[1].lower()
+    with open(file_path, 'r', newline='') as file:
+        if extension == '.csv':
+            raw_jobs = list(csv.DictReader(file))
+        elif extension == '.json':
+            raw_jobs = json.load(file)
+        elif extension in ('.yaml', '.yml'):
+            try:
+                import yaml
+            except ImportError:
+                raise ImportError('Reading YAML job files requires PyYAML (pip install pyyaml)')
+            raw_jobs = yaml.safe_load(file)
+        else:
+            raise ValueError('Unsupported job file format: {}'.format(extension))
+    if isinstance(raw_jobs, dict):
+        raw_jobs = raw_jobs.get('jobs', [])
+    return [parse_job(raw_job) for raw_job in raw_jobs]
+
+
+def create_job_results_name(job_file, directory='data/statistics'):
+    """
+    :param job_file: path of the job file
+    :param directory: directory of the result file
+    :return: path of the result file of a batch run
+    """
+    job_file_name = os.path.splitext(os.path.basename(job_file))[0]
+    return os.path.join(directory, 'batch_results_{}_{}.jsonl'.format(job_file_name,
+                                                                      datetime.now().strftime('%Y%m%d-%H%M%S')))
+
+
+def append_job_result(file_path, record):
+    """
+    Appends the result record of one job as JSON line.
+    :param file_path: path of the result file
+    :param record: result record
+    """
+    with open(file_path, 'a') as file:
+        file.write(json.dumps(record) + '\n')
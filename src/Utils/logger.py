@@ -0,0 +1,39 @@
+import logging
+import sys
+
+ROOT_LOGGER_NAME = 'vrp_ml'
+
+LOG_LEVELS = ['DEBUG', 'INFO', 'WARNING', 'ERROR']
+
+
+def get_logger(subsystem):
+    """
+    Returns the logger of a subsystem (e.g. 'aco', 'policy', 'agent').
+    Log calls should pass their values as arguments ("%s"-style) instead of formatting them, so messages below the
+    configured level cost no string formatting.
+    """
+    return logging.getLogger('{}.{}'.format(ROOT_LOGGER_NAME, subsystem))
+
+
+def setup_logging(level='INFO'):
+    """
+    Configures all subsystem loggers to write to stdout.
+    DEBUG traces every step, candidate and ant; INFO only summarizes every episode, ACO iteration and policy update.
+    ----------
+    Returns the root logger of the package.
+    """
+    root_logger = logging.getLogger(ROOT_LOGGER_NAME)
+    root_logger.setLevel(level)
+    if not root_logger.handlers:
+        handler = logging.StreamHandler(sys.stdout)
+        handler.setFormatter(logging.Formatter('%(message)s'))
+        root_logger.addHandler(handler)
+    root_logger.propagate = False
+    return root_logger
+
+
+def get_log_level():
+    """
+    Returns the effective level of the package loggers, e.g. to configure worker processes alike.
+    """
+    return logging.getLogger(ROOT_LOGGER_NAME).getEffectiveLevel()
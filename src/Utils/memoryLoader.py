@@ -1,49 +1,173 @@
 import pandas as pd
+import numpy as np
 import json
+import os
+from datetime import datetime
+
+from src.Utils.logger import get_logger
+
+logger = get_logger('memory')
+
+# --------------------
+# MODEL FORMAT
+# <model>.npy holds the float32 weight matrix, <model>.json the header with the row/column labels (hash index)
+# sparse top-k policies are saved as <model>.npz with the arrays of their stored cells instead of <model>.npy
+MODEL_FORMAT_VERSION = 1
 
 
 def load_memory_df_from_local(pickle_name, state_hashes, microhub_hash):
     try:
         df_pickle = pd.read_pickle(pickle_name)
-        print("Found Pickle with name: ", pickle_name)
+        logger.info("Found Pickle with name: %s", pickle_name)
         if df_pickle.empty:
-            print("Creating new Pickle file")
-            df_pickle = pd.DataFrame(index=state_hashes[1:], columns=state_hashes[1:])
-            new_row = pd.Series(name='{}/{}'.format(microhub_hash, 0))
-            df_pickle = df_pickle.append(new_row, ignore_index=False)
-            df_pickle['{}/{}'.format(microhub_hash, 0)] = 0.0
-            df_pickle.fillna(value=0.0, inplace=True)
-            df_pickle = df_pickle + (1 / len(state_hashes))
-            return df_pickle
+            logger.info("Creating new Pickle file")
+            return create_memory_df(state_hashes, microhub_hash)
         else:
-            for state in state_hashes:
-                if state == microhub_hash:
-                    state = '{}/{}'.format(microhub_hash, 0)
-                if state not in df_pickle.index:
-                    print("Filling up the pickle with missing hashIdentifiers")
-                    new_row = pd.Series(name=state)
-                    df_pickle = df_pickle.append(new_row, ignore_index=False)
-                    df_pickle.fillna(value=1 / len(state_hashes), inplace=True)
-                    df_pickle[state] = 1 / len(state_hashes)
-            df_pickle.fillna(value=float(0.0), inplace=True)
-            return df_pickle
+            return reconcile_memory_df(df_pickle, state_hashes, microhub_hash)
     except Exception as ex:
-        print('Exception occurred '+str(ex))
-        print("No Pickle file to load from")
-        print("Creating new Pickle file")
-        df_new_pickle = pd.DataFrame(index=state_hashes[1:], columns=state_hashes[1:])
-        new_row = pd.Series(name='{}/{}'.format(microhub_hash, 0))
-        df_new_pickle = df_new_pickle.append(new_row, ignore_index=False)
-        df_new_pickle['{}/{}'.format(microhub_hash, 0)] = 0.0
-        df_new_pickle.fillna(value=0.0, inplace=True)
-        df_new_pickle = df_new_pickle + (1 / len(state_hashes))
-        return df_new_pickle
+        logger.info('Exception occurred %s', ex)
+        logger.info("No Pickle file to load from")
+        logger.info("Creating new Pickle file")
+        return create_memory_df(state_hashes, microhub_hash)
+
+
+def reconcile_memory_df(df_pickle, state_hashes, microhub_hash):
+    """
+    Adds the states missing in the loaded DataFrame (the microhub as its first visit) in one reindex, their rows and
+    columns are filled with 1 / amount of states.
+    """
+    fill_value = 1 / len(state_hashes)
+    states = ['{}/{}'.format(microhub_hash, 0) if state == microhub_hash else state for state in state_hashes]
+    missing_states = [state for state in states if state not in df_pickle.index]
+    if missing_states:
+        logger.debug("Filling up the pickle with %d missing hashIdentifiers", len(missing_states))
+        df_pickle = df_pickle.fillna(value=fill_value)
+        df_pickle = df_pickle.reindex(index=list(df_pickle.index) + missing_states,
+                                      columns=list(df_pickle.columns) + [state for state in missing_states
+                                                                         if state not in df_pickle.columns],
+                                      fill_value=fill_value)
+        df_pickle[missing_states] = fill_value
+    return df_pickle.fillna(value=float(0.0))
+
+
+def create_memory_df(state_hashes, microhub_hash):
+    df_new_pickle = pd.DataFrame(index=state_hashes[1:], columns=state_hashes[1:])
+    new_row = pd.Series(name='{}/{}'.format(microhub_hash, 0))
+    df_new_pickle = df_new_pickle.append(new_row, ignore_index=False)
+    df_new_pickle['{}/{}'.format(microhub_hash, 0)] = 0.0
+    df_new_pickle.fillna(value=0.0, inplace=True)
+    df_new_pickle = df_new_pickle + (1 / len(state_hashes))
+    return df_new_pickle
 
 
 def save_memory_df_to_local(pickle_name, df_source):
     df_source.to_pickle(pickle_name)
 
 
+def model_exists(model_path):
+    """
+    :param model_path: path of the model without extension
+    :return: whether the model exists in the npy/json (or sparse npz/json) format
+    """
+    return os.path.exists(model_path + '.json') and (os.path.exists(model_path + '.npy') or
+                                                      os.path.exists(model_path + '.npz'))
+
+
+def create_model_header(labels, shape, microhub_hash, last_seen=None, meta=None, representation='dense', top_k=None):
+    """
+    :return: JSON header of a saved model
+    """
+    hub_slot_prefix = microhub_hash + '/'
+    header = {
+        'format_version': MODEL_FORMAT_VERSION,
+        'saved': datetime.now().isoformat(timespec='seconds'),
+        'representation': representation,
+        'dtype': 'float32',
+        'shape': list(shape),
+        'microhub_hash': microhub_hash,
+        'hub_slots': [label for label in labels if label.startswith(hub_slot_prefix)],
+        'labels': list(labels),
+        'last_seen': dict(last_seen or {}),
+        'meta': dict(meta or {}),
+    }
+    if top_k is not None:
+        header['top_k'] = int(top_k)
+    return header
+
+
+def write_model_files(model_path, extension, write_weights, header, stale_extension):
+    """
+    Writes the weights and the header to temporary files first and replaces the model files afterwards, the header
+    last, so an interrupted save never leaves a header pointing to incomplete weights. The weights of the other
+    representation (stale_extension) are removed afterwards.
+    """
+    with open(model_path + extension + '.tmp', 'wb') as file:
+        write_weights(file)
+    with open(model_path + '.json.tmp', 'w') as file:
+        json.dump(header, file)
+    os.replace(model_path + extension + '.tmp', model_path + extension)
+    os.replace(model_path + '.json.tmp', model_path + '.json')
+    if os.path.exists(model_path + stale_extension):
+        os.remove(model_path + stale_extension)
+
+
+def save_model_to_local(model_path, labels, weights, microhub_hash, last_seen=None, meta=None):
+    """
+    Saves a policy as float32 weight matrix (<model>.npy) and JSON header (<model>.json).
+    :param model_path: path of the model without extension
+    :param labels: row/column labels in index order, the microhub visit slots '{microhub_hash}/{counter}' included
+    :param weights: (labels x labels)-weight matrix
+    :param microhub_hash: hash_id of the microhub
+    :param last_seen: label -> ISO date the stop was last part of the stop data
+    :param meta: additional information stored in the header
+    """
+    header = create_model_header(labels, [len(labels), len(labels)], microhub_hash, last_seen, meta)
+    write_model_files(model_path, '.npy', lambda file: np.save(file, np.ascontiguousarray(weights, dtype=np.float32)),
+                      header, '.npz')
+
+
+def save_sparse_model_to_local(model_path, labels, arrays, microhub_hash, top_k, last_seen=None, meta=None):
+    """
+    Saves a sparse top-k policy as arrays of its stored cells and defaults (<model>.npz) and JSON header
+    (<model>.json).
+    :param model_path: path of the model without extension
+    :param labels: row/column labels in index order, the microhub visit slots '{microhub_hash}/{counter}' included
+    :param arrays: columns, values, row_lengths, row_defaults and column_defaults of the sparse policy
+    :param microhub_hash: hash_id of the microhub
+    :param top_k: amount of nearest stops per row
+    :param last_seen: label -> ISO date the stop was last part of the stop data
+    :param meta: additional information stored in the header
+    """
+    header = create_model_header(labels, arrays['columns'].shape, microhub_hash, last_seen, meta,
+                                 representation='sparse', top_k=top_k)
+    write_model_files(model_path, '.npz', lambda file: np.savez(file, **arrays), header, '.npy')
+
+
+def load_model_from_local(model_path):
+    """
+    Loads a policy saved by save_model_to_local or save_sparse_model_to_local. A dense weight matrix is memory
+    mapped, so only the pages which are read are loaded from disk.
+    :param model_path: path of the model without extension
+    :return: header, read-only weight matrix (dense) or dict of arrays (sparse)
+    """
+    with open(model_path + '.json', 'r') as file:
+        header = json.load(file)
+    if header.get('format_version') != MODEL_FORMAT_VERSION:
+        raise ValueError('Unsupported model format version {} of {}'.format(header.get('format_version'),
+                                                                           model_path))
+    if header.get('representation', 'dense') == 'sparse':
+        with np.load(model_path + '.npz') as sparse_file:
+            weights = {name: sparse_file[name] for name in sparse_file.files}
+        if list(weights['columns'].shape) != header['shape'] or len(weights['row_lengths']) != len(header['labels']):
+            raise ValueError('Sparse weights of {} do not match its header'.format(model_path))
+    else:
+        weights = np.load(model_path + '.npy', mmap_mode='r')
+        if list(weights.shape) != header['shape'] or weights.dtype != np.float32:
+            raise ValueError('Weight matrix of {} does not match its header'.format(model_path))
+    logger.info("Found model with name: %s", model_path)
+    return header, weights
+
+
 def create_model_name(microhub_name, capacity_weight, capacity_volume, shipper_name, carrier_name, delivery_date, ml_agent):
     return microhub_name + '_w_' + str(capacity_weight) + '_v_' + str(capacity_volume) + '_s_'+ shipper_name + '_c_' + carrier_name + '_d_' + delivery_date + '_a_' + str(ml_agent)
 
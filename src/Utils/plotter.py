@@ -9,6 +9,17 @@ plt.rcParams['legend.handlelength'] = 1
 plt.rcParams['legend.handleheight'] = 1.125
 
 
+def use_plot_backend(backend):
+    """
+    :param backend: matplotlib backend, e.g. 'Agg' to only save the plots without showing them
+    """
+    plt.switch_backend(backend)
+
+
+def close_plots():
+    plt.close('all')
+
+
 def plt_color(stop_id):
     cols = []
     for id in stop_id: